@@ -0,0 +1,402 @@
+"""API HTTP ligera para integraciones (LMS, scripts) sin Streamlit.
+
+Expone la misma detección de intención, las mismas plantillas y el mismo
+camino de la IA que el chat, sin volver a ejecutar ningún script por
+petición::
+
+    python api.py --puerto 8600
+
+Rutas (JSON de entrada y de salida):
+
+- ``GET /salud``
+- ``GET /metricas``: métricas del proceso en formato Prometheus.
+- ``POST /consulta``: ``{"mensaje", "contexto", "usar_ia", "previos", "stream",
+  "conversacion"}``. Con IA, solo se añaden fragmentos de los documentos
+  ingeridos para ``conversacion`` (ver ``documentos.py``). Con ``"stream": true`` la respuesta llega como eventos SSE (``consulta``,
+  ``cola``, ``fragmento`` y ``fin``, o ``error``).
+- ``POST /seccion``: ``{"seccion", "tema", "contexto", "usar_ia"}``.
+- ``POST /lote``: ``{"consultas": [...]}``; cada elemento es el cuerpo de una
+  consulta o, si lleva ``seccion``, de una sección. Los resultados vuelven en
+  el mismo orden, con ``error`` en los que fallaron.
+
+La API key de OpenAI se envía en la cabecera ``X-OpenAI-Key`` de cada
+petición y no se guarda. Si ``API_TOKEN`` está definido, todas las rutas salvo
+``/salud`` exigen ``Authorization: Bearer <API_TOKEN>``.
+
+Las plantillas se resuelven en el propio bucle de eventos (no esperan a nada
+y tardan microsegundos); las llamadas a la IA, que bloquean, van a un pool de
+``API_HILOS_IA`` hilos, así las conexiones que esperan a la IA no ocupan un
+hilo cada una.
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from contexto_conversacion import nuevo_estado, preparar_historial
+from generadores import generar_seccion_borrador, preparar_consulta, responder_consulta
+from limitador import EnCola
+from metricas import metricas
+from plantillas import PLANTILLAS
+from respuestas_ia import generar_respuesta_ia_stream
+
+HOST = os.environ.get("API_HOST", "127.0.0.1")
+PUERTO = int(os.environ.get("API_PUERTO", "8600"))
+TOKEN_API = os.environ.get("API_TOKEN")
+# Llamadas a la IA simultáneas por proceso (las demás esperan turno sin ocupar hilos)
+HILOS_IA = int(os.environ.get("API_HILOS_IA", "16"))
+MAX_LOTE = int(os.environ.get("API_LOTE_MAX", "100"))
+MAX_CUERPO = int(os.environ.get("API_CUERPO_MAX", str(1024 * 1024)))
+MAX_CABECERAS = 16 * 1024
+
+
+class ErrorHTTP(Exception):
+    """Error que se devuelve al cliente con el estado HTTP indicado"""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def campo_texto(datos, campo, obligatorio=False):
+    """Valor de texto de ``campo`` en el cuerpo de la petición"""
+    valor = datos.get(campo, "")
+    if not isinstance(valor, str):
+        raise ErrorHTTP(400, f"'{campo}' debe ser texto")
+    if obligatorio and not valor.strip():
+        raise ErrorHTTP(400, f"falta '{campo}'")
+    return valor
+
+
+def campo_previos(datos):
+    """Turnos anteriores de la conversación, ajustados al presupuesto de tokens del historial"""
+    previos = datos.get("previos") or []
+    if not isinstance(previos, list) or not all(
+        isinstance(turno, dict) and turno.get("role") in ("user", "assistant") and isinstance(turno.get("content"), str)
+        for turno in previos
+    ):
+        raise ErrorHTTP(400, "'previos' debe ser una lista de {\"role\": \"user\"|\"assistant\", \"content\": texto}")
+    return preparar_historial(previos, nuevo_estado()) if previos else None
+
+
+def resumen_fragmentos(fragmentos):
+    return [{"documento": documento, "similitud": round(similitud, 4)} for similitud, documento, _ in fragmentos]
+
+
+class ServidorAPI:
+    """Atiende las conexiones HTTP/1.1 (con keep-alive) en un bucle de asyncio"""
+
+    def __init__(self, hilos_ia=HILOS_IA, token=TOKEN_API):
+        self.token = token
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos_ia, thread_name_prefix="api-ia")
+        self.rutas = {
+            ("GET", "/salud"): self.salud,
+            ("GET", "/metricas"): self.exportar_metricas,
+            ("POST", "/consulta"): self.consulta,
+            ("POST", "/seccion"): self.seccion,
+            ("POST", "/lote"): self.lote,
+        }
+
+    async def en_hilo(self, funcion, *argumentos):
+        return await asyncio.get_running_loop().run_in_executor(self.ejecutor, functools.partial(funcion, *argumentos))
+
+    # Rutas: devuelven ``(estado, cuerpo)``; ``cuerpo`` es un dict (JSON) o texto plano
+    async def salud(self, datos, api_key):
+        return 200, {"estado": "ok"}
+
+    async def exportar_metricas(self, datos, api_key):
+        return 200, metricas.exportar_prometheus()
+
+    async def consulta(self, datos, api_key):
+        mensaje = campo_texto(datos, "mensaje", obligatorio=True)
+        contexto = campo_texto(datos, "contexto")
+        conversacion = campo_texto(datos, "conversacion")
+        previos = campo_previos(datos)
+        inicio = time.perf_counter()
+        if datos.get("usar_ia"):
+            def responder():
+                consulta = preparar_consulta(mensaje, contexto, True, conversacion)
+                return consulta, responder_consulta(mensaje, consulta.contexto, True, api_key, previos)
+            consulta, respuesta = await self.en_hilo(responder)
+        else:
+            consulta = preparar_consulta(mensaje, contexto)
+            respuesta = responder_consulta(mensaje, contexto, analisis=consulta.analisis)
+        return 200, {
+            "tipo": consulta.analisis.tipo,
+            "tema": consulta.analisis.tema,
+            "respuesta": respuesta,
+            "fragmentos": resumen_fragmentos(consulta.fragmentos),
+            "ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+
+    async def seccion(self, datos, api_key):
+        seccion = campo_texto(datos, "seccion", obligatorio=True)
+        if seccion not in PLANTILLAS:
+            raise ErrorHTTP(400, f"sección desconocida: {seccion!r} (use {', '.join(PLANTILLAS)})")
+        tema = campo_texto(datos, "tema", obligatorio=True)
+        contexto = campo_texto(datos, "contexto")
+        inicio = time.perf_counter()
+        if datos.get("usar_ia"):
+            respuesta = await self.en_hilo(generar_seccion_borrador, seccion, tema, contexto, True, api_key)
+        else:
+            respuesta = generar_seccion_borrador(seccion, tema, contexto)
+        return 200, {
+            "seccion": seccion,
+            "tema": tema,
+            "respuesta": respuesta,
+            "ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+
+    async def lote(self, datos, api_key):
+        consultas = datos.get("consultas")
+        if not isinstance(consultas, list) or not consultas:
+            raise ErrorHTTP(400, "'consultas' debe ser una lista no vacía")
+        if len(consultas) > MAX_LOTE:
+            raise ErrorHTTP(413, f"como máximo {MAX_LOTE} consultas por lote")
+
+        async def resolver(elemento):
+            try:
+                if not isinstance(elemento, dict):
+                    raise ErrorHTTP(400, "cada consulta debe ser un objeto JSON")
+                ruta = self.seccion if "seccion" in elemento else self.consulta
+                return (await ruta(elemento, api_key))[1]
+            except ErrorHTTP as e:
+                return {"error": str(e)}
+            except Exception as e:
+                metricas.incrementar("errores_total", origen="api_lote", tipo=type(e).__name__)
+                return {"error": f"{type(e).__name__}: {e}"}
+
+        # Las de plantilla terminan al momento; las de IA se ejecutan a la vez en el pool
+        return 200, {"resultados": await asyncio.gather(*(resolver(elemento) for elemento in consultas))}
+
+    async def consulta_stream(self, datos, api_key, escritor):
+        """Respuesta de ``/consulta`` como eventos SSE a medida que la IA la genera"""
+        mensaje = campo_texto(datos, "mensaje", obligatorio=True)
+        contexto = campo_texto(datos, "contexto")
+        conversacion = campo_texto(datos, "conversacion")
+        previos = campo_previos(datos)
+        usar_ia = bool(datos.get("usar_ia"))
+        inicio = time.perf_counter()
+        consulta = await self.en_hilo(preparar_consulta, mensaje, contexto, usar_ia, conversacion)
+
+        escritor.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        await enviar_evento(escritor, "consulta", {
+            "tipo": consulta.analisis.tipo,
+            "tema": consulta.analisis.tema,
+            "fragmentos": resumen_fragmentos(consulta.fragmentos),
+        })
+        caracteres = 0
+        try:
+            if usar_ia:
+                fragmentos = generar_respuesta_ia_stream(mensaje, consulta.contexto, api_key, previos, avisar_cola=True)
+                async with contextlib.aclosing(iterar_en_hilo(fragmentos, self.ejecutor)) as eventos:
+                    async for fragmento in eventos:
+                        if isinstance(fragmento, EnCola):
+                            await enviar_evento(escritor, "cola", {"posicion": fragmento.posicion,
+                                                                   "segundos": round(fragmento.segundos, 1)})
+                            continue
+                        caracteres += len(fragmento)
+                        await enviar_evento(escritor, "fragmento", {"texto": fragmento})
+            else:
+                respuesta = responder_consulta(mensaje, contexto, analisis=consulta.analisis)
+                caracteres = len(respuesta)
+                await enviar_evento(escritor, "fragmento", {"texto": respuesta})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            # Las cabeceras ya se enviaron: el error va como un evento más
+            metricas.incrementar("errores_total", origen="api_stream", tipo=type(e).__name__)
+            await enviar_evento(escritor, "error", {"error": f"{type(e).__name__}: {e}"})
+            return
+        await enviar_evento(escritor, "fin", {
+            "caracteres": caracteres, "ms": round((time.perf_counter() - inicio) * 1000, 2)
+        })
+
+    async def atender(self, lector, escritor):
+        """Atiende las peticiones de una conexión hasta que el cliente la cierra"""
+        try:
+            while True:
+                try:
+                    peticion = await leer_peticion(lector)
+                except ErrorHTTP as e:
+                    await responder(escritor, e.estado, {"error": str(e)}, mantener=False)
+                    return
+                if peticion is None:
+                    return
+                if not await self.despachar(*peticion, escritor):
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def despachar(self, metodo, ruta, cabeceras, cuerpo, mantener, escritor):
+        """Resuelve una petición; devuelve si la conexión sigue abierta"""
+        inicio = time.perf_counter()
+        ruta = ruta.split("?", 1)[0]
+        estado = 500
+        try:
+            manejador = self.rutas.get((metodo, ruta))
+            if manejador is None:
+                if any(ruta == ruta_conocida for _, ruta_conocida in self.rutas):
+                    raise ErrorHTTP(405, f"método {metodo} no admitido en {ruta}")
+                raise ErrorHTTP(404, f"ruta desconocida: {ruta}")
+            if self.token and ruta != "/salud" and not hmac.compare_digest(
+                cabeceras.get("authorization", ""), f"Bearer {self.token}"
+            ):
+                raise ErrorHTTP(401, "falta el token de la API o no es válido")
+            try:
+                datos = json.loads(cuerpo) if cuerpo else {}
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise ErrorHTTP(400, "el cuerpo no es JSON válido")
+            if not isinstance(datos, dict):
+                raise ErrorHTTP(400, "el cuerpo debe ser un objeto JSON")
+            api_key = cabeceras.get("x-openai-key") or None
+            if ruta == "/consulta" and datos.get("stream"):
+                estado = 200
+                await self.consulta_stream(datos, api_key, escritor)
+                return False
+            estado, respuesta = await manejador(datos, api_key)
+        except ErrorHTTP as e:
+            estado, respuesta = e.estado, {"error": str(e)}
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            metricas.incrementar("errores_total", origen="api", tipo=type(e).__name__)
+            estado, respuesta = 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            # Solo las rutas conocidas tienen serie propia: las que envía cada cliente no acotan la memoria
+            conocida = any(ruta == ruta_conocida for _, ruta_conocida in self.rutas)
+            metricas.incrementar("api_peticiones_total", ruta=ruta if conocida else "desconocida", estado=str(estado))
+            if conocida:
+                metricas.observar(f"api_{ruta.strip('/')}", time.perf_counter() - inicio)
+        await responder(escritor, estado, respuesta, mantener)
+        return mantener
+
+    async def servir(self, host=HOST, puerto=PUERTO, al_iniciar=None):
+        """Escucha en ``host:puerto`` hasta que se cancele; ``al_iniciar(puerto)`` recibe el puerto real"""
+        servidor = await asyncio.start_server(self.atender, host, puerto, limit=MAX_CABECERAS)
+        async with servidor:
+            if al_iniciar:
+                al_iniciar(servidor.sockets[0].getsockname()[1])
+            await servidor.serve_forever()
+
+
+async def leer_peticion(lector):
+    """Lee una petición: ``(metodo, ruta, cabeceras, cuerpo, mantener)`` o None si el cliente cerró"""
+    try:
+        cabecera = await lector.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ErrorHTTP(400, "petición incompleta")
+        return None
+    except asyncio.LimitOverrunError:
+        raise ErrorHTTP(431, "cabeceras demasiado grandes")
+    lineas = cabecera.decode("latin-1").split("\r\n")
+    try:
+        metodo, ruta, version = lineas[0].split(" ")
+    except ValueError:
+        raise ErrorHTTP(400, "línea de petición no válida")
+    cabeceras = {}
+    for linea in lineas[1:]:
+        nombre, separador, valor = linea.partition(":")
+        if separador:
+            cabeceras[nombre.strip().lower()] = valor.strip()
+    if "chunked" in cabeceras.get("transfer-encoding", "").lower():
+        raise ErrorHTTP(411, "envíe el cuerpo con Content-Length")
+    try:
+        longitud = int(cabeceras.get("content-length", "0"))
+    except ValueError:
+        raise ErrorHTTP(400, "Content-Length no válido")
+    if longitud < 0:
+        raise ErrorHTTP(400, "Content-Length no válido")
+    if longitud > MAX_CUERPO:
+        raise ErrorHTTP(413, f"el cuerpo supera {MAX_CUERPO} bytes")
+    cuerpo = await lector.readexactly(longitud) if longitud else b""
+    conexion = cabeceras.get("connection", "").lower()
+    mantener = conexion != "close" if version == "HTTP/1.1" else conexion == "keep-alive"
+    return metodo, ruta, cabeceras, cuerpo, mantener
+
+
+async def responder(escritor, estado, cuerpo, mantener=True):
+    """Escribe una respuesta completa: JSON si ``cuerpo`` es un dict, texto plano si es una cadena"""
+    if isinstance(cuerpo, str):
+        datos, tipo = cuerpo.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        datos, tipo = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+    escritor.write(
+        f"HTTP/1.1 {estado} {HTTPStatus(estado).phrase}\r\nContent-Type: {tipo}\r\n"
+        f"Content-Length: {len(datos)}\r\nConnection: {'keep-alive' if mantener else 'close'}\r\n\r\n".encode("latin-1")
+        + datos
+    )
+    await escritor.drain()
+
+
+async def enviar_evento(escritor, evento, datos):
+    escritor.write(f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n".encode("utf-8"))
+    await escritor.drain()
+
+
+async def iterar_en_hilo(generador, ejecutor):
+    """Recorre un generador bloqueante en ``ejecutor`` y entrega sus elementos al bucle de eventos.
+
+    Si quien itera deja de hacerlo (p. ej. el cliente se desconectó), el
+    generador se cierra en cuanto produce el siguiente elemento."""
+    bucle = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    terminado = object()
+    cancelado = threading.Event()
+
+    def recorrer():
+        try:
+            for elemento in generador:
+                if cancelado.is_set():
+                    break
+                bucle.call_soon_threadsafe(cola.put_nowait, elemento)
+        finally:
+            generador.close()
+            bucle.call_soon_threadsafe(cola.put_nowait, terminado)
+
+    tarea = bucle.run_in_executor(ejecutor, recorrer)
+    try:
+        while (elemento := await cola.get()) is not terminado:
+            yield elemento
+        await tarea
+    finally:
+        cancelado.set()
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="API HTTP del asistente de investigación (sin Streamlit)")
+    parser.add_argument("--host", default=HOST, help=f"Interfaz en la que escuchar (por defecto {HOST})")
+    parser.add_argument("--puerto", type=int, default=PUERTO, help=f"Puerto (por defecto {PUERTO})")
+    parser.add_argument("--hilos-ia", type=int, default=HILOS_IA,
+                        help="Llamadas a la IA simultáneas (las plantillas no usan hilos)")
+    args = parser.parse_args(argumentos)
+    if args.hilos_ia < 1:
+        parser.error("--hilos-ia debe ser al menos 1")
+
+    servidor = ServidorAPI(hilos_ia=args.hilos_ia)
+    try:
+        asyncio.run(servidor.servir(
+            args.host, args.puerto,
+            al_iniciar=lambda puerto: print(f"API escuchando en http://{args.host}:{puerto}", file=sys.stderr)
+        ))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
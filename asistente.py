@@ -1,7 +1,26 @@
 import streamlit as st
-import re
-import openai
 import os
+import time
+
+from cache_respuestas import obtener_cache
+from componentes import (
+    abrir_conversacion,
+    enviar_trabajo_borrador,
+    generar_seccion_rapida,
+    inicializar_estado,
+    mostrar_historial_chat,
+    mostrar_trabajos,
+    preparar_especulacion,
+    procesar_consulta_usuario,
+    recurso_estatico
+)
+from generadores import generar_borrador
+from historial import exportar_markdown, nueva_conversacion, obtener_almacen
+from limitador import limitador_ia
+from metricas import metricas
+from plantillas import PLANTILLAS, secciones as secciones_registradas
+from resiliencia import circuito_ia
+from trabajos import obtener_gestor
 
 # Configuración de página
 st.set_page_config(
@@ -10,333 +29,12 @@ st.set_page_config(
     layout="wide"
 )
 
-# CSS personalizado
-st.markdown("""
-<style>
-.main-header {
-    text-align: center;
-    padding: 25px;
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    color: white;
-    border-radius: 15px;
-    margin-bottom: 25px;
-}
-.chat-container {
-    background: #f8f9fa;
-    padding: 20px;
-    border-radius: 10px;
-    margin: 10px 0;
-}
-.user-message {
-    background: #e3f2fd;
-    padding: 15px;
-    border-radius: 10px;
-    margin: 5px 0;
-}
-.assistant-message {
-    background: white;
-    padding: 15px;
-    border-radius: 10px;
-    margin: 5px 0;
-    border-left: 4px solid #667eea;
-}
-.feature-card {
-    background: #f8f9fa;
-    padding: 20px;
-    border-radius: 10px;
-    border-left: 4px solid #667eea;
-    margin: 10px 0;
-}
-.ia-feature {
-    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-    color: white;
-    padding: 20px;
-    border-radius: 10px;
-    margin: 10px 0;
-}
-</style>
-""", unsafe_allow_html=True)
-
-# Header principal
-st.markdown("""
-<div class="main-header">
-    <h1>🔬 Asistente de Investigación Académica Inteligente</h1>
-    <p style="margin: 0; font-size: 1.2em;">Herramienta con IA para el desarrollo de proyectos de investigación</p>
-    <p style="margin: 10px 0 0 0; font-size: 1em;">🤖 Con tecnología GPT-4 | ✅ Sistema funcionando correctamente</p>
-</div>
-""", unsafe_allow_html=True)
-
-# Definición de prompt base para el asistente IA
-PROMPT_BASE = """
-Eres un agente de IA experto en investigación académica. 
-- Asistes a investigadores y estudiantes de posgrado.
-- Tus respuestas son detalladas, fundamentadas y precisas.
-- Puedes sugerir artículos, sintentizar teorías, proponer referencias bibliográficas (en formato APA o UPEL), y explicar conceptos complejos.
-- Especifica fuentes reales cuando sugieras bibliografía, indica si la referencia es simulada o real.
-- Utiliza lenguaje profesional y académico, en español.
-
-Consulta o instrucción del usuario:
-"""
-
-# Función para generar la respuesta del agente IA
-def generar_respuesta_ia(mensaje_usuario, contexto=""):
-    prompt_completo = PROMPT_BASE + mensaje_usuario
-    if contexto:
-        prompt_completo += f"\n\nContexto adicional: {contexto}"
-    
-    try:
-        # Nota: Necesitarás configurar tu API key de OpenAI
-        # openai.api_key = st.secrets["OPENAI_API_KEY"]
-        
-        respuesta = openai.ChatCompletion.create(
-            model="gpt-4",  # Puedes cambiar a "gpt-3.5-turbo" si prefieres
-            messages=[
-                {"role": "system", "content": PROMPT_BASE},
-                {"role": "user", "content": mensaje_usuario}
-            ],
-            max_tokens=1500,
-            temperature=0.7
-        )
-        return respuesta['choices'][0]['message']['content']
-    except Exception as e:
-        return f"""🤖 **Respuesta del Asistente IA:**
-
-Parece que hay un problema con la conexión a la API de OpenAI. Error: {str(e)}
-
-**Mientras tanto, aquí tienes una guía general:**
-
-Para consultas sobre '{mensaje_usuario}', te recomiendo:
-
-📚 **Fuentes académicas sugeridas:**
-- Google Scholar para búsqueda de artículos científicos
-- Scopus y Web of Science para literatura especializada
-- ScienceDirect y JSTOR para acceso a textos completos
-
-🔍 **Enfoque de investigación recomendado:**
-1. Realiza una revisión sistemática de literatura
-2. Identifica los autores más citados en el área
-3. Analiza las metodologías predominantes
-4. Establece tu marco teórico y conceptual
-
-💡 **Próximos pasos:**
-- Define claramente tu pregunta de investigación
-- Selecciona la metodología apropiada
-- Establece tus criterios de inclusión/exclusión
-- Planifica tu estrategia de búsqueda bibliográfica
-
-*Para usar la funcionalidad completa de IA, necesitarás configurar una API key de OpenAI.*"""
+# CSS personalizado y header principal (leídos de estaticos/ una sola vez por proceso)
+st.markdown(f"<style>\n{recurso_estatico('estilos.css')}</style>", unsafe_allow_html=True)
+st.markdown(recurso_estatico("cabecera.html"), unsafe_allow_html=True)
 
 # Inicializar session state
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
-if 'contexto_actual' not in st.session_state:
-    st.session_state.contexto_actual = ""
-if 'modo_ia' not in st.session_state:
-    st.session_state.modo_ia = False
-
-# Funciones de procesamiento de lenguaje
-def extraer_tema_principal(user_input):
-    """Extrae el tema real de investigación del input del usuario"""
-    try:
-        # Patrón para detectar preguntas de investigación
-        patron_pregunta = r'[¿]?(qué|cuáles|cómo|por qué|dónde|cuándo)\s+([^?]+)[?]'
-        coincidencia = re.search(patron_pregunta, user_input.lower())
-        
-        if coincidencia:
-            return coincidencia.group(2).strip()
-        
-        # Eliminar palabras de solicitud metodológica
-        palabras_excluir = ['formula', 'planteamiento', 'problema', 'interrogante', 
-                           'redacta', 'elabora', 'desarrolla', 'haz', 'crea', 'genera',
-                           'para la', 'sobre', 'acerca de', 'necesito', 'quiero', 'dame']
-        
-        tema = user_input.lower()
-        for palabra in palabras_excluir:
-            tema = tema.replace(palabra, '')
-        
-        # Limpiar espacios extras y caracteres especiales
-        tema = re.sub(r'[^\w\s]', '', tema)
-        tema = ' '.join(tema.split())
-        
-        return tema.strip() if tema.strip() else user_input
-    except Exception:
-        return user_input
-
-def detectar_tipo_solicitud(user_input):
-    """Detecta el tipo de solicitud del usuario"""
-    input_lower = user_input.lower()
-    
-    if any(palabra in input_lower for palabra in ['planteamiento', 'problema', 'pregunta investigación']):
-        return "planteamiento"
-    elif any(palabra in input_lower for palabra in ['objetivos', 'metas', 'propósitos']):
-        return "objetivos"
-    elif any(palabra in input_lower for palabra in ['metodología', 'método', 'diseño', 'enfoque']):
-        return "metodologia"
-    elif any(palabra in input_lower for palabra in ['variables', 'operacional']):
-        return "variables"
-    else:
-        return "general"
-
-# Funciones de generación de contenido MEJORADAS
-def generar_planteamiento_estructurado(tema, contexto=""):
-    """Genera un planteamiento del problema bien estructurado con excelente redacción"""
-    
-    planteamiento = f"""
-# 🎯 PLANTEAMIENTO DEL PROBLEMA: {tema.title()}
-
-## 📝 DESCRIPCIÓN DEL PROBLEMA
-
-En el contexto actual caracterizado por la rápida evolución tecnológica y las transformaciones sociales, se ha identificado una problemática significativa en el ámbito de **{tema}**. La disyunción existente entre las demandas emergentes y las capacidades actuales genera consecuencias relevantes que merecen atención investigativa.
-
-## 🔍 JUSTIFICACIÓN DE LA INVESTIGACIÓN
-
-El estudio de {tema} se justifica por las siguientes consideraciones fundamentales:
-
-1. **Relevancia contemporánea**: Constituye un tema de actualidad en el marco de los procesos de transformación digital y social.
-2. **Impacto multidimensional**: Sus efectos repercuten en diversos ámbitos: social, económico, educativo y organizacional.
-3. **Vacío en la literatura**: Existe una necesidad evidente de investigaciones actualizadas que aborden esta temática desde perspectivas innovadoras.
-4. **Aplicabilidad práctica**: Los hallazgos pueden traducirse en estrategias concretas y soluciones aplicables.
-
-## 📌 DELIMITACIÓN DEL ESTUDIO
-
-Esta investigación se circunscribirá a:
-- **Ámbito temático**: Aspectos específicos relacionados con {tema}
-- **Contexto de aplicación**: {contexto if contexto else "entornos diversos y representativos"}
-- **Enfoque metodológico**: Análisis integral seguido de propuestas de mejora
-
-## ❓ PREGUNTAS DE INVESTIGACIÓN
-
-1. ¿Cuáles son los factores determinantes que influyen significativamente en {tema}?
-2. ¿Qué impacto observable genera {tema} en los diferentes contextos de aplicación?
-3. ¿Qué estrategias y metodologías demostrarían mayor efectividad para optimizar los resultados asociados a {tema}?
-4. ¿Qué brechas de conocimiento y oportunidades de desarrollo futuro pueden identificarse en este campo de estudio?
-
-*Contexto específico considerado: {contexto if contexto else "ámbito general de aplicación"}*
-"""
-    return planteamiento
-
-def generar_objetivos_estructurados(tema, contexto=""):
-    """Genera objetivos de investigación estructurados con redacción académica"""
-    contexto_texto = contexto if contexto else "diversos escenarios y contextos de aplicación"
-    
-    objetivos = f"""
-# 🎯 OBJETIVOS DE INVESTIGACIÓN: {tema.title()}
-
-## 🎯 OBJETIVO GENERAL
-
-Analizar sistemáticamente los aspectos fundamentales de **{tema}** en el contexto de **{contexto_texto}**, con el propósito de formular estrategias de mejora, innovación y optimización que contribuyan al avance del conocimiento y la práctica en este campo de estudio.
-
-## 📋 OBJETIVOS ESPECÍFICOS
-
-1. **Identificar y caracterizar** los componentes, dimensiones y variables clave asociados con {tema}, estableciendo un marco conceptual robusto que facilite su comprensión integral.
-
-2. **Diagnosticar el estado actual** de {tema} mediante el análisis exhaustivo de tendencias, prácticas predominantes y desafíos identificados tanto en la literatura especializada como en contextos reales de aplicación.
-
-3. **Evaluar el impacto** de {tema} en diferentes ámbitos (social, económico, educativo, organizacional), considerando variables contextuales y características poblacionales específicas.
-
-4. **Diseñar y proponer** estrategias, metodologías o herramientas innovadoras para la optimización de {tema}, fundamentadas en evidencia empírica y mejores prácticas identificadas.
-
-5. **Validar la aplicabilidad** de las propuestas formuladas mediante criterios de factibilidad, sostenibilidad y alineamiento con necesidades identificadas en el contexto de {contexto_texto}.
-"""
-    return objetivos
-
-# Función principal del chat MEJORADA con IA
-def procesar_consulta_usuario(user_input, contexto="", usar_ia=False):
-    """Procesa la consulta del usuario y genera respuesta con excelente redacción"""
-    try:
-        # Extraer tema y tipo de solicitud
-        tema_real = extraer_tema_principal(user_input)
-        tipo_solicitud = detectar_tipo_solicitud(user_input)
-        
-        # Mostrar información de contexto
-        st.info(f"🔍 **Tema detectado:** {tema_real}")
-        if contexto:
-            st.info(f"🎯 **Contexto considerado:** {contexto}")
-        if usar_ia:
-            st.success("🤖 **Modo IA activado** - Generando respuesta con inteligencia artificial")
-        
-        # Si el modo IA está activado, usar la función de IA
-        if usar_ia:
-            with st.spinner("🤖 Consultando con IA..."):
-                respuesta = generar_respuesta_ia(user_input, contexto)
-                return respuesta
-        
-        # Si no, usar las funciones predefinidas
-        if tipo_solicitud == "planteamiento":
-            respuesta = generar_planteamiento_estructurado(tema_real, contexto)
-        elif tipo_solicitud == "objetivos":
-            respuesta = generar_objetivos_estructurados(tema_real, contexto)
-        elif tipo_solicitud == "metodologia":
-            respuesta = f"""
-## 🎓 SUGERENCIAS METODOLÓGICAS PARA: {tema_real.title()}
-
-### **ENFOQUE METODOLÓGICO RECOMENDADO**
-**Investigación Mixta de Diseño Secuencial Explicativo** - Combina métodos cuantitativos y cualitativos para un análisis comprehensivo.
-
-### **DISEÑO DE INVESTIGACIÓN**
-- **Tipo**: Secuencial explicativo
-- **Fase 1**: Análisis cuantitativo (encuestas, datos secundarios)
-- **Fase 2**: Profundización cualitativa (entrevistas, estudios de caso)
-
-### **TÉCNICAS DE RECOLECCIÓN**
-- 📊 Encuestas con escalas Likert validadas
-- 🎤 Entrevistas semiestructuradas
-- 📑 Análisis documental sistemático
-- 👥 Grupos focales para triangulación
-
-*Contexto: {contexto if contexto else "diversos escenarios de aplicación"}*
-"""
-        elif tipo_solicitud == "variables":
-            respuesta = f"""
-## 🔬 VARIABLES DE INVESTIGACIÓN PARA: {tema_real.title()}
-
-### **VARIABLES INDEPENDIENTES**
-- Factores influyentes en {tema_real}
-- Estrategias implementadas
-- Características contextuales
-
-### **VARIABLES DEPENDIENTES**
-- Resultados observables
-- Impacto medible
-- Efectividad de intervenciones
-
-### **VARIABLES DE CONTROL**
-- Contexto específico
-- Características poblacionales
-- Recursos disponibles
-
-*Contexto: {contexto}*
-"""
-        else:
-            respuesta = f"""
-## 💡 ASESORÍA ESPECIALIZADA EN INVESTIGACIÓN: {tema_real.title()}
-
-He analizado su consulta sobre **"{tema_real}"** y puedo ofrecerle orientación en:
-
-### 🎯 **ENFOQUES RECOMENDADOS:**
-- **Investigación exploratoria**: Para caracterizar el fenómeno
-- **Investigación explicativa**: Para identificar relaciones causales
-- **Investigación aplicada**: Para desarrollar soluciones prácticas
-
-### 📊 **ASPECTOS CLAVE:**
-- Definición clara del problema de investigación
-- Establecimiento de preguntas guía
-- Selección de metodología apropiada
-- Operacionalización de variables
-
-### 🔍 **PRÓXIMOS PASOS:**
-1. Búsqueda bibliográfica especializada
-2. Delimitación del marco teórico-conceptual
-3. Formulación de hipótesis o preguntas
-4. Diseño metodológico detallado
-
-**¿Le gustaría que profundice en algún aspecto específico?**
-"""
-        
-        return respuesta
-        
-    except Exception as e:
-        return f"❌ Se ha producido un error en el procesamiento: {str(e)}"
+inicializar_estado()
 
 # Interfaz principal con pestañas
 tab1, tab2, tab3 = st.tabs(["🏠 Inicio", "🔍 Búsqueda Rápida", "💬 Chat Inteligente"])
@@ -346,59 +44,13 @@ with tab1:
     
     col1, col2 = st.columns([2, 1])
     
+    # Tarjetas de la portada en un solo bloque HTML por columna
     with col1:
-        st.markdown("""
-        <div class="ia-feature">
-        <h4>🤖 ASISTENTE CON INTELIGENCIA ARTIFICIAL</h4>
-        <p>Ahora potenciado con GPT-4 para respuestas más inteligentes, contextualizadas y fundamentadas académicamente.</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div class="feature-card">
-        <h4>💬 Chatbot Inteligente con Procesamiento de Lenguaje Natural</h4>
-        <p>Sistema avanzado de comprensión lingüística para interpretar sus solicitudes de investigación y generar respuestas contextualizadas y académicamente rigurosas.</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div class="feature-card">
-        <h4>🎯 Generación de Elementos de Investigación Académica</h4>
-        <p>Elaboración automática de planteamientos de problema, objetivos de investigación, metodologías y variables operativas con redacción académica profesional.</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div class="feature-card">
-        <h4>📚 Asesoría Metodológica Especializada</h4>
-        <p>Orientación experta en diseño de investigación, selección de métodos y técnicas de análisis adecuadas para cada tipo de estudio.</p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(recurso_estatico("inicio_funciones.html"), unsafe_allow_html=True)
     
     with col2:
         st.markdown("### 🎯 Cómo utilizar el sistema:")
-        
-        st.markdown("""
-        <div style="background: #e8f4fd; padding: 15px; border-radius: 10px; margin: 10px 0;">
-        <h4>1. 💬 Acceder al Chat Inteligente</h4>
-        <p>Diríjase a la pestaña "Chat Inteligente"</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div style="background: #e8f4fd; padding: 15px; border-radius: 10px; margin: 10px 0;">
-        <h4>2. 🤖 Activar el modo IA (Opcional)</h4>
-        <p>Active el interruptor para respuestas con inteligencia artificial</p>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown("""
-        <div style="background: #e8f4fd; padding: 15px; border-radius: 10px; margin: 10px 0;">
-        <h4>3. 🎯 Formular su consulta</h4>
-        <p>Ejemplo:<br>
-        <em>"Analice las tendencias actuales en educación virtual"</em></p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(recurso_estatico("inicio_pasos.html"), unsafe_allow_html=True)
         
         st.markdown("### 💡 Ejemplos de consultas con IA:")
         st.code("""
@@ -433,59 +85,63 @@ with tab2:
     
     st.markdown("---")
     
+    # En modo IA (activado en la pestaña de chat) las secciones se generan con la IA
+    usar_ia_rapida = st.session_state.modo_ia
+    if usar_ia_rapida:
+        st.success("🤖 Modo IA activado - Las secciones se generarán con inteligencia artificial")
+    
+    # Opcional: con IA, las secciones más pedidas se generan mientras se decide qué pulsar
+    especular = st.toggle(
+        "🔮 Pregenerar secciones en segundo plano", value=False, disabled=not usar_ia_rapida,
+        help="Genera las secciones con IA cuando el tema deja de cambiar; consume tokens aunque no se usen"
+    )
+    preparar_especulacion(tema_consulta, contexto_consulta, especular and usar_ia_rapida)
+    
     # Botones de generación rápida
     col_btn1, col_btn2, col_btn3, col_btn4 = st.columns(4)
     
     with col_btn1:
         if st.button("🧩 Generar Planteamiento", use_container_width=True):
             with st.spinner("Generando planteamiento del problema..."):
-                respuesta = generar_planteamiento_estructurado(tema_consulta, contexto_consulta)
-                st.markdown(respuesta)
+                st.markdown(generar_seccion_rapida("planteamiento", tema_consulta, contexto_consulta, usar_ia_rapida))
     
     with col_btn2:
         if st.button("🎯 Generar Objetivos", use_container_width=True):
             with st.spinner("Generando objetivos de investigación..."):
-                respuesta = generar_objetivos_estructurados(tema_consulta, contexto_consulta)
-                st.markdown(respuesta)
+                st.markdown(generar_seccion_rapida("objetivos", tema_consulta, contexto_consulta, usar_ia_rapida))
     
     with col_btn3:
         if st.button("🔬 Generar Metodología", use_container_width=True):
             with st.spinner("Generando sugerencias metodológicas..."):
-                respuesta = f"""
-## 🎓 SUGERENCIAS METODOLÓGICAS PARA: {tema_consulta.title()}
-
-### **ENFOQUE RECOMENDADO**
-Investigación mixta con diseño secuencial explicativo.
-
-### **TÉCNICAS DE RECOLECCIÓN**
-- Encuestas cuantitativas
-- Entrevistas cualitativas
-- Análisis documental
-- Observación sistemática
-
-*Contexto: {contexto_consulta}*
-"""
-                st.markdown(respuesta)
+                st.markdown(generar_seccion_rapida("metodologia", tema_consulta, contexto_consulta, usar_ia_rapida))
     
     with col_btn4:
         if st.button("📊 Generar Variables", use_container_width=True):
             with st.spinner("Generando variables de investigación..."):
-                respuesta = f"""
-## 🔬 VARIABLES PARA: {tema_consulta.title()}
-
-### **VARIABLES INDEPENDIENTES**
-- Factores contextuales
-- Estrategias implementadas
-- Recursos disponibles
-
-### **VARIABLES DEPENDIENTES**
-- Resultados observables
-- Impacto medible
-- Efectividad
-
-*Contexto: {contexto_consulta}*
-"""
-                st.markdown(respuesta)
+                st.markdown(generar_seccion_rapida("variables", tema_consulta, contexto_consulta, usar_ia_rapida))
+    
+    # Generación de todas las secciones a la vez: cada una aparece en cuanto termina
+    if st.button("⚡ Generar todo", use_container_width=True, type="primary"):
+        inicio_borrador = time.perf_counter()
+        for seccion in secciones_registradas():
+            st.session_state.especulador.usar(seccion, tema_consulta, contexto_consulta)
+        marcadores = {}
+        for seccion in secciones_registradas():
+            with st.container():
+                marcadores[seccion] = (st.empty(), st.empty())
+                marcadores[seccion][0].info(f"⏳ Generando {PLANTILLAS[seccion]['titulo'].lower()}...")
+        
+        for seccion, texto, segundos in generar_borrador(tema_consulta, contexto_consulta, usar_ia=usar_ia_rapida,
+                                                         api_key=st.session_state.openai_api_key):
+            marcador_texto, marcador_tiempo = marcadores[seccion]
+            marcador_texto.markdown(texto)
+            marcador_tiempo.caption(f"⏱️ {PLANTILLAS[seccion]['titulo']}: {segundos:.2f} s")
+        
+        st.success(f"✅ Borrador completo en {time.perf_counter() - inicio_borrador:.2f} s")
+    
+    # El borrador se prepara en segundo plano y se puede seguir usando la app mientras tanto
+    if st.button("🧵 Generar todo en segundo plano", use_container_width=True):
+        enviar_trabajo_borrador(tema_consulta, contexto_consulta, usar_ia_rapida)
 
 with tab3:
     st.markdown("## 💬 Chat Inteligente con IA")
@@ -504,13 +160,39 @@ with tab3:
         # Interruptor para modo IA
         modo_ia = st.toggle("🤖 Activar modo IA", value=False)
         st.session_state.modo_ia = modo_ia
+        
+        # Interruptor para mostrar la respuesta de la IA en tiempo real
+        modo_stream = st.toggle("⚡ Respuesta en tiempo real", value=True, disabled=not modo_ia)
+        st.session_state.modo_stream = modo_stream
+        
+        # Interruptor para encolar las consultas a la IA y seguir trabajando mientras se generan
+        segundo_plano = st.toggle("🧵 IA en segundo plano", value=False, disabled=not modo_ia)
+        st.session_state.segundo_plano = segundo_plano
     
     # Botón para limpiar chat
     col_clear, col_stats = st.columns([1, 3])
     with col_clear:
         if st.button("🔄 Limpiar Conversación", use_container_width=True):
-            st.session_state.chat_history = []
+            # La conversación anterior sigue guardada; la sesión pasa a una nueva
+            abrir_conversacion(nueva_conversacion())
             st.rerun()
+        
+        # La exportación se lee del disco solo cuando se pide, no en cada rerun
+        if st.session_state.chat_history:
+            if "exportacion" in st.session_state:
+                st.download_button(
+                    "⬇️ Descargar conversación",
+                    st.session_state.exportacion,
+                    f"conversacion-{st.session_state.chat_history.conversacion}.md",
+                    "text/markdown",
+                    on_click=lambda: st.session_state.pop("exportacion", None),
+                    use_container_width=True
+                )
+            elif st.button("📥 Exportar conversación", use_container_width=True):
+                st.session_state.exportacion = "".join(
+                    exportar_markdown(obtener_almacen(), st.session_state.chat_history.conversacion)
+                )
+                st.rerun()
     
     with col_stats:
         if st.session_state.chat_history:
@@ -520,22 +202,10 @@ with tab3:
     
     st.markdown("---")
     
-    # Mostrar historial del chat
-    for mensaje in st.session_state.chat_history:
-        if mensaje["role"] == "user":
-            st.markdown(f"""
-            <div class="user-message">
-                <strong>👤 Usted:</strong><br>
-                {mensaje["content"]}
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="assistant-message">
-                <strong>🔬 Asistente:</strong><br>
-                {mensaje["content"]}
-            </div>
-            """, unsafe_allow_html=True)
+    # Mostrar historial del chat (solo la página más reciente), con las respuestas de
+    # los trabajos en segundo plano que hayan terminado desde el último rerun
+    st.session_state.chat_history.sincronizar()
+    mostrar_historial_chat()
     
     # Ejemplos rápidos para probar
     st.markdown("### 💡 Ejemplos para probar:")
@@ -575,22 +245,131 @@ with tab3:
         
         # Generar y mostrar respuesta
         with st.chat_message("assistant"):
-            with st.spinner("🤔 Analizando su consulta..."):
-                respuesta = procesar_consulta_usuario(prompt, contexto_chat, st.session_state.modo_ia)
-                st.markdown(respuesta)
+            if st.session_state.modo_ia and st.session_state.segundo_plano:
+                # Si la conversación no admite más trabajos se responde aquí mismo en streaming
+                respuesta = procesar_consulta_usuario(prompt, contexto_chat, True, stream=True, segundo_plano=True)
+            elif st.session_state.modo_ia and st.session_state.modo_stream:
+                # Los tokens se van mostrando a medida que llegan
+                respuesta = procesar_consulta_usuario(prompt, contexto_chat, True, stream=True)
+            else:
+                with st.spinner("🤔 Analizando su consulta..."):
+                    respuesta = procesar_consulta_usuario(prompt, contexto_chat, st.session_state.modo_ia)
+                    with metricas.cronometrar("render_markdown"):
+                        st.markdown(respuesta)
         
-        # Agregar respuesta al historial
-        st.session_state.chat_history.append({"role": "assistant", "content": respuesta})
+        # Agregar respuesta al historial (la de un trabajo en segundo plano la añade el trabajo)
+        if respuesta is not None:
+            st.session_state.chat_history.append({"role": "assistant", "content": respuesta})
 
 # Configuración de API Key (sección colapsada)
 with st.sidebar.expander("🔧 Configuración de API OpenAI"):
     st.info("Para usar el modo IA, necesitas configurar tu API key de OpenAI")
     api_key = st.text_input("API Key de OpenAI:", type="password")
+    # La clave se guarda solo en la sesión del usuario, nunca a nivel de proceso
+    st.session_state.openai_api_key = api_key or None
     if api_key:
-        openai.api_key = api_key
         st.success("✅ API Key configurada correctamente")
     else:
         st.warning("⚠️ Ingresa tu API Key para activar el modo IA completo")
+    
+    # Estado de la caché de respuestas compartida
+    estadisticas_cache = obtener_cache().estadisticas()
+    st.caption(
+        f"🗄️ Caché: {estadisticas_cache['entradas']} respuestas | "
+        f"{estadisticas_cache['aciertos']} aciertos / {estadisticas_cache['fallos']} fallos "
+        f"({estadisticas_cache['tasa_aciertos']:.0%})"
+    )
+
+# Trabajos en segundo plano de la conversación (visibles desde cualquier pestaña)
+with st.sidebar:
+    mostrar_trabajos()
+
+# Diagnóstico de rendimiento (métricas agregadas de todos los procesos que comparten el estado)
+with st.sidebar.expander("📈 Diagnóstico de rendimiento"):
+    vista_metricas = metricas.combinadas()
+    resumen_metricas = vista_metricas.resumen()
+    if resumen_metricas["etapas"]:
+        st.markdown("**Latencia por etapa (ms)**")
+        st.dataframe(
+            [
+                {"etapa": etapa, "n": datos["mediciones"], "p50": round(datos["p50_ms"], 2),
+                 "p95": round(datos["p95_ms"], 2), "p99": round(datos["p99_ms"], 2)}
+                for etapa, datos in sorted(resumen_metricas["etapas"].items())
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.caption("Todavía no hay mediciones")
+    
+    col_m1, col_m2 = st.columns(2)
+    col_m1.metric("Tokens IA", f"{vista_metricas.valor('ia_tokens_total'):,.0f}")
+    col_m2.metric("Coste IA (USD)", f"{vista_metricas.valor('ia_coste_usd_total'):.4f}")
+    col_m3, col_m4 = st.columns(2)
+    col_m3.metric("Respaldos", f"{vista_metricas.valor('respuestas_respaldo_total'):.0f}")
+    col_m4.metric("Errores", f"{vista_metricas.valor('errores_total'):.0f}")
+    st.caption(
+        f"Caché IA: {vista_metricas.valor('cache_ia_total', resultado='acierto'):.0f} aciertos / "
+        f"{vista_metricas.valor('cache_ia_total', resultado='fallo'):.0f} fallos | "
+        f"Coalescidas: {vista_metricas.valor('ia_coalescidas_total'):.0f}"
+    )
+    estado_circuito = circuito_ia.resumen()
+    if estado_circuito["estado"] == "cerrado":
+        st.caption(f"🟢 Circuito IA cerrado | Reintentos: {vista_metricas.valor('ia_reintentos_total'):.0f}")
+    else:
+        st.caption(
+            f"🔴 Circuito IA {estado_circuito['estado']} (reintento en "
+            f"{estado_circuito['segundos_para_reintentar']:.0f} s) | "
+            f"Reintentos: {vista_metricas.valor('ia_reintentos_total'):.0f}"
+        )
+    st.caption(
+        f"⏳ Cola IA: {limitador_ia.en_espera()} en espera | "
+        f"Rechazadas: {vista_metricas.valor('ia_cola_rechazos_total') + vista_metricas.valor('ia_cola_plazos_agotados_total'):.0f}"
+    )
+    st.caption(
+        f"🧵 Trabajos: {obtener_gestor().en_curso()} en curso en este proceso | "
+        f"{vista_metricas.valor('trabajos_total'):.0f} enviados"
+    )
+    st.caption(
+        f"🔮 Pregeneración: {vista_metricas.valor('especulacion_total', resultado='aprovechada'):.0f} aprovechadas / "
+        f"{vista_metricas.valor('especulacion_total', resultado='desperdiciada'):.0f} desperdiciadas "
+        f"({vista_metricas.valor('especulacion_tokens_total', uso='desperdiciados'):,.0f} tokens) | "
+        f"{vista_metricas.valor('especulacion_total', resultado='cancelada'):.0f} canceladas"
+    )
+    prompts = vista_metricas.valor('prompts_total')
+    if prompts:
+        st.caption(
+            f"📏 Prompt medio: {vista_metricas.valor('prompt_tokens_total') / prompts:,.0f} tokens estimados "
+            f"({vista_metricas.valor('prompt_tokens_prefijo_total') / max(1, vista_metricas.valor('prompt_tokens_total')):.0%} prefijo estable) | "
+            f"En caché del proveedor: {vista_metricas.valor('ia_tokens_prompt_en_cache_total'):,.0f} tokens | "
+            f"Recortes: {vista_metricas.valor('prompt_recortes_total'):.0f} | "
+            f"Cerca del límite: {vista_metricas.valor('prompt_avisos_total'):.0f}"
+        )
+    
+    # Llamadas, coste y latencia por ruta del enrutamiento por intención
+    rutas_ia = {}
+    for contador in resumen_metricas["contadores"]:
+        ruta = contador["etiquetas"].get("ruta")
+        if ruta and contador["nombre"] in ("ia_llamadas_total", "ia_coste_usd_total"):
+            fila = rutas_ia.setdefault(ruta, {
+                "ruta": ruta, "modelo": contador["etiquetas"]["modelo"], "llamadas": 0, "coste_usd": 0.0,
+                "p50_ms": round(resumen_metricas["etapas"].get(f"ia_ruta_{ruta}", {}).get("p50_ms", 0.0), 1)
+            })
+            clave = "llamadas" if contador["nombre"] == "ia_llamadas_total" else "coste_usd"
+            fila[clave] += contador["valor"]
+    if rutas_ia:
+        st.markdown("**Rutas de IA**")
+        st.dataframe(list(rutas_ia.values()), hide_index=True, use_container_width=True)
+    
+    col_exp1, col_exp2 = st.columns(2)
+    col_exp1.download_button("⬇️ Prometheus", vista_metricas.exportar_prometheus(), "metricas.prom", "text/plain")
+    col_exp2.download_button("⬇️ JSON", vista_metricas.exportar_json(), "metricas.json", "application/json")
+    
+    # Exportación a archivo para que la recojan los paneles de operaciones
+    ruta_metricas = os.environ.get("METRICAS_RUTA")
+    if ruta_metricas:
+        vista_metricas.exportar_a_archivo(ruta_metricas)
+        st.caption(f"Métricas exportadas en `{ruta_metricas}`")
 
 # Footer
 st.markdown("---")
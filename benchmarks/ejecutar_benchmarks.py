@@ -0,0 +1,398 @@
+"""Benchmarks reproducibles de las rutas críticas del asistente, sin red.
+
+Mide la extracción de tema, la detección de intención, cada plantilla, el
+despacho completo de una consulta, la búsqueda en el índice bibliográfico
+sobre un catálogo sintético, el modo IA contra el servidor simulado de
+``servidor_simulado.py`` (también con varios procesos que comparten el backend
+de estado), la API HTTP de ``api.py`` y el arranque en frío y los reruns de la app de
+Streamlit. Escribe percentiles de latencia y rendimiento en JSON
+para poder comparar entre commits::
+
+    python benchmarks/ejecutar_benchmarks.py
+    python benchmarks/ejecutar_benchmarks.py --salida nuevo.json --comparar benchmarks/resultados/abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CONSULTAS = [
+    "Formule el planteamiento del problema sobre competencias digitales para la empleabilidad en la era digital",
+    "Genere objetivos de investigación sobre la implementación de inteligencia artificial en instituciones educativas",
+    "Sugiera una metodología para investigar el impacto de las redes sociales en el aprendizaje de adolescentes",
+    "Identifique las variables para estudiar el sobrepeso infantil en escuelas públicas",
+    "¿Cuáles son los factores que influyen en la deserción universitaria?",
+    "Analice las tendencias actuales en educación virtual y sugiera referencias bibliográficas recientes en formato APA"
+]
+
+
+def resumir_tiempos(nombre, tiempos, duracion_total=None):
+    """Percentiles (en milisegundos) y rendimiento de una serie de mediciones"""
+    cortes = statistics.quantiles(tiempos, n=100, method="inclusive") if len(tiempos) > 1 else tiempos * 99
+    duracion_total = duracion_total if duracion_total is not None else sum(tiempos)
+    return {
+        "nombre": nombre,
+        "repeticiones": len(tiempos),
+        "media_ms": statistics.fmean(tiempos) * 1000,
+        "p50_ms": cortes[49] * 1000,
+        "p95_ms": cortes[94] * 1000,
+        "p99_ms": cortes[98] * 1000,
+        "max_ms": max(tiempos) * 1000,
+        "por_segundo": len(tiempos) / duracion_total if duracion_total else None
+    }
+
+
+def medir(nombre, funcion, repeticiones, calentamiento=3):
+    """Ejecuta ``funcion(i)`` ``repeticiones`` veces y devuelve su resumen"""
+    for i in range(calentamiento):
+        funcion(-1 - i)
+    tiempos = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append(time.perf_counter() - inicio)
+    return resumir_tiempos(nombre, tiempos)
+
+
+def medir_concurrente(nombre, funcion, repeticiones, concurrencia):
+    """Igual que ``medir`` pero con ``concurrencia`` hilos; el rendimiento usa el tiempo de pared"""
+    def cronometrar(i):
+        inicio = time.perf_counter()
+        funcion(i)
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        tiempos = list(pool.map(cronometrar, range(repeticiones)))
+    return resumir_tiempos(nombre, tiempos, time.perf_counter() - inicio)
+
+
+def escribir_catalogo_sintetico(ruta, registros, semilla=1):
+    """Catálogo RIS con títulos de vocabulario Zipf, parecido en distribución a uno real"""
+    import itertools
+    import random
+    aleatorio = random.Random(semilla)
+    palabras = [f"termino{i}" for i in range(20000)] + " ".join(CONSULTAS).lower().split()
+    acumulados = list(itertools.accumulate(1 / (i + 1) for i in range(len(palabras))))
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        for i in range(registros):
+            titulo = " ".join(aleatorio.choices(palabras, cum_weights=acumulados, k=9))
+            archivo.write(f"TY  - JOUR\nAU  - Autor{i % 5000}, Nombre\nTI  - {titulo}\n"
+                          f"JO  - Revista {i % 300}\nPY  - {1990 + i % 35}\nER  - \n")
+
+
+def benchmarks_bibliografia(registros, repeticiones):
+    """Indexación y búsqueda BM25 sobre un catálogo sintético de ``registros`` referencias"""
+    from bibliografia import IndiceBibliografico, indexar
+    from generadores import extraer_tema_principal
+
+    ruta_indice = os.environ["BIBLIOGRAFIA_INDICE"]
+    fuentes = os.path.join(os.path.dirname(ruta_indice), "fuentes")
+    os.makedirs(fuentes, exist_ok=True)
+    escribir_catalogo_sintetico(os.path.join(fuentes, "catalogo.ris"), registros)
+    inicio = time.perf_counter()
+    indexar([fuentes], ruta_indice)
+    print(f"Índice bibliográfico de {registros} registros construido en {time.perf_counter() - inicio:.1f} s")
+    indice = IndiceBibliografico(ruta_indice)
+    temas = [extraer_tema_principal(consulta) for consulta in CONSULTAS]
+    return [medir("bibliografia_bm25", lambda i: indice.buscar(temas[i % len(temas)]), repeticiones)]
+
+
+def benchmarks_locales(repeticiones):
+    """Rutas que no dependen de la IA"""
+    from generadores import detectar_tipo_solicitud, extraer_tema_principal, generar_seccion, responder_consulta
+    from plantillas import renderizar_plantilla, secciones
+
+    resultados = [
+        medir("extraer_tema_principal", lambda i: extraer_tema_principal(CONSULTAS[i % len(CONSULTAS)]), repeticiones),
+        medir("detectar_tipo_solicitud", lambda i: detectar_tipo_solicitud(CONSULTAS[i % len(CONSULTAS)]), repeticiones)
+    ]
+    for seccion in secciones() + ["general"]:
+        # Temas distintos en cada repetición para medir el renderizado y no solo la memoización
+        resultados.append(medir(
+            f"plantilla_{seccion}",
+            lambda i, s=seccion: generar_seccion(s, f"tema de prueba {i}", "educación superior"),
+            repeticiones
+        ))
+        resultados.append(medir(
+            f"plantilla_{seccion}_memo",
+            lambda i, s=seccion: renderizar_plantilla(s, "tema de prueba", "educación superior"),
+            repeticiones
+        ))
+    resultados.append(medir(
+        "responder_consulta_plantilla",
+        lambda i: responder_consulta(f"{CONSULTAS[i % len(CONSULTAS)]} {i}", "educación superior"),
+        repeticiones
+    ))
+    return resultados
+
+
+def benchmarks_ia(repeticiones, concurrencia):
+    """Modo IA contra el servidor simulado"""
+    from generadores import responder_consulta
+    from respuestas_ia import generar_respuesta_ia_stream
+
+    # Prefijo distinto en cada ejecución para que ninguna consulta salga de la caché
+    prefijo = f"{time.time_ns()}"
+    resultados = [
+        medir("ia_bloqueante",
+              lambda i: responder_consulta(f"{CONSULTAS[0]} {prefijo}-b{i}", usar_ia=True), repeticiones),
+        medir("ia_cache",
+              lambda i: responder_consulta(f"{CONSULTAS[0]} {prefijo}-b0", usar_ia=True), repeticiones, calentamiento=0),
+        medir_concurrente("ia_concurrente",
+                          lambda i: responder_consulta(f"{CONSULTAS[1]} {prefijo}-c{i}", usar_ia=True),
+                          repeticiones, concurrencia)
+    ]
+
+    primeros_tokens = []
+    totales = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        fragmentos = generar_respuesta_ia_stream(f"{CONSULTAS[2]} {prefijo}-s{i}")
+        next(fragmentos, None)
+        primeros_tokens.append(time.perf_counter() - inicio)
+        for _ in fragmentos:
+            pass
+        totales.append(time.perf_counter() - inicio)
+    resultados.append(resumir_tiempos("ia_stream_primer_token", primeros_tokens))
+    resultados.append(resumir_tiempos("ia_stream_total", totales))
+    return resultados
+
+
+# Se ejecuta en un proceso nuevo por repetición para que el arranque sea realmente en frío
+SCRIPT_ARRANQUE = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+inicio = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=60).run()
+arranque = time.perf_counter() - inicio
+reruns = []
+for _ in range(int(sys.argv[2])):
+    inicio = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - inicio)
+print(json.dumps({"arranque": arranque, "reruns": reruns, "openai_cargado": "openai" in sys.modules}))
+"""
+
+
+# Un worker del benchmark multiproceso: consultas distintas a la IA desde varios hilos. Tras una
+# consulta de calentamiento (importaciones y conexiones) avisa y espera la señal de salida
+SCRIPT_WORKER = """
+import json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from generadores import responder_consulta
+prefijo, peticiones, concurrencia = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+def consultar(i):
+    inicio = time.perf_counter()
+    responder_consulta(f"Sugiera referencias sobre {prefijo}-{i}", usar_ia=True)
+    return time.perf_counter() - inicio
+consultar("calentamiento")
+print("listo", flush=True)
+sys.stdin.readline()
+with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+    print(json.dumps(list(pool.map(consultar, range(peticiones)))))
+"""
+
+
+def benchmarks_workers(workers, peticiones, concurrencia):
+    """Rendimiento del modo IA con varios procesos que comparten el backend de estado en archivo.
+
+    Todos descuentan de los mismos cubos del limitador y escriben en la misma
+    caché; el rendimiento total debería crecer casi linealmente con los workers
+    mientras no se sature la CPU de la máquina."""
+    resultados = []
+    entorno = dict(os.environ, ESTADO_BACKEND="archivo", PYTHONPATH=RAIZ,
+                   IA_PETICIONES_POR_MINUTO="1000000", IA_TOKENS_POR_MINUTO="1000000000")
+    for numero in workers:
+        prefijo = f"{time.time_ns()}"
+        procesos = [
+            subprocess.Popen([sys.executable, "-c", SCRIPT_WORKER, f"{prefijo}-{w}", str(peticiones), str(concurrencia)],
+                             cwd=RAIZ, env=entorno, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            for w in range(numero)
+        ]
+        for proceso in procesos:
+            proceso.stdout.readline()
+        inicio = time.perf_counter()
+        for proceso in procesos:
+            proceso.stdin.write("\n")
+            proceso.stdin.flush()
+        tiempos = []
+        for proceso in procesos:
+            salida, _ = proceso.communicate()
+            tiempos.extend(json.loads(salida.strip().splitlines()[-1]))
+        resultados.append(resumir_tiempos(f"ia_workers_{numero}", tiempos, time.perf_counter() - inicio))
+    return resultados
+
+
+async def peticiones_http(puerto, cuerpos, conexiones):
+    """Envía ``POST`` con cada ``(ruta, cuerpo)`` desde ``conexiones`` conexiones keep-alive; devuelve los tiempos"""
+    tiempos = []
+    
+    async def conexion(indice):
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        for ruta, cuerpo in cuerpos[indice::conexiones]:
+            datos = json.dumps(cuerpo).encode("utf-8")
+            inicio = time.perf_counter()
+            escritor.write(f"POST {ruta} HTTP/1.1\r\nHost: bench\r\nContent-Length: {len(datos)}\r\n\r\n".encode() + datos)
+            await escritor.drain()
+            cabecera = await lector.readuntil(b"\r\n\r\n")
+            longitud = next(int(linea.split(b":")[1]) for linea in cabecera.split(b"\r\n")
+                            if linea.lower().startswith(b"content-length:"))
+            await lector.readexactly(longitud)
+            tiempos.append(time.perf_counter() - inicio)
+        escritor.close()
+    
+    await asyncio.gather(*(conexion(indice) for indice in range(conexiones)))
+    return tiempos
+
+
+def benchmarks_api(peticiones, conexiones=32, tamano_lote=20):
+    """Rendimiento de la API HTTP (``api.py``) en las rutas de plantilla, en un proceso aparte"""
+    proceso = subprocess.Popen([sys.executable, os.path.join(RAIZ, "api.py"), "--puerto", "0"],
+                               cwd=RAIZ, stderr=subprocess.PIPE, text=True)
+    try:
+        puerto = int(proceso.stderr.readline().rsplit(":", 1)[1])
+        consultas = [("/consulta", {"mensaje": CONSULTAS[i % len(CONSULTAS)], "contexto": "universidades"})
+                     for i in range(peticiones)]
+        lotes = [("/lote", {"consultas": [{"mensaje": consulta} for consulta in
+                                          (CONSULTAS * tamano_lote)[i:i + tamano_lote]]})
+                 for i in range(max(1, peticiones // tamano_lote))]
+        asyncio.run(peticiones_http(puerto, consultas[:conexiones], conexiones))
+        resultados = []
+        for nombre, cuerpos in (("api_consulta_plantilla", consultas), (f"api_lote_{tamano_lote}", lotes)):
+            inicio = time.perf_counter()
+            tiempos = asyncio.run(peticiones_http(puerto, cuerpos, conexiones))
+            resultados.append(resumir_tiempos(nombre, tiempos, time.perf_counter() - inicio))
+        return resultados
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+
+def benchmarks_app(repeticiones, reruns=10):
+    """Arranque en frío (importaciones + primera ejecución del script) y tiempo de cada rerun"""
+    arranques = []
+    tiempos_rerun = []
+    openai_cargado = False
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, "-c", SCRIPT_ARRANQUE, os.path.join(RAIZ, "asistente.py"), str(reruns)],
+            cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout
+        datos = json.loads(salida.strip().splitlines()[-1])
+        arranques.append(datos["arranque"])
+        tiempos_rerun.extend(datos["reruns"])
+        openai_cargado = openai_cargado or datos["openai_cargado"]
+    print(f"openai importado al arrancar la app: {'sí' if openai_cargado else 'no'}")
+    return [resumir_tiempos("app_arranque_en_frio", arranques), resumir_tiempos("app_rerun", tiempos_rerun)]
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconocido"
+
+
+def comparar(actual, base):
+    """Imprime la variación de p50/p95 respecto a un archivo de resultados anterior"""
+    anteriores = {r["nombre"]: r for r in base["resultados"]}
+    print(f"\nComparación con {base['commit']} (negativo = más rápido):")
+    for resultado in actual["resultados"]:
+        anterior = anteriores.get(resultado["nombre"])
+        if not anterior:
+            continue
+        variaciones = []
+        for metrica in ("p50_ms", "p95_ms"):
+            if anterior[metrica]:
+                variaciones.append(f"{metrica} {100 * (resultado[metrica] / anterior[metrica] - 1):+.1f}%")
+        print(f"  {resultado['nombre']:<34} {'  '.join(variaciones)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del asistente de investigación")
+    parser.add_argument("--repeticiones", type=int, default=200, help="Repeticiones de las rutas locales")
+    parser.add_argument("--repeticiones-ia", type=int, default=20, help="Repeticiones de las rutas de IA")
+    parser.add_argument("--concurrencia", type=int, default=8, help="Hilos para el benchmark de IA concurrente")
+    parser.add_argument("--latencia", type=float, default=0.2, help="Latencia del servidor simulado (s)")
+    parser.add_argument("--tokens-por-segundo", type=float, default=200.0)
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens de cada respuesta simulada")
+    parser.add_argument("--sin-ia", action="store_true", help="Omitir los benchmarks del modo IA")
+    parser.add_argument("--repeticiones-app", type=int, default=5,
+                        help="Arranques en frío de la app de Streamlit (0 = omitir)")
+    parser.add_argument("--registros-bibliografia", type=int, default=20000,
+                        help="Registros del catálogo sintético del índice bibliográfico (0 = omitir)")
+    parser.add_argument("--workers", default="1,2,4",
+                        help="Procesos del benchmark multiproceso, separados por comas (vacío = omitir)")
+    parser.add_argument("--peticiones-api", type=int, default=2000,
+                        help="Peticiones del benchmark de la API HTTP (0 = omitir)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto benchmarks/resultados/<commit>.json)")
+    parser.add_argument("--comparar", help="Archivo JSON de una ejecución anterior con el que comparar")
+    args = parser.parse_args()
+
+    from servidor_simulado import iniciar_servidor
+
+    # Entorno aislado: caché temporal y cliente apuntando al servidor simulado
+    directorio_temporal = tempfile.mkdtemp(prefix="bench-asistente-")
+    os.environ["CACHE_RESPUESTAS_RUTA"] = os.path.join(directorio_temporal, "cache.sqlite3")
+    os.environ["BIBLIOGRAFIA_INDICE"] = os.path.join(directorio_temporal, "bibliografia")
+    os.environ["ESTADO_RUTA"] = os.path.join(directorio_temporal, "estado.sqlite3")
+    os.environ["HISTORIAL_RUTA"] = os.path.join(directorio_temporal, "historial.sqlite3")
+    servidor = iniciar_servidor(latencia=args.latencia, tokens_por_segundo=args.tokens_por_segundo, tokens=args.tokens)
+    os.environ["OPENAI_BASE_URL"] = servidor.url_base
+    os.environ["OPENAI_API_KEY"] = "clave-simulada"
+
+    # El índice se construye antes para que las plantillas midan también la búsqueda de referencias
+    resultados = []
+    if args.registros_bibliografia:
+        resultados += benchmarks_bibliografia(args.registros_bibliografia, args.repeticiones)
+    resultados += benchmarks_locales(args.repeticiones)
+    if args.peticiones_api:
+        resultados += benchmarks_api(args.peticiones_api)
+    if not args.sin_ia:
+        resultados += benchmarks_ia(args.repeticiones_ia, args.concurrencia)
+        if args.workers:
+            workers = [int(numero) for numero in args.workers.split(",")]
+            resultados += benchmarks_workers(workers, args.repeticiones_ia, args.concurrencia)
+    if args.repeticiones_app:
+        resultados += benchmarks_app(args.repeticiones_app)
+    servidor.shutdown()
+
+    informe = {
+        "commit": commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "configuracion": vars(args),
+        "resultados": resultados
+    }
+    salida = args.salida or os.path.join(RAIZ, "benchmarks", "resultados", f"{informe['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(informe, archivo, ensure_ascii=False, indent=2)
+
+    print(f"{'benchmark':<34} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'op/s':>10}")
+    for r in resultados:
+        print(f"{r['nombre']:<34} {r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['por_segundo'] or 0:>10.1f}")
+    print(f"\nResultados guardados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            comparar(informe, json.load(archivo))
+
+
+if __name__ == "__main__":
+    main()
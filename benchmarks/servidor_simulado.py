@@ -0,0 +1,126 @@
+"""Servidor local compatible con la API de chat de OpenAI para pruebas y benchmarks.
+
+Responde a ``POST /v1/chat/completions`` (normal y en streaming SSE) con un
+texto sintético, simulando una latencia inicial y una velocidad de generación
+configurables. No necesita red ni API key.
+
+Uso independiente::
+
+    python benchmarks/servidor_simulado.py --puerto 8765 --latencia 0.4 --tokens-por-segundo 60
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 streamlit run asistente.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PALABRAS = ("la investigación analiza factores variables metodología resultados impacto "
+            "contexto educativo estudiantes docentes evidencia enfoque mixto").split()
+
+
+class ManejadorSimulado(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _enviar_json(self, estado, datos):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _escribir_trozo(self, datos):
+        self.wfile.write(f"{len(datos):X}\r\n".encode("ascii") + datos + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._enviar_json(404, {"error": {"message": "Ruta no encontrada", "type": "invalid_request_error"}})
+            return
+        longitud = int(self.headers.get("Content-Length", 0))
+        peticion = json.loads(self.rfile.read(longitud) or b"{}")
+        config = self.server.config
+        self.server.peticiones += 1
+
+        tokens = min(config["tokens"], peticion.get("max_tokens") or config["tokens"])
+        prompt_tokens = sum(len(m.get("content") or "") for m in peticion.get("messages", [])) // 4 + 1
+        modelo = peticion.get("model", "simulado")
+        pausa_token = 1.0 / config["tokens_por_segundo"] if config["tokens_por_segundo"] > 0 else 0.0
+        time.sleep(config["latencia"])
+
+        if not peticion.get("stream"):
+            time.sleep(pausa_token * tokens)
+            texto = " ".join(PALABRAS[i % len(PALABRAS)] for i in range(tokens))
+            self._enviar_json(200, {
+                "id": "chatcmpl-simulado",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": texto},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": tokens,
+                    "total_tokens": prompt_tokens + tokens
+                }
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(tokens):
+            if i:
+                time.sleep(pausa_token)
+            fragmento = {
+                "id": "chatcmpl-simulado",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": modelo,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": PALABRAS[i % len(PALABRAS)] + " "},
+                    "finish_reason": None
+                }]
+            }
+            self._escribir_trozo(f"data: {json.dumps(fragmento)}\n\n".encode("utf-8"))
+        self._escribir_trozo(b"data: [DONE]\n\n")
+        self._escribir_trozo(b"")
+
+
+def iniciar_servidor(puerto=0, latencia=0.2, tokens_por_segundo=80.0, tokens=60):
+    """Arranca el servidor en un hilo de fondo y lo devuelve (``servidor.url_base`` incluida)"""
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), ManejadorSimulado)
+    servidor.daemon_threads = True
+    servidor.config = {"latencia": latencia, "tokens_por_segundo": tokens_por_segundo, "tokens": tokens}
+    servidor.peticiones = 0
+    servidor.url_base = f"http://127.0.0.1:{servidor.server_address[1]}/v1"
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de chat de OpenAI")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.2, help="Segundos hasta el primer token")
+    parser.add_argument("--tokens-por-segundo", type=float, default=80.0)
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens de cada respuesta")
+    args = parser.parse_args()
+    servidor = iniciar_servidor(args.puerto, args.latencia, args.tokens_por_segundo, args.tokens)
+    print(f"Servidor simulado en {servidor.url_base}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+"""Índice bibliográfico local (BM25) para sugerir referencias reales sin conexión.
+
+Ingiere exportaciones de la biblioteca en BibTeX (``.bib``), RIS (``.ris``) y
+CSL-JSON (``.json``) y construye un índice invertido compacto en disco. Cada
+archivo de origen produce un segmento con:
+
+- ``vocabulario.json``: término -> (inicio en las listas, frecuencia de documento)
+- ``documentos.npy`` / ``frecuencias.npy``: listas de apariciones concatenadas
+- ``longitudes.npy``: longitud en términos de cada registro
+- ``registros.bin`` / ``desplazamientos.npy``: registros en JSON para mostrarlos
+
+Las matrices se abren con ``numpy.load(mmap_mode="r")``, así que solo se leen
+del disco las listas de los términos consultados (NumPy se importa al abrir el
+primer segmento, no al arrancar la app). La reindexación es
+incremental: solo se reconstruyen los segmentos de los archivos nuevos o
+modificados, y se eliminan los de los archivos que ya no existen. Las
+estadísticas de BM25 (número de registros, longitud media y frecuencia de
+documento) se combinan entre segmentos, así que la puntuación es la misma que
+con un único índice. El índice abierto se comparte en el proceso y se vuelve
+a abrir cuando cambia el directorio de segmentos (otro proceso reindexó), así
+que la app ve los registros nuevos sin reiniciarse.
+
+Uso::
+
+    python bibliografia.py indexar bibliografia/
+    python bibliografia.py buscar "competencias digitales docentes"
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import Counter, defaultdict
+
+from intenciones import quitar_tildes
+
+RUTA_FUENTES = os.environ.get("BIBLIOGRAFIA_FUENTES", "bibliografia")
+RUTA_INDICE = os.environ.get("BIBLIOGRAFIA_INDICE", os.path.join(".cache", "bibliografia"))
+# Referencias que se inyectan en los prompts y se muestran en las plantillas
+REFERENCIAS_POR_CONSULTA = int(os.environ.get("BIBLIOGRAFIA_REFERENCIAS", "5"))
+
+# Parámetros habituales de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+EXTENSIONES = {".bib": "bibtex", ".ris": "ris", ".json": "csl"}
+
+_PATRON_TERMINO = re.compile(r"\w+")
+_PALABRAS_VACIAS = frozenset("""
+a al and con de del el en for from in la las los o of on para por que the to un una unos unas y with
+""".split())
+
+
+# ---------------------------------------------------------------------------
+# Lectura de formatos
+# ---------------------------------------------------------------------------
+
+# Acentos de LaTeX habituales en BibTeX: {\'e}, \~n, \"u...
+_ACENTOS_LATEX = {"'": "\u0301", "`": "\u0300", "^": "\u0302", '"': "\u0308", "~": "\u0303"}
+_PATRON_ACENTO = re.compile(r"\\([`'^\"~])\{?([A-Za-z])\}?")
+
+
+def _limpiar_valor(valor):
+    valor = _PATRON_ACENTO.sub(lambda m: m.group(2) + _ACENTOS_LATEX[m.group(1)], valor)
+    valor = unicodedata.normalize("NFC", valor.replace("{", "").replace("}", "").replace("\\&", "&"))
+    return " ".join(valor.split())
+
+
+def _autor_apa(nombre):
+    """Convierte «Apellido, Nombre» o «Nombre Apellido» en «Apellido, N.»"""
+    nombre = nombre.strip()
+    if not nombre:
+        return ""
+    if "," in nombre:
+        apellido, nombres = [parte.strip() for parte in nombre.split(",", 1)]
+    else:
+        partes = nombre.split()
+        apellido, nombres = partes[-1], " ".join(partes[:-1])
+    iniciales = " ".join(f"{parte[0]}." for parte in re.split(r"[\s.]+", nombres) if parte)
+    return f"{apellido}, {iniciales}" if iniciales else apellido
+
+
+def _anio(texto):
+    coincidencia = re.search(r"\d{4}", texto or "")
+    return coincidencia.group() if coincidencia else ""
+
+
+def _nuevo_registro(autores, anio, titulo, fuente="", doi="", editorial="", palabras_clave="", resumen=""):
+    return {
+        "autores": [autor for autor in (_autor_apa(a) for a in autores) if autor],
+        "anio": anio,
+        "titulo": titulo,
+        "fuente": fuente,
+        "doi": doi,
+        "editorial": editorial,
+        "palabras_clave": palabras_clave,
+        "resumen": resumen
+    }
+
+
+def _leer_valor_bibtex(texto, i):
+    """Lee un valor entre llaves, entre comillas o sin delimitar a partir de ``i``"""
+    if texto[i] == "{":
+        profundidad, inicio = 0, i + 1
+        while i < len(texto):
+            if texto[i] == "{":
+                profundidad += 1
+            elif texto[i] == "}":
+                profundidad -= 1
+                if profundidad == 0:
+                    return texto[inicio:i], i + 1
+            i += 1
+        return texto[inicio:], i
+    if texto[i] == '"':
+        inicio = i = i + 1
+        profundidad = 0
+        while i < len(texto) and not (texto[i] == '"' and profundidad == 0 and texto[i - 1] != "\\"):
+            profundidad += {"{": 1, "}": -1}.get(texto[i], 0)
+            i += 1
+        return texto[inicio:i], i + 1
+    inicio = i
+    while i < len(texto) and texto[i] not in ",}\n":
+        i += 1
+    return texto[inicio:i].strip(), i
+
+
+def leer_bibtex(texto):
+    """Registros de un archivo BibTeX (se ignoran @string, @comment y @preamble)"""
+    for entrada in re.finditer(r"@(\w+)\s*[{(]\s*[^,\s]*\s*,", texto):
+        if entrada.group(1).lower() in ("string", "comment", "preamble"):
+            continue
+        campos = {}
+        i = entrada.end()
+        while i < len(texto):
+            while i < len(texto) and texto[i] in " \t\r\n,":
+                i += 1
+            if i >= len(texto) or texto[i] in "})":
+                break
+            igual = texto.find("=", i)
+            if igual < 0:
+                break
+            nombre = texto[i:igual].strip().lower()
+            i = igual + 1
+            while i < len(texto) and texto[i] in " \t\r\n":
+                i += 1
+            if i >= len(texto):
+                break
+            valor, i = _leer_valor_bibtex(texto, i)
+            campos[nombre] = _limpiar_valor(valor)
+        if not campos.get("title"):
+            continue
+        autores = re.split(r"\s+and\s+", campos.get("author") or campos.get("editor") or "")
+        yield _nuevo_registro(
+            autores,
+            _anio(campos.get("year") or campos.get("date")),
+            campos["title"],
+            campos.get("journal") or campos.get("journaltitle") or campos.get("booktitle") or "",
+            campos.get("doi", ""),
+            campos.get("publisher") or campos.get("school") or campos.get("institution") or "",
+            campos.get("keywords", ""),
+            campos.get("abstract", "")
+        )
+
+
+def leer_ris(lineas):
+    """Registros de un archivo RIS, leído línea a línea"""
+    campos = defaultdict(list)
+    for linea in lineas:
+        coincidencia = re.match(r"^([A-Z][A-Z0-9])  -\s?(.*)$", linea.rstrip("\r\n"))
+        if not coincidencia:
+            continue
+        etiqueta, valor = coincidencia.groups()
+        if etiqueta == "ER":
+            titulo = (campos["TI"] or campos["T1"] or [""])[0]
+            if titulo:
+                yield _nuevo_registro(
+                    campos["AU"] + campos["A1"],
+                    _anio((campos["PY"] or campos["Y1"] or campos["DA"] or [""])[0]),
+                    titulo,
+                    (campos["JO"] or campos["JF"] or campos["T2"] or campos["JA"] or [""])[0],
+                    (campos["DO"] or [""])[0],
+                    (campos["PB"] or [""])[0],
+                    "; ".join(campos["KW"]),
+                    (campos["AB"] or campos["N2"] or [""])[0]
+                )
+            campos = defaultdict(list)
+        else:
+            campos[etiqueta].append(valor.strip())
+
+
+def leer_csl_json(datos):
+    """Registros de una exportación CSL-JSON (lista de elementos)"""
+    for elemento in datos.get("items", []) if isinstance(datos, dict) else datos:
+        titulo = elemento.get("title")
+        if not titulo:
+            continue
+        autores = [
+            autor.get("literal") or f"{autor.get('family', '')}, {autor.get('given', '')}".strip(", ")
+            for autor in elemento.get("author", [])
+        ]
+        fecha = (elemento.get("issued") or {}).get("date-parts") or [[""]]
+        fuente = elemento.get("container-title") or ""
+        if isinstance(fuente, list):
+            fuente = fuente[0] if fuente else ""
+        palabras_clave = elemento.get("keyword") or ""
+        yield _nuevo_registro(
+            autores,
+            _anio(str(fecha[0][0]) if fecha and fecha[0] else ""),
+            titulo,
+            fuente,
+            elemento.get("DOI", ""),
+            elemento.get("publisher", ""),
+            ", ".join(palabras_clave) if isinstance(palabras_clave, list) else palabras_clave,
+            elemento.get("abstract", "")
+        )
+
+
+def leer_registros(ruta):
+    """Registros bibliográficos de un archivo según su extensión"""
+    formato = EXTENSIONES.get(os.path.splitext(ruta)[1].lower())
+    with open(ruta, encoding="utf-8", errors="replace") as archivo:
+        if formato == "bibtex":
+            yield from leer_bibtex(archivo.read())
+        elif formato == "ris":
+            yield from leer_ris(archivo)
+        elif formato == "csl":
+            yield from leer_csl_json(json.load(archivo))
+        else:
+            raise ValueError(f"Formato bibliográfico no reconocido: {ruta}")
+
+
+# ---------------------------------------------------------------------------
+# Índice
+# ---------------------------------------------------------------------------
+
+def terminos(texto):
+    """Términos indexables: minúsculas, sin tildes y sin palabras vacías"""
+    return [
+        termino for termino in _PATRON_TERMINO.findall(quitar_tildes(texto.lower()))
+        if len(termino) > 1 and termino not in _PALABRAS_VACIAS
+    ]
+
+
+def terminos_registro(registro):
+    # El título cuenta doble: es lo que mejor describe el tema del trabajo
+    return (terminos(registro["titulo"]) * 2 + terminos(registro["palabras_clave"])
+            + terminos(registro["resumen"]) + terminos(" ".join(registro["autores"])))
+
+
+def construir_segmento(ruta_fuente, directorio):
+    """Indexa un archivo de origen en ``directorio`` y devuelve los metadatos del segmento"""
+    import numpy as np
+    temporal = directorio + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    # término -> (documentos, frecuencias); con ``array`` la construcción cabe en memoria con 1M de registros
+    apariciones = defaultdict(lambda: (array("I"), array("H")))
+    longitudes = []
+    desplazamientos = [0]
+    with open(os.path.join(temporal, "registros.bin"), "wb") as registros:
+        for documento, registro in enumerate(leer_registros(ruta_fuente)):
+            contador = Counter(terminos_registro(registro))
+            for termino, frecuencia in contador.items():
+                documentos_termino, frecuencias_termino = apariciones[termino]
+                documentos_termino.append(documento)
+                frecuencias_termino.append(min(frecuencia, 65535))
+            longitudes.append(sum(contador.values()))
+            # El resumen solo sirve para indexar; no se guarda para mostrarlo
+            datos = json.dumps({k: v for k, v in registro.items() if k != "resumen"}, ensure_ascii=False).encode("utf-8")
+            registros.write(datos)
+            desplazamientos.append(desplazamientos[-1] + len(datos))
+
+    vocabulario = {}
+    total = sum(len(lista) for lista, _ in apariciones.values())
+    documentos = np.empty(total, dtype=np.uint32)
+    frecuencias = np.empty(total, dtype=np.uint16)
+    posicion = 0
+    for termino in sorted(apariciones):
+        documentos_termino, frecuencias_termino = apariciones.pop(termino)
+        fin = posicion + len(documentos_termino)
+        vocabulario[termino] = [posicion, len(documentos_termino)]
+        documentos[posicion:fin] = np.frombuffer(documentos_termino, dtype=np.uint32)
+        frecuencias[posicion:fin] = np.frombuffer(frecuencias_termino, dtype=np.uint16)
+        posicion = fin
+
+    np.save(os.path.join(temporal, "documentos.npy"), documentos)
+    np.save(os.path.join(temporal, "frecuencias.npy"), frecuencias)
+    np.save(os.path.join(temporal, "longitudes.npy"), np.array(longitudes, dtype=np.uint32))
+    np.save(os.path.join(temporal, "desplazamientos.npy"), np.array(desplazamientos, dtype=np.uint64))
+    with open(os.path.join(temporal, "vocabulario.json"), "w", encoding="utf-8") as archivo:
+        json.dump(vocabulario, archivo, ensure_ascii=False, separators=(",", ":"))
+    estado = os.stat(ruta_fuente)
+    meta = {
+        "fuente": os.path.abspath(ruta_fuente),
+        "mtime": estado.st_mtime,
+        "tamano": estado.st_size,
+        "registros": len(longitudes),
+        "longitud_total": int(sum(longitudes))
+    }
+    with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as archivo:
+        json.dump(meta, archivo, ensure_ascii=False)
+    shutil.rmtree(directorio, ignore_errors=True)
+    os.replace(temporal, directorio)
+    return meta
+
+
+def archivos_fuente(rutas, ruta_indice=RUTA_INDICE):
+    """Archivos bibliográficos de las rutas indicadas (archivos o directorios)"""
+    excluido = os.path.abspath(ruta_indice)
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, directorios, nombres in os.walk(ruta):
+                # Los archivos del propio índice no son fuentes aunque terminen en .json
+                directorios[:] = [d for d in directorios if os.path.abspath(os.path.join(raiz, d)) != excluido]
+                for nombre in sorted(nombres):
+                    if os.path.splitext(nombre)[1].lower() in EXTENSIONES:
+                        yield os.path.join(raiz, nombre)
+        elif os.path.exists(ruta):
+            yield ruta
+
+
+def indexar(rutas, ruta_indice=RUTA_INDICE):
+    """Reindexa de forma incremental; devuelve (segmentos reconstruidos, conservados, eliminados)"""
+    directorio_segmentos = os.path.join(ruta_indice, "segmentos")
+    os.makedirs(directorio_segmentos, exist_ok=True)
+    vigentes = set()
+    reconstruidos = conservados = 0
+    for fuente in archivos_fuente(rutas, ruta_indice):
+        nombre = hashlib.sha256(os.path.abspath(fuente).encode("utf-8")).hexdigest()[:16]
+        vigentes.add(nombre)
+        directorio = os.path.join(directorio_segmentos, nombre)
+        estado = os.stat(fuente)
+        try:
+            with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as archivo:
+                meta = json.load(archivo)
+            if meta["mtime"] == estado.st_mtime and meta["tamano"] == estado.st_size:
+                conservados += 1
+                continue
+        except (OSError, ValueError):
+            pass
+        construir_segmento(fuente, directorio)
+        reconstruidos += 1
+    eliminados = 0
+    for nombre in os.listdir(directorio_segmentos):
+        if nombre not in vigentes:
+            shutil.rmtree(os.path.join(directorio_segmentos, nombre), ignore_errors=True)
+            eliminados += 1
+    return reconstruidos, conservados, eliminados
+
+
+class Segmento:
+    """Un segmento del índice abierto en modo de solo lectura (matrices mapeadas en memoria)"""
+
+    def __init__(self, directorio):
+        import numpy as np
+        with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as archivo:
+            self.meta = json.load(archivo)
+        with open(os.path.join(directorio, "vocabulario.json"), encoding="utf-8") as archivo:
+            self.vocabulario = json.load(archivo)
+        self.documentos = np.load(os.path.join(directorio, "documentos.npy"), mmap_mode="r")
+        self.frecuencias = np.load(os.path.join(directorio, "frecuencias.npy"), mmap_mode="r")
+        self.longitudes = np.load(os.path.join(directorio, "longitudes.npy"), mmap_mode="r")
+        self.desplazamientos = np.load(os.path.join(directorio, "desplazamientos.npy"), mmap_mode="r")
+        self._registros = open(os.path.join(directorio, "registros.bin"), "rb")
+        self._lock = threading.Lock()
+
+    def registro(self, documento):
+        inicio, fin = int(self.desplazamientos[documento]), int(self.desplazamientos[documento + 1])
+        with self._lock:
+            self._registros.seek(inicio)
+            return json.loads(self._registros.read(fin - inicio))
+
+
+def version_indice(ruta_indice=RUTA_INDICE):
+    """Versión del índice en disco: cambia cada vez que se crea, reconstruye o elimina un segmento"""
+    try:
+        return os.stat(os.path.join(ruta_indice, "segmentos")).st_mtime_ns
+    except OSError:
+        return None
+
+
+class IndiceBibliografico:
+    """Búsqueda BM25 sobre todos los segmentos del índice"""
+
+    def __init__(self, ruta_indice=RUTA_INDICE):
+        # La versión se lee antes de listar: si cambia mientras se abre, la siguiente consulta reabre
+        self.version = version_indice(ruta_indice)
+        directorio_segmentos = os.path.join(ruta_indice, "segmentos")
+        self.segmentos = []
+        for nombre in sorted(os.listdir(directorio_segmentos)) if os.path.isdir(directorio_segmentos) else []:
+            if nombre.endswith(".tmp"):
+                continue
+            try:
+                self.segmentos.append(Segmento(os.path.join(directorio_segmentos, nombre)))
+            except (OSError, ValueError):
+                # Segmento a medio reconstruir por una reindexación en curso
+                continue
+        self.registros = sum(segmento.meta["registros"] for segmento in self.segmentos)
+        longitud_total = sum(segmento.meta["longitud_total"] for segmento in self.segmentos)
+        self.longitud_media = longitud_total / self.registros if self.registros else 0.0
+
+    def buscar(self, consulta, k=REFERENCIAS_POR_CONSULTA):
+        """Los ``k`` registros más relevantes para ``consulta`` como (puntuación, registro)"""
+        consulta_terminos = list(dict.fromkeys(terminos(consulta)))
+        if not consulta_terminos or not self.registros:
+            return []
+        import numpy as np
+        # Frecuencia de documento global: suma de la de cada segmento
+        frecuencia_documento = {
+            termino: sum(seg.vocabulario[termino][1] for seg in self.segmentos if termino in seg.vocabulario)
+            for termino in consulta_terminos
+        }
+        candidatos = []
+        for segmento in self.segmentos:
+            puntuaciones = None
+            tocados = []
+            for termino in consulta_terminos:
+                entrada = segmento.vocabulario.get(termino)
+                if entrada is None:
+                    continue
+                if puntuaciones is None:
+                    puntuaciones = np.zeros(segmento.meta["registros"], dtype=np.float32)
+                inicio, df = entrada
+                documentos = segmento.documentos[inicio:inicio + df]
+                frecuencias = segmento.frecuencias[inicio:inicio + df].astype(np.float32)
+                # Solo se normalizan las longitudes de los registros que contienen el término
+                normalizacion = BM25_K1 * (1 - BM25_B + BM25_B / self.longitud_media * segmento.longitudes[documentos])
+                df_global = frecuencia_documento[termino]
+                idf = np.float32(np.log(1 + (self.registros - df_global + 0.5) / (df_global + 0.5)))
+                # Dentro de una lista cada registro aparece una sola vez, así que la suma indexada es segura
+                puntuaciones[documentos] += idf * frecuencias * (BM25_K1 + 1) / (frecuencias + normalizacion)
+                tocados.append(documentos)
+            if puntuaciones is None:
+                continue
+            # El top-k se busca solo entre los registros con algún término de la consulta
+            tocados = np.concatenate(tocados) if len(tocados) > 1 else tocados[0]
+            puntuaciones_tocados = puntuaciones[tocados]
+            n = min(k * len(consulta_terminos), len(tocados))
+            mejores = np.unique(tocados[np.argpartition(-puntuaciones_tocados, n - 1)[:n]])
+            candidatos.extend((float(puntuaciones[documento]), segmento, int(documento)) for documento in mejores)
+        candidatos.sort(key=lambda candidato: -candidato[0])
+        return [(puntuacion, segmento.registro(documento)) for puntuacion, segmento, documento in candidatos[:k]]
+
+
+def formatear_apa(registro):
+    """Referencia en formato APA (7.ª ed.) a partir de un registro del índice"""
+    autores = registro["autores"]
+    if len(autores) > 1:
+        autores_texto = ", ".join(autores[:-1]) + ", & " + autores[-1]
+    else:
+        autores_texto = autores[0] if autores else ""
+    partes = [f"{autores_texto} ({registro['anio'] or 's. f.'}).", f"{registro['titulo'].rstrip('.')}."]
+    if registro["fuente"]:
+        partes.append(f"*{registro['fuente']}*.")
+    elif registro["editorial"]:
+        partes.append(f"{registro['editorial']}.")
+    if registro["doi"]:
+        doi = registro["doi"]
+        partes.append(doi if doi.startswith("http") else f"https://doi.org/{doi}")
+    return " ".join(parte for parte in partes if parte).strip()
+
+
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def obtener_indice():
+    """Índice compartido por todo el proceso (vacío si todavía no se ha indexado nada).
+
+    Si el índice en disco cambió desde que se abrió, se vuelve a abrir y se
+    vacía la memoria de ``buscar_referencias``."""
+    global _indice
+    version = version_indice()
+    if _indice is None or _indice.version != version:
+        with _lock_indice:
+            if _indice is None or _indice.version != version:
+                _indice = IndiceBibliografico()
+                _referencias_indice.cache_clear()
+    return _indice
+
+
+@functools.lru_cache(maxsize=1024)
+def _referencias_indice(tema, k, version):
+    return tuple(formatear_apa(registro) for _, registro in obtener_indice().buscar(tema, k))
+
+
+def buscar_referencias(tema, k=REFERENCIAS_POR_CONSULTA):
+    """Referencias APA reales del catálogo local para ``tema``.
+
+    El resultado de cada tema se memoriza mientras el índice no cambie: la
+    clave de caché y el prompt de una misma consulta no repiten la búsqueda."""
+    return _referencias_indice(tema, k, obtener_indice().version)
+
+
+def bloque_referencias(tema, k=REFERENCIAS_POR_CONSULTA):
+    """Sección Markdown con las referencias del catálogo para las plantillas ("" si no hay)"""
+    referencias = buscar_referencias(tema, k)
+    if not referencias:
+        return ""
+    lineas = "\n".join(f"- {referencia}" for referencia in referencias)
+    return f"\n## 📚 REFERENCIAS DEL CATÁLOGO LOCAL\n\n{lineas}\n"
+
+
+def main(argumentos=None):
+    argumentos = sys.argv[1:] if argumentos is None else argumentos
+    if argumentos[:1] == ["indexar"]:
+        rutas = argumentos[1:] or [RUTA_FUENTES]
+        reconstruidos, conservados, eliminados = indexar(rutas)
+        indice = IndiceBibliografico()
+        print(f"Segmentos: {reconstruidos} reconstruidos, {conservados} sin cambios, {eliminados} eliminados")
+        print(f"Registros indexados: {indice.registros}")
+        return 0
+    if argumentos[:1] == ["buscar"] and len(argumentos) > 1:
+        for puntuacion, registro in obtener_indice().buscar(" ".join(argumentos[1:])):
+            print(f"{puntuacion:6.2f}  {formatear_apa(registro)}")
+        return 0
+    print("Uso: python bibliografia.py indexar [rutas...] | buscar <consulta>", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from estado_compartido import obtener_estado
+
+# Configuración por defecto de la caché (se puede ajustar con variables de entorno)
+RUTA_CACHE = os.environ.get("CACHE_RESPUESTAS_RUTA", os.path.join(".cache", "respuestas.sqlite3"))
+MAX_ENTRADAS = int(os.environ.get("CACHE_RESPUESTAS_MAX_ENTRADAS", "5000"))
+TTL_SEGUNDOS = int(os.environ.get("CACHE_RESPUESTAS_TTL", str(7 * 24 * 3600)))
+
+
+def normalizar_texto(texto):
+    """Normaliza un texto para que variantes triviales compartan la misma clave"""
+    return " ".join((texto or "").split()).lower()
+
+
+def calcular_clave(tipo, prompt, contexto="", modelo="", temperatura=None):
+    """Calcula la clave de caché a partir del prompt, contexto, modelo y temperatura"""
+    partes = [
+        tipo,
+        normalizar_texto(prompt),
+        normalizar_texto(contexto),
+        modelo,
+        temperatura
+    ]
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CacheRespuestas:
+    """Caché persistente de respuestas en SQLite, compartida entre sesiones y procesos.
+
+    Las entradas caducan tras ``ttl`` segundos y, cuando se supera ``max_entradas``,
+    se eliminan las usadas menos recientemente (LRU). Los contadores de aciertos y
+    fallos se guardan en la propia base de datos para que sean globales.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, max_entradas=MAX_ENTRADAS, ttl=TTL_SEGUNDOS):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS respuestas (
+                clave TEXT PRIMARY KEY,
+                tipo TEXT NOT NULL,
+                respuesta TEXT NOT NULL,
+                creada REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON respuestas (ultimo_acceso)")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS estadisticas (
+                nombre TEXT PRIMARY KEY,
+                valor INTEGER NOT NULL
+            )
+        """)
+        self._conexion.execute(
+            "INSERT OR IGNORE INTO estadisticas (nombre, valor) VALUES ('aciertos', 0), ('fallos', 0), ('desalojos', 0)"
+        )
+
+    def _incrementar(self, nombre, cantidad=1):
+        self._conexion.execute("UPDATE estadisticas SET valor = valor + ? WHERE nombre = ?", (cantidad, nombre))
+
+    def obtener(self, clave):
+        """Devuelve la respuesta almacenada para la clave o ``None`` si no existe o caducó"""
+        ahora = time.time()
+        with self._lock:
+            fila = self._conexion.execute(
+                "SELECT respuesta, creada FROM respuestas WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or ahora - fila[1] > self.ttl:
+                if fila is not None:
+                    self._conexion.execute("DELETE FROM respuestas WHERE clave = ?", (clave,))
+                self._incrementar("fallos")
+                return None
+            self._conexion.execute("UPDATE respuestas SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+            self._incrementar("aciertos")
+            return fila[0]
+
+    def contiene(self, clave):
+        """Si hay una respuesta vigente para la clave, sin contar acierto ni fallo ni renovar su uso"""
+        with self._lock:
+            fila = self._conexion.execute("SELECT creada FROM respuestas WHERE clave = ?", (clave,)).fetchone()
+        return fila is not None and time.time() - fila[0] <= self.ttl
+
+    def guardar(self, clave, respuesta, tipo="ia"):
+        """Guarda una respuesta y aplica los límites de tamaño y antigüedad"""
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                self._conexion.execute(
+                    "INSERT OR REPLACE INTO respuestas (clave, tipo, respuesta, creada, ultimo_acceso) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (clave, tipo, respuesta, ahora, ahora)
+                )
+                caducadas = self._conexion.execute(
+                    "DELETE FROM respuestas WHERE creada < ?", (ahora - self.ttl,)
+                ).rowcount
+                total = self._conexion.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+                exceso = max(0, total - self.max_entradas)
+                if exceso:
+                    self._conexion.execute(
+                        "DELETE FROM respuestas WHERE clave IN "
+                        "(SELECT clave FROM respuestas ORDER BY ultimo_acceso ASC LIMIT ?)",
+                        (exceso,)
+                    )
+                if caducadas + exceso:
+                    self._incrementar("desalojos", caducadas + exceso)
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+
+    def obtener_o_generar(self, clave, generar, tipo="ia"):
+        """Devuelve la respuesta en caché o la genera con ``generar()`` y la almacena"""
+        respuesta = self.obtener(clave)
+        if respuesta is None:
+            respuesta = generar()
+            self.guardar(clave, respuesta, tipo)
+        return respuesta
+
+    def estadisticas(self):
+        """Devuelve los contadores de aciertos, fallos y desalojos junto al número de entradas"""
+        with self._lock:
+            datos = dict(self._conexion.execute("SELECT nombre, valor FROM estadisticas").fetchall())
+            datos["entradas"] = self._conexion.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        consultas = datos["aciertos"] + datos["fallos"]
+        datos["tasa_aciertos"] = datos["aciertos"] / consultas if consultas else 0.0
+        return datos
+
+    def limpiar(self):
+        """Elimina todas las entradas de la caché"""
+        with self._lock:
+            self._conexion.execute("DELETE FROM respuestas")
+
+
+class CacheMemoria(CacheRespuestas):
+    """Misma caché en memoria del proceso (backend de estado ``proceso``): LRU con caducidad"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, ttl=TTL_SEGUNDOS):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (respuesta, creada), de la menos a la más usada
+        self._estadisticas = {"aciertos": 0, "fallos": 0, "desalojos": 0}
+
+    def obtener(self, clave):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or ahora - entrada[1] > self.ttl:
+                if entrada is not None:
+                    del self._entradas[clave]
+                self._estadisticas["fallos"] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._estadisticas["aciertos"] += 1
+            return entrada[0]
+
+    def contiene(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+        return entrada is not None and time.time() - entrada[1] <= self.ttl
+
+    def guardar(self, clave, respuesta, tipo="ia"):
+        with self._lock:
+            self._entradas[clave] = (respuesta, time.time())
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._estadisticas["desalojos"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._estadisticas, entradas=len(self._entradas))
+        consultas = datos["aciertos"] + datos["fallos"]
+        datos["tasa_aciertos"] = datos["aciertos"] / consultas if consultas else 0.0
+        return datos
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+_cache = None
+_lock_cache = threading.Lock()
+
+
+def obtener_cache():
+    """Caché compartida por todas las sesiones (y procesos, según el backend de ``estado_compartido``)"""
+    global _cache
+    if _cache is None:
+        with _lock_cache:
+            if _cache is None:
+                _cache = obtener_estado().cache_respuestas()
+    return _cache
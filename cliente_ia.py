@@ -0,0 +1,128 @@
+"""Clientes de OpenAI compartidos por todo el proceso.
+
+El paquete ``openai`` tarda más en importarse que el propio Streamlit, así que
+solo se carga la primera vez que se crea un cliente (al usar el modo IA), y no
+al arrancar la app.
+"""
+import asyncio
+import os
+import threading
+import weakref
+
+# Tiempos de espera (en segundos) para las llamadas a la API de OpenAI
+TIMEOUT_CONEXION = float(os.environ.get("OPENAI_TIMEOUT_CONEXION", "5"))
+TIMEOUT_LECTURA = float(os.environ.get("OPENAI_TIMEOUT_LECTURA", "60"))
+# Los reintentos con backoff los gestiona resiliencia.py; el cliente no reintenta por su cuenta
+MAX_REINTENTOS = int(os.environ.get("OPENAI_MAX_REINTENTOS", "0"))
+
+# Clave provisional para crear el cliente base; cada sesión usa la suya propia
+CLAVE_SIN_CONFIGURAR = "sin-configurar"
+
+_lock = threading.Lock()
+_cliente_base = None
+_clientes_async = weakref.WeakKeyDictionary()
+
+
+def crear_timeout(conexion=TIMEOUT_CONEXION, lectura=TIMEOUT_LECTURA):
+    """Crea la configuración de timeouts de conexión y lectura"""
+    import openai
+    return openai.Timeout(lectura, connect=conexion)
+
+
+def clave_por_defecto():
+    """Clave configurada en el entorno del servidor, si existe"""
+    return os.environ.get("OPENAI_API_KEY") or CLAVE_SIN_CONFIGURAR
+
+
+def obtener_cliente_base():
+    """Cliente síncrono único por proceso; mantiene el pool de conexiones HTTP abiertas"""
+    global _cliente_base
+    if _cliente_base is None:
+        with _lock:
+            if _cliente_base is None:
+                import openai
+                _cliente_base = openai.OpenAI(
+                    api_key=clave_por_defecto(),
+                    timeout=crear_timeout(),
+                    max_retries=MAX_REINTENTOS
+                )
+    return _cliente_base
+
+
+def obtener_cliente(api_key=None):
+    """Devuelve un cliente con la clave de la sesión que reutiliza el pool del proceso.
+
+    ``with_options`` copia la configuración pero comparte el cliente HTTP, por lo
+    que las conexiones TLS se mantienen abiertas entre sesiones sin mezclar claves.
+    """
+    base = obtener_cliente_base()
+    if not api_key:
+        return base
+    return base.with_options(api_key=api_key)
+
+
+def obtener_cliente_async(api_key=None):
+    """Versión asíncrona de ``obtener_cliente``; hay un cliente base por bucle de eventos"""
+    bucle = asyncio.get_running_loop()
+    with _lock:
+        base = _clientes_async.get(bucle)
+        if base is None:
+            import openai
+            base = openai.AsyncOpenAI(
+                api_key=clave_por_defecto(),
+                timeout=crear_timeout(),
+                max_retries=MAX_REINTENTOS
+            )
+            _clientes_async[bucle] = base
+    if not api_key:
+        return base
+    return base.with_options(api_key=api_key)
+
+
+def texto_de_respuesta(respuesta):
+    """Extrae el texto de una respuesta completa de chat"""
+    return respuesta.choices[0].message.content or ""
+
+
+def texto_de_fragmento(fragmento):
+    """Extrae el texto de un fragmento de streaming (puede no traer contenido)"""
+    if not fragmento.choices:
+        return ""
+    return fragmento.choices[0].delta.content or ""
+
+
+def uso_de_respuesta(respuesta):
+    """Tokens ``(prompt, respuesta, prompt en caché)`` informados por la API, o ``None`` si no vienen"""
+    uso = getattr(respuesta, "usage", None)
+    if uso is None:
+        return None
+    detalles = getattr(uso, "prompt_tokens_details", None)
+    return uso.prompt_tokens, uso.completion_tokens, getattr(detalles, "cached_tokens", None) or 0
+
+
+def _parametros_chat(mensajes, modelo, max_tokens, temperatura, stream):
+    parametros = {
+        "model": modelo,
+        "messages": mensajes,
+        "max_tokens": max_tokens,
+        "temperature": temperatura,
+        "stream": stream
+    }
+    if stream:
+        # El último fragmento trae el consumo de tokens de la respuesta
+        parametros["stream_options"] = {"include_usage": True}
+    return parametros
+
+
+def completar_chat(mensajes, modelo, max_tokens, temperatura, api_key=None, stream=False):
+    """Llama a la API de chat con el cliente compartido"""
+    return obtener_cliente(api_key).chat.completions.create(
+        **_parametros_chat(mensajes, modelo, max_tokens, temperatura, stream)
+    )
+
+
+async def completar_chat_async(mensajes, modelo, max_tokens, temperatura, api_key=None, stream=False):
+    """Versión asíncrona de ``completar_chat`` para lanzar varias consultas a la vez"""
+    return await obtener_cliente_async(api_key).chat.completions.create(
+        **_parametros_chat(mensajes, modelo, max_tokens, temperatura, stream)
+    )
@@ -0,0 +1,117 @@
+"""Coalescencia de peticiones idénticas en curso (single-flight).
+
+Cuando varias sesiones piden a la vez la misma respuesta (misma clave de
+caché: prompt normalizado, contexto y modelo) con la misma API key, solo la
+primera llama a la IA; las demás esperan a esa llamada y reciben su resultado.
+Las sesiones con otra API key hacen su propia llamada, con su propia cuota. En
+streaming, el stream de la primera se consume en un hilo propio y se reparte
+fragmento a fragmento a todas las sesiones unidas, incluidas las que llegan
+tarde (que reciben primero lo ya generado). Si una sesión abandona el stream,
+las demás siguen recibiéndolo.
+"""
+import threading
+from concurrent.futures import Future
+
+from metricas import metricas
+
+
+class TransmisionCompartida:
+    """Stream producido una sola vez y leído por cualquier número de consumidores"""
+
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._partes = []
+        self._terminada = False
+        self._error = None
+
+    def producir(self, fragmentos, al_terminar=None):
+        """Consume ``fragmentos`` en un hilo de fondo repartiéndolos a los consumidores"""
+        def tarea():
+            try:
+                for fragmento in fragmentos:
+                    with self._condicion:
+                        self._partes.append(fragmento)
+                        self._condicion.notify_all()
+            except Exception as e:
+                self._error = e
+            finally:
+                if al_terminar:
+                    al_terminar()
+                with self._condicion:
+                    self._terminada = True
+                    self._condicion.notify_all()
+
+        threading.Thread(target=tarea, name="stream-compartido", daemon=True).start()
+
+    def __iter__(self):
+        indice = 0
+        while True:
+            with self._condicion:
+                while indice >= len(self._partes) and not self._terminada:
+                    self._condicion.wait()
+                if indice < len(self._partes):
+                    fragmento = self._partes[indice]
+                elif self._error is not None:
+                    raise self._error
+                else:
+                    return
+            indice += 1
+            yield fragmento
+
+
+class VueloUnico:
+    """Agrupa las llamadas idénticas simultáneas en una sola, compartida por todo el proceso"""
+
+    def __init__(self, nombre="ia"):
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self._en_curso = {}
+
+    def _unirse(self, clave, nuevo):
+        """Devuelve (elemento en curso para ``clave``, si quien llama es el primero)"""
+        with self._lock:
+            actual = self._en_curso.get(clave)
+            if actual is not None:
+                return actual, False
+            actual = self._en_curso[clave] = nuevo()
+            return actual, True
+
+    def _terminar(self, clave):
+        with self._lock:
+            self._en_curso.pop(clave, None)
+
+    def ejecutar(self, clave, funcion):
+        """Devuelve ``funcion()``; si ya hay una llamada en curso con la misma clave, espera su resultado"""
+        futuro, primero = self._unirse(("respuesta", clave), Future)
+        if not primero:
+            metricas.incrementar(f"{self.nombre}_coalescidas_total", modo="respuesta")
+            return futuro.result()
+        try:
+            resultado = funcion()
+        except BaseException as e:
+            # Quienes esperaban reciben el mismo error y sirven su propia respuesta de respaldo
+            futuro.set_exception(e)
+            raise
+        else:
+            futuro.set_result(resultado)
+            return resultado
+        finally:
+            self._terminar(("respuesta", clave))
+
+    def transmitir(self, clave, generar_fragmentos):
+        """Iterador sobre el stream de ``generar_fragmentos()``, compartido entre llamadas con la misma clave"""
+        transmision, primero = self._unirse(("stream", clave), TransmisionCompartida)
+        if primero:
+            transmision.producir(generar_fragmentos(), al_terminar=lambda: self._terminar(("stream", clave)))
+        else:
+            metricas.incrementar(f"{self.nombre}_coalescidas_total", modo="stream")
+        return iter(transmision)
+
+    def en_curso(self):
+        """Número de llamadas distintas en curso"""
+        with self._lock:
+            return len(self._en_curso)
+
+
+# Llamadas a la IA en curso, compartidas por todas las sesiones del proceso
+vuelos_ia = VueloUnico()
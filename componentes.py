@@ -0,0 +1,291 @@
+"""Componentes de la interfaz de Streamlit reutilizados en cada rerun.
+
+``asistente.py`` se vuelve a ejecutar de arriba abajo en cada interacción; lo
+que está aquí se importa una sola vez por proceso: las definiciones de
+funciones, la memoización del HTML de los mensajes y los recursos estáticos
+(CSS y contenido HTML de la portada), que se leen de ``estaticos/`` la primera
+vez que se piden.
+"""
+import functools
+import os
+import time
+
+import streamlit as st
+
+from contexto_conversacion import nuevo_estado, preparar_historial
+from especulacion import Especulador
+from generadores import generar_seccion_borrador, preparar_consulta, responder_consulta
+from historial import HistorialSesion, nueva_conversacion, obtener_almacen
+from limitador import EnCola
+from metricas import metricas
+from plantillas import PLANTILLAS
+from respuestas_ia import generar_respuesta_ia_stream
+from trabajos import (
+    ACTIVOS, EN_CURSO, FALLIDO, INTERRUMPIDO, INTERVALO_SONDEO, PENDIENTE, TERMINADO, TrabajosSaturados,
+    borrador, consulta_ia, obtener_gestor
+)
+
+DIRECTORIO_ESTATICOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "estaticos")
+
+# Contenido de un archivo de ``estaticos/``, leído una sola vez por proceso
+@functools.lru_cache(maxsize=None)
+def recurso_estatico(nombre):
+    with open(os.path.join(DIRECTORIO_ESTATICOS, nombre), encoding="utf-8") as archivo:
+        return archivo.read()
+
+# Indicador de la posición en la cola de la IA mientras se espera turno
+def texto_en_cola(aviso):
+    return f"⏳ Hay otras consultas a la IA antes que la suya: posición {aviso.posicion} (≈ {aviso.segundos:.0f} s)"
+
+# Muestra la respuesta en streaming dentro del bloque actual y registra los tiempos
+def mostrar_respuesta_ia_stream(mensaje_usuario, contexto="", previos=None):
+    """Renderiza la respuesta de la IA de forma progresiva y devuelve el texto completo"""
+    marcador = st.empty()
+    inicio = time.perf_counter()
+    fragmentos = generar_respuesta_ia_stream(
+        mensaje_usuario, contexto, st.session_state.openai_api_key, previos, avisar_cola=True
+    )
+    
+    # El spinner solo se muestra hasta que llega el primer token
+    with st.spinner("🤖 Consultando con IA..."):
+        texto = next(fragmentos, "")
+        while isinstance(texto, EnCola):
+            marcador.info(texto_en_cola(texto))
+            texto = next(fragmentos, "")
+    tiempo_primer_token = time.perf_counter() - inicio
+    marcador.markdown(texto + "▌")
+    
+    for fragmento in fragmentos:
+        texto += fragmento
+        marcador.markdown(texto + "▌")
+    marcador.markdown(texto)
+    
+    tiempo_total = time.perf_counter() - inicio
+    st.session_state.tiempos_ia.append({
+        "primer_token": tiempo_primer_token,
+        "total": tiempo_total,
+        "caracteres": len(texto)
+    })
+    st.caption(f"⏱️ Primer token: {tiempo_primer_token:.2f} s | Tiempo total: {tiempo_total:.2f} s")
+    return texto
+
+# Número de intercambios (pregunta + respuesta) que se muestran por página del historial
+INTERCAMBIOS_POR_PAGINA = 10
+
+# HTML de cada mensaje del historial, memorizado para todo el proceso (este módulo no se
+# vuelve a ejecutar en cada rerun, así que la memoización sobrevive entre reruns y sesiones)
+@functools.lru_cache(maxsize=4096)
+def html_mensaje(rol, contenido):
+    """Devuelve el bloque HTML con el que se muestra un mensaje del chat"""
+    if rol == "user":
+        return f"""
+            <div class="user-message">
+                <strong>👤 Usted:</strong><br>
+                {contenido}
+            </div>
+            """
+    return f"""
+            <div class="assistant-message">
+                <strong>🔬 Asistente:</strong><br>
+                {contenido}
+            </div>
+            """
+
+def cargar_mensajes_anteriores():
+    """Amplía la ventana visible del historial en una página"""
+    st.session_state.mensajes_visibles += INTERCAMBIOS_POR_PAGINA * 2
+
+# El historial se dibuja en un fragmento: paginar no vuelve a ejecutar toda la app
+@st.fragment
+def mostrar_historial_chat():
+    """Muestra los mensajes más recientes del chat con paginación hacia atrás"""
+    historial = st.session_state.chat_history
+    visibles = st.session_state.mensajes_visibles
+    ocultos = max(0, len(historial) - visibles)
+    
+    if ocultos:
+        st.button(
+            f"⬆️ Cargar mensajes anteriores ({ocultos} ocultos)",
+            key="cargar_anteriores",
+            on_click=cargar_mensajes_anteriores
+        )
+    
+    for mensaje in historial[ocultos:]:
+        st.markdown(html_mensaje(mensaje["role"], mensaje["content"]), unsafe_allow_html=True)
+
+# El historial de la sesión se guarda en disco; el identificador va en la URL para
+# poder retomar la conversación tras recargar la página o reiniciar el worker
+def abrir_conversacion(conversacion):
+    """Asocia la sesión a la conversación ``conversacion`` (nueva o existente)"""
+    st.query_params["conversacion"] = conversacion
+    st.session_state.chat_history = HistorialSesion(obtener_almacen(), conversacion)
+    st.session_state.estado_contexto = nuevo_estado()
+    st.session_state.mensajes_visibles = INTERCAMBIOS_POR_PAGINA * 2
+    st.session_state.trabajos_en_curso = set()
+    st.session_state.pop("exportacion", None)
+
+# Valores iniciales del session state de cada sesión
+def inicializar_estado():
+    if 'chat_history' not in st.session_state:
+        abrir_conversacion(st.query_params.get("conversacion") or nueva_conversacion())
+    if 'contexto_actual' not in st.session_state:
+        st.session_state.contexto_actual = ""
+    if 'modo_ia' not in st.session_state:
+        st.session_state.modo_ia = False
+    if 'modo_stream' not in st.session_state:
+        st.session_state.modo_stream = True
+    if 'segundo_plano' not in st.session_state:
+        st.session_state.segundo_plano = False
+    if 'tiempos_ia' not in st.session_state:
+        st.session_state.tiempos_ia = []
+    if 'openai_api_key' not in st.session_state:
+        st.session_state.openai_api_key = None
+    if 'estado_contexto' not in st.session_state:
+        st.session_state.estado_contexto = nuevo_estado()
+    if 'mensajes_visibles' not in st.session_state:
+        st.session_state.mensajes_visibles = INTERCAMBIOS_POR_PAGINA * 2
+    if 'trabajos_en_curso' not in st.session_state:
+        st.session_state.trabajos_en_curso = set()
+    if 'especulador' not in st.session_state:
+        st.session_state.especulador = Especulador()
+
+# Secciones de la Búsqueda Rápida: con IA, las pregeneradas por la especulación salen de la caché
+def generar_seccion_rapida(seccion, tema, contexto="", usar_ia=False):
+    """Genera la sección pedida con un botón y lo registra para la pregeneración especulativa"""
+    st.session_state.especulador.usar(seccion, tema, contexto)
+    return generar_seccion_borrador(seccion, tema, contexto, usar_ia, st.session_state.openai_api_key)
+
+def preparar_especulacion(tema, contexto, activa):
+    """Programa (o detiene) la pregeneración de las secciones y muestra su estado"""
+    especulador = st.session_state.especulador
+    if not activa:
+        especulador.detener()
+        return
+    especulador.programar(tema, contexto, st.session_state.openai_api_key)
+    if especulador.agotado:
+        st.caption("🔮 Presupuesto de pregeneración agotado en esta sesión")
+    elif especulador.listas:
+        st.caption(f"🔮 Listas al instante: {', '.join(PLANTILLAS[seccion]['titulo'] for seccion in especulador.listas)}")
+    else:
+        st.caption("🔮 Las secciones se pregeneran en cuanto el tema deja de cambiar")
+
+# Trabajos en segundo plano (ver ``trabajos.py``): la sesión solo los envía y sondea su avance
+def enviar_trabajo(tipo, titulo, ejecutar):
+    """Encola un trabajo de la conversación actual; devuelve su identificador o None si no se admitió"""
+    try:
+        identificador = obtener_gestor().enviar(st.session_state.chat_history.conversacion, tipo, titulo, ejecutar)
+    except TrabajosSaturados as e:
+        st.warning(f"⏳ {e}.")
+        return None
+    st.session_state.trabajos_en_curso.add(identificador)
+    return identificador
+
+def enviar_trabajo_borrador(tema, contexto="", usar_ia=False):
+    """Encola la generación del borrador completo; el resultado aparece en el panel de trabajos"""
+    ejecutar = borrador(tema, contexto, usar_ia, st.session_state.openai_api_key)
+    if enviar_trabajo("borrador", f"Borrador: {tema[:60]}", ejecutar):
+        st.success("🧵 Borrador en preparación: puede seguir trabajando, el avance se ve en la barra lateral")
+
+ICONOS_TRABAJO = {PENDIENTE: "⏳", EN_CURSO: "🔄", TERMINADO: "✅", FALLIDO: "❌", INTERRUMPIDO: "⚠️"}
+
+# Número de trabajos de la conversación que se muestran en el panel
+TRABAJOS_VISIBLES = 10
+
+def dibujar_trabajos(trabajos):
+    """Muestra el estado, el texto parcial o el resultado de cada trabajo"""
+    st.markdown("### 🧵 Trabajos en segundo plano")
+    for trabajo in trabajos:
+        st.markdown(f"**{ICONOS_TRABAJO[trabajo.estado]} {trabajo.titulo}**")
+        if trabajo.estado in ACTIVOS:
+            if trabajo.parcial:
+                with st.container(height=200):
+                    st.markdown(trabajo.parcial + "▌")
+            else:
+                st.caption("En espera de un hilo libre...")
+        elif trabajo.estado == TERMINADO and trabajo.tipo == "borrador":
+            st.download_button(
+                "⬇️ Descargar borrador", trabajo.resultado, f"borrador-{trabajo.id}.md", "text/markdown",
+                key=f"descargar_trabajo_{trabajo.id}", use_container_width=True
+            )
+        elif trabajo.estado == TERMINADO:
+            st.caption("La respuesta está en la conversación")
+        elif trabajo.estado == FALLIDO:
+            st.error(trabajo.error)
+        else:
+            st.warning("El proceso que lo ejecutaba se detuvo; vuelva a enviarlo")
+
+# Mientras haya trabajos en curso el panel se refresca solo, sin volver a ejecutar la app
+@st.fragment(run_every=INTERVALO_SONDEO)
+def sondear_trabajos():
+    trabajos = obtener_gestor().listar(st.session_state.chat_history.conversacion, TRABAJOS_VISIBLES)
+    activos = {trabajo.id for trabajo in trabajos if trabajo.estado in ACTIVOS}
+    terminados = st.session_state.trabajos_en_curso - activos
+    st.session_state.trabajos_en_curso = activos
+    if terminados:
+        # Las respuestas nuevas están en el historial: la app entera se vuelve a dibujar
+        st.rerun()
+    dibujar_trabajos(trabajos)
+
+def mostrar_trabajos():
+    """Panel de trabajos de la conversación (también los de antes de recargar la página)"""
+    trabajos = obtener_gestor().listar(st.session_state.chat_history.conversacion, TRABAJOS_VISIBLES)
+    st.session_state.trabajos_en_curso = {trabajo.id for trabajo in trabajos if trabajo.estado in ACTIVOS}
+    if st.session_state.trabajos_en_curso:
+        sondear_trabajos()
+    elif trabajos:
+        dibujar_trabajos(trabajos)
+
+# Función principal del chat MEJORADA con IA
+def procesar_consulta_usuario(user_input, contexto="", usar_ia=False, stream=False, segundo_plano=False):
+    """Procesa la consulta del usuario y genera respuesta con excelente redacción.
+    
+    Con ``stream=True`` la respuesta de la IA se muestra progresivamente en el
+    bloque actual; el texto completo se devuelve igualmente al final. Con
+    ``segundo_plano=True`` la consulta a la IA se encola como trabajo y se
+    devuelve None: el propio trabajo añade la respuesta al historial."""
+    try:
+        # Extraer tema y tipo de solicitud (y, con IA, los fragmentos de los documentos)
+        consulta = preparar_consulta(user_input, contexto, usar_ia, st.session_state.chat_history.conversacion)
+        tema_real = consulta.analisis.tema
+        
+        # Mostrar información de contexto
+        st.info(f"🔍 **Tema detectado:** {tema_real}")
+        if contexto:
+            st.info(f"🎯 **Contexto considerado:** {contexto}")
+        if usar_ia:
+            st.success("🤖 **Modo IA activado** - Generando respuesta con inteligencia artificial")
+        
+        # Si el modo IA está activado, usar la función de IA
+        if usar_ia:
+            # Turnos anteriores (sin el mensaje actual) ajustados al presupuesto de tokens
+            historial = st.session_state.chat_history
+            previos = preparar_historial(historial, st.session_state.estado_contexto, fin=len(historial) - 1)
+            contexto_ia = consulta.contexto
+            if consulta.fragmentos:
+                documentos = ", ".join(sorted({documento for _, documento, _ in consulta.fragmentos}))
+                st.info(f"📄 **Fragmentos de sus documentos:** {len(consulta.fragmentos)} ({documentos})")
+            if segundo_plano:
+                ejecutar = consulta_ia(
+                    historial.conversacion, user_input, contexto_ia, st.session_state.openai_api_key, previos
+                )
+                if enviar_trabajo("consulta", user_input[:80], ejecutar):
+                    st.info("🧵 Consulta enviada en segundo plano: puede seguir trabajando, "
+                            "la respuesta aparecerá en la conversación")
+                    return None
+            if stream:
+                return mostrar_respuesta_ia_stream(user_input, contexto_ia, previos)
+            aviso_cola = st.empty()
+            with st.spinner("🤖 Consultando con IA..."):
+                respuesta = responder_consulta(
+                    user_input, contexto_ia, True, st.session_state.openai_api_key, previos,
+                    al_esperar=lambda aviso: aviso_cola.info(texto_en_cola(aviso))
+                )
+            aviso_cola.empty()
+            return respuesta
+        
+        # Si no, usar la plantilla registrada para el tipo de solicitud
+        return responder_consulta(user_input, contexto, analisis=consulta.analisis)
+        
+    except Exception as e:
+        metricas.incrementar("errores_total", origen="procesar_consulta", tipo=type(e).__name__)
+        return f"❌ Se ha producido un error en el procesamiento: {str(e)}"
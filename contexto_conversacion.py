@@ -0,0 +1,119 @@
+"""Contexto multi-turno para el modo IA con presupuesto de tokens.
+
+Los turnos más recientes se envían literalmente mientras quepan en el
+presupuesto; los anteriores se pliegan en un resumen acumulado que se guarda en
+el estado de la sesión y solo se actualiza con los turnos nuevos que salen de la
+ventana. Así el tamaño del prompt queda acotado aunque la conversación tenga
+cientos de intercambios.
+"""
+import os
+import re
+
+PRESUPUESTO_TOKENS_HISTORIAL = int(os.environ.get("PRESUPUESTO_TOKENS_HISTORIAL", "2000"))
+MAX_TOKENS_RESUMEN = int(os.environ.get("MAX_TOKENS_RESUMEN", "400"))
+
+# Caracteres que se conservan de cada turno al plegarlo en el resumen
+CARACTERES_POR_TURNO = 240
+
+_PATRON_MARKDOWN = re.compile(r"[#*_`>|]+")
+# Palabras, números, signos (sin los caracteres fuera del plano básico) y el resto (saltos de línea, emojis)
+_PATRON_TOKENS = re.compile(r"([^\W\d_]+)|(\d+)|([^\w\s\U00010000-\U0010FFFF]+)|(\n+|[\U00010000-\U0010FFFF])")
+# Tokens que añade el formato de chat a cada mensaje (rol y separadores)
+SOBRECOSTE_MENSAJE = 4
+_NOMBRES_ROL = {"user": "Usuario", "assistant": "Asistente"}
+# Encabezado del mensaje de sistema con el resumen de los turnos plegados
+ENCABEZADO_RESUMEN = "Resumen de la conversación anterior:"
+
+
+def estimar_tokens(texto):
+    """Estimación local de tokens, sin tokenizador ni red.
+
+    Imita el pre-tokenizado de los modelos de OpenAI: cada palabra cuenta un
+    token más uno por cada 5 letras a partir de la primera, los números van en
+    grupos de 3 cifras, los signos en parejas y cada salto de línea o carácter
+    fuera del plano básico (emojis) cuenta aparte. Para texto académico en
+    español tiende a quedarse algo por encima del recuento real, que es lo
+    prudente para ajustar presupuestos."""
+    tokens = 1
+    for palabra, numero, signos, especial in _PATRON_TOKENS.findall(texto):
+        if palabra:
+            tokens += 1 + (len(palabra) - 1) // 5
+        elif numero:
+            tokens += (len(numero) + 2) // 3
+        elif signos:
+            tokens += (len(signos) + 1) // 2
+        else:
+            tokens += 1 + (len(especial.encode("utf-8")) > 3)
+    return tokens
+
+
+def estimar_tokens_mensajes(mensajes):
+    """Tokens estimados de una lista de mensajes de chat, con el formato de cada mensaje"""
+    return sum(estimar_tokens(mensaje["content"]) + SOBRECOSTE_MENSAJE for mensaje in mensajes) + 2
+
+
+def nuevo_estado():
+    """Estado inicial del resumen de una conversación"""
+    return {"resumen": "", "turnos_resumidos": 0}
+
+
+def resumir_turno(mensaje):
+    """Resumen extractivo de un turno: texto plano recortado a ``CARACTERES_POR_TURNO``"""
+    texto = " ".join(_PATRON_MARKDOWN.sub(" ", mensaje["content"]).split())
+    if len(texto) > CARACTERES_POR_TURNO:
+        texto = texto[:CARACTERES_POR_TURNO].rsplit(" ", 1)[0] + "…"
+    return f"- {_NOMBRES_ROL.get(mensaje['role'], mensaje['role'])}: {texto}"
+
+
+def resumen_extractivo(resumen_anterior, turnos):
+    """Añade los turnos al resumen y descarta las líneas más antiguas si supera el máximo"""
+    lineas = resumen_anterior.splitlines() if resumen_anterior else []
+    lineas.extend(resumir_turno(turno) for turno in turnos)
+    while len(lineas) > 1 and estimar_tokens("\n".join(lineas)) > MAX_TOKENS_RESUMEN:
+        lineas.pop(0)
+    return "\n".join(lineas)
+
+
+def preparar_historial(historial, estado, presupuesto=PRESUPUESTO_TOKENS_HISTORIAL, resumidor=resumen_extractivo,
+                       fin=None):
+    """Devuelve los mensajes de historial a enviar al modelo respetando el presupuesto.
+
+    ``historial`` son los turnos previos al mensaje actual y ``estado`` el
+    diccionario de ``nuevo_estado()`` guardado en la sesión, que se actualiza en
+    el sitio. ``resumidor(resumen_anterior, turnos)`` permite cambiar la
+    estrategia de resumen. Con ``fin`` solo se consideran los ``fin`` primeros
+    turnos; así un historial que se lee del disco bajo demanda (ver
+    ``historial.py``) no tiene que copiarse entero para descartar el último.
+    """
+    fin = len(historial) if fin is None else fin
+    # Si el historial se limpió, el resumen ya no corresponde
+    if estado["turnos_resumidos"] > fin:
+        estado.update(nuevo_estado())
+
+    # Ventana literal: los turnos más recientes que quepan en el presupuesto,
+    # reservando siempre el espacio máximo del resumen
+    disponible = presupuesto - MAX_TOKENS_RESUMEN
+    inicio_ventana = fin
+    while inicio_ventana > estado["turnos_resumidos"]:
+        coste = estimar_tokens(historial[inicio_ventana - 1]["content"])
+        if coste > disponible:
+            break
+        disponible -= coste
+        inicio_ventana -= 1
+
+    # Los turnos que salen de la ventana se pliegan en el resumen una sola vez
+    if inicio_ventana > estado["turnos_resumidos"]:
+        estado["resumen"] = resumidor(estado["resumen"], historial[estado["turnos_resumidos"]:inicio_ventana])
+        estado["turnos_resumidos"] = inicio_ventana
+
+    mensajes = []
+    if estado["resumen"]:
+        mensajes.append({
+            "role": "system",
+            "content": f"{ENCABEZADO_RESUMEN}\n{estado['resumen']}"
+        })
+    mensajes.extend(
+        {"role": mensaje["role"], "content": mensaje["content"]}
+        for mensaje in historial[inicio_ventana:fin]
+    )
+    return mensajes
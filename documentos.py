@@ -0,0 +1,551 @@
+"""Recuperación semántica sobre los documentos del usuario (tesis, borradores, apuntes).
+
+En vez de pegar fragmentos de la tesis en el chat, los documentos se ingieren
+una vez y cada consulta a la IA recibe solo los fragmentos más parecidos:
+
+1. Extracción por bloques (páginas de PDF, párrafos de DOCX, líneas de
+   Markdown o texto) y troceado en streaming en fragmentos de
+   ``FRAGMENTO_PALABRAS`` palabras con solape, sin cargar el documento entero.
+2. Embeddings con una función local intercambiable
+   (``DOCUMENTOS_EMBEDDINGS="modulo:funcion"``, que recibe una lista de textos
+   y devuelve una matriz ``(n, dimension)``). Sin configurar, se usa un
+   embedding por hashing de términos y bigramas, determinista y sin red.
+3. Los vectores normalizados se anexan a una matriz float32 en disco que se
+   abre con ``numpy.memmap``; la similitud coseno es un producto matricial por
+   bloques de filas, así que la memoria no depende del tamaño del corpus.
+4. La ingesta es incremental: solo se procesan los archivos nuevos o
+   modificados; las filas de versiones anteriores quedan inactivas y se
+   eliminan al compactar cuando superan a las activas. La compactación escribe
+   una generación nueva de los archivos con otro nombre y solo borra la
+   anterior tras guardar el manifiesto, así que los procesos que ya la tenían
+   abierta siguen leyendo datos coherentes hasta que reabren el índice.
+5. Cada documento pertenece a una conversación (el identificador
+   ``?conversacion=`` de la URL del chat o el campo ``conversacion`` de la
+   API) y solo se recupera en las consultas de esa conversación. Los
+   documentos ingeridos sin conversación forman un corpus compartido que solo
+   se añade a las consultas si ``DOCUMENTOS_COMPARTIDOS=1``: sin esa opción,
+   nada de lo ingerido por un usuario llega a los prompts de otro.
+
+Uso::
+
+    python documentos.py indexar --conversacion <id> tesis/
+    python documentos.py indexar documentos/      # corpus compartido
+    python documentos.py buscar --conversacion <id> "marco teórico de la tesis"
+"""
+import importlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+import zipfile
+import zlib
+from collections import Counter, deque
+from xml.etree import ElementTree
+
+from bibliografia import terminos
+
+RUTA_FUENTES = os.environ.get("DOCUMENTOS_FUENTES", "documentos")
+RUTA_INDICE = os.environ.get("DOCUMENTOS_INDICE", os.path.join(".cache", "documentos"))
+# Función de embeddings "modulo:funcion"; vacío = hashing local
+FUNCION_EMBEDDINGS = os.environ.get("DOCUMENTOS_EMBEDDINGS", "")
+DIMENSION_HASHING = int(os.environ.get("DOCUMENTOS_DIMENSION", "512"))
+FRAGMENTO_PALABRAS = int(os.environ.get("DOCUMENTOS_FRAGMENTO_PALABRAS", "180"))
+SOLAPE_PALABRAS = int(os.environ.get("DOCUMENTOS_SOLAPE_PALABRAS", "40"))
+# Fragmentos que se añaden al contexto de cada consulta y similitud mínima para incluirlos
+FRAGMENTOS_POR_CONSULTA = int(os.environ.get("DOCUMENTOS_FRAGMENTOS", "4"))
+SIMILITUD_MINIMA = float(os.environ.get("DOCUMENTOS_SIMILITUD_MINIMA", "0.12"))
+# Si los documentos ingeridos sin conversación se añaden a las consultas de todas
+COMPARTIDOS = os.environ.get("DOCUMENTOS_COMPARTIDOS", "0") == "1"
+# Fragmentos que se vectorizan juntos y filas de la matriz que se comparan de cada vez
+LOTE_EMBEDDINGS = 64
+FILAS_POR_BLOQUE = 65536
+
+EXTENSIONES = (".pdf", ".docx", ".md", ".markdown", ".txt")
+# Archivos de datos del índice (cada compactación escribe una generación nueva)
+ARCHIVOS_DATOS = ("vectores.f32", "textos.bin", "finales.u64")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+# ---------------------------------------------------------------------------
+# Extracción y troceado
+# ---------------------------------------------------------------------------
+
+def bloques_pdf(ruta):
+    """Texto de cada página de un PDF (necesita ``pypdf``, que se importa solo si hay PDFs)"""
+    try:
+        from pypdf import PdfReader
+    except ImportError as error:
+        raise RuntimeError("Para ingerir PDF hace falta instalar pypdf (pip install pypdf)") from error
+    for pagina in PdfReader(ruta).pages:
+        yield pagina.extract_text() or ""
+
+
+def bloques_docx(ruta):
+    """Párrafos de un DOCX leídos del XML del documento a medida que se descomprime"""
+    with zipfile.ZipFile(ruta) as archivo, archivo.open("word/document.xml") as documento:
+        for _, elemento in ElementTree.iterparse(documento):
+            if elemento.tag == f"{_W}p":
+                yield "".join(texto.text or "" for texto in elemento.iter(f"{_W}t"))
+                elemento.clear()
+
+
+def bloques_texto(ruta):
+    """Líneas de un archivo Markdown o de texto, sin la sintaxis de encabezados y énfasis"""
+    with open(ruta, encoding="utf-8", errors="replace") as archivo:
+        for linea in archivo:
+            yield re.sub(r"^\s{0,3}(#{1,6}|[-*+>]|\d+\.)\s+|[*_`]", "", linea)
+
+
+def leer_bloques(ruta):
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".pdf":
+        return bloques_pdf(ruta)
+    if extension == ".docx":
+        return bloques_docx(ruta)
+    return bloques_texto(ruta)
+
+
+def fragmentar(bloques, palabras=FRAGMENTO_PALABRAS, solape=SOLAPE_PALABRAS):
+    """Fragmentos de ``palabras`` palabras (con ``solape`` compartidas) a partir de un flujo de bloques"""
+    ventana = deque()
+    emitidos = 0
+    for bloque in bloques:
+        ventana.extend(bloque.split())
+        while len(ventana) >= palabras:
+            yield " ".join(list(ventana)[:palabras])
+            emitidos += 1
+            for _ in range(palabras - solape):
+                ventana.popleft()
+    # El resto solo forma fragmento propio si aporta algo más que el solape del anterior
+    if len(ventana) > (solape if emitidos else 0):
+        yield " ".join(ventana)
+
+
+# ---------------------------------------------------------------------------
+# Embeddings
+# ---------------------------------------------------------------------------
+
+def embeddings_hashing(textos, dimension=DIMENSION_HASHING):
+    """Embedding determinista sin modelo: términos y bigramas repartidos en ``dimension`` cubos con signo"""
+    import numpy as np
+    matriz = np.zeros((len(textos), dimension), dtype=np.float32)
+    for fila, texto in enumerate(textos):
+        lista = terminos(texto)
+        # Frecuencia sublineal: las palabras muy repetidas del fragmento no tapan a las demás
+        for rasgo, veces in Counter(lista + [f"{a} {b}" for a, b in zip(lista, lista[1:])]).items():
+            huella = zlib.crc32(rasgo.encode("utf-8"))
+            peso = 1.0 + math.log(veces)
+            matriz[fila, huella % dimension] += peso if huella & 0x80000000 else -peso
+    return matriz
+
+
+def cargar_funcion_embeddings(nombre=FUNCION_EMBEDDINGS):
+    """Función de embeddings configurada como ``modulo:funcion`` (o la de hashing si no hay ninguna)"""
+    if not nombre:
+        return embeddings_hashing
+    modulo, _, funcion = nombre.partition(":")
+    return getattr(importlib.import_module(modulo), funcion)
+
+
+def vectorizar(textos, funcion):
+    """Embeddings normalizados (norma 1) en float32, para que el coseno sea un producto escalar"""
+    import numpy as np
+    matriz = np.asarray(funcion(textos), dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    return matriz / np.where(normas == 0, 1, normas)
+
+
+# ---------------------------------------------------------------------------
+# Índice
+# ---------------------------------------------------------------------------
+
+class IndiceDocumentos:
+    """Matriz de embeddings en disco, textos de los fragmentos y manifiesto de archivos ingeridos.
+
+    Archivos en ``ruta``: ``vectores.f32`` (filas float32 anexadas),
+    ``textos.bin`` con sus ``finales.u64`` (fin de cada texto) y
+    ``manifiesto.json`` (rango de filas activo y conversación propietaria de
+    cada archivo y generación de los datos: a partir de la primera compactación, ``vectores.<n>.f32``,
+    ``textos.<n>.bin`` y ``finales.<n>.u64``)."""
+
+    def __init__(self, ruta=RUTA_INDICE, funcion=None, nombre_funcion=FUNCION_EMBEDDINGS):
+        self.ruta = ruta
+        self.funcion = funcion or cargar_funcion_embeddings(nombre_funcion)
+        self.nombre_funcion = nombre_funcion or f"hashing-{DIMENSION_HASHING}"
+        self._lock = threading.Lock()
+        self._abierto = None  # (mtime del manifiesto, matriz, finales, filas activas, textos, documentos)
+        self._lock_textos = threading.Lock()
+        os.makedirs(ruta, exist_ok=True)
+        self.manifiesto = self._leer_manifiesto()
+
+    def _archivo(self, nombre):
+        return os.path.join(self.ruta, nombre)
+
+    def _leer_manifiesto(self):
+        try:
+            with open(self._archivo("manifiesto.json"), encoding="utf-8") as archivo:
+                return json.load(archivo)
+        except (OSError, ValueError):
+            return {"embeddings": self.nombre_funcion, "dimension": None, "filas": 0, "documentos": {}}
+
+    def _guardar_manifiesto(self):
+        temporal = self._archivo("manifiesto.json.tmp")
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            json.dump(self.manifiesto, archivo, ensure_ascii=False)
+        os.replace(temporal, self._archivo("manifiesto.json"))
+
+    def _datos(self, nombre, generacion=None):
+        """Ruta de ``nombre`` (p. ej. ``"textos.bin"``) en la generación indicada o en la actual"""
+        if generacion is None:
+            generacion = self.manifiesto.get("generacion", 0)
+        if generacion:
+            base, extension = os.path.splitext(nombre)
+            nombre = f"{base}.{generacion}{extension}"
+        return self._archivo(nombre)
+
+    def _borrar_generacion(self, generacion):
+        for nombre in ARCHIVOS_DATOS:
+            if os.path.exists(self._datos(nombre, generacion)):
+                os.remove(self._datos(nombre, generacion))
+
+    def _vaciar(self):
+        """Empieza una generación vacía; devuelve la anterior, que se borra tras guardar el manifiesto"""
+        anterior = self.manifiesto.get("generacion", 0)
+        self.manifiesto = {"embeddings": self.nombre_funcion, "dimension": None, "filas": 0, "documentos": {},
+                           "generacion": anterior + 1}
+        self._borrar_generacion(anterior + 1)
+        return anterior
+
+    def _tamanos(self):
+        return {
+            nombre: os.path.getsize(self._datos(nombre)) if os.path.exists(self._datos(nombre)) else 0
+            for nombre in ARCHIVOS_DATOS
+        }
+
+    def ingerir(self, ruta_documento, propietario=""):
+        """Trocea, vectoriza y anexa un archivo de ``propietario``; devuelve el número de fragmentos.
+
+        Si falla a medias, los archivos se truncan al tamaño anterior para que
+        la matriz siga coincidiendo con el manifiesto."""
+        tamanos = self._tamanos()
+        try:
+            return self._anexar(ruta_documento, propietario, tamanos["textos.bin"])
+        except BaseException:
+            for nombre, tamano in tamanos.items():
+                if os.path.exists(self._datos(nombre)):
+                    os.truncate(self._datos(nombre), tamano)
+            raise
+
+    def _anexar(self, ruta_documento, propietario, fin_texto):
+        import numpy as np
+        inicio = self.manifiesto["filas"]
+        filas = inicio
+        nombre = os.path.basename(ruta_documento)
+        with open(self._datos("vectores.f32"), "ab") as vectores, \
+                open(self._datos("textos.bin"), "ab") as textos, \
+                open(self._datos("finales.u64"), "ab") as finales:
+            lote = []
+
+            def volcar():
+                nonlocal filas, fin_texto
+                matriz = vectorizar(lote, self.funcion)
+                if self.manifiesto["dimension"] is None:
+                    self.manifiesto["dimension"] = int(matriz.shape[1])
+                elif matriz.shape[1] != self.manifiesto["dimension"]:
+                    raise ValueError("La función de embeddings cambió de dimensión; reindexe desde cero")
+                vectores.write(matriz.tobytes())
+                finales_lote = []
+                for texto in lote:
+                    datos = json.dumps({"documento": nombre, "texto": texto}, ensure_ascii=False).encode("utf-8")
+                    textos.write(datos)
+                    fin_texto += len(datos)
+                    finales_lote.append(fin_texto)
+                finales.write(np.array(finales_lote, dtype=np.uint64).tobytes())
+                filas += len(lote)
+                lote.clear()
+
+            for fragmento in fragmentar(leer_bloques(ruta_documento)):
+                lote.append(fragmento)
+                if len(lote) >= LOTE_EMBEDDINGS:
+                    volcar()
+            if lote:
+                volcar()
+        estado = os.stat(ruta_documento)
+        self.manifiesto["filas"] = filas
+        self.manifiesto["documentos"][clave_documento(ruta_documento, propietario)] = {
+            "mtime": estado.st_mtime, "tamano": estado.st_size, "inicio": inicio, "fin": filas,
+            "propietario": propietario,
+        }
+        return filas - inicio
+
+    def indexar(self, rutas, propietario=""):
+        """Ingesta incremental; devuelve (archivos ingeridos, sin cambios, retirados, fallidos).
+
+        Los documentos quedan a nombre de ``propietario`` (una conversación;
+        vacío = corpus compartido) y solo se retiran los suyos que ya no están
+        en ``rutas``. ``fallidos`` es una lista de ``(ruta, error)``: un
+        archivo ilegible no impide ingerir los demás."""
+        with self._lock:
+            obsoletas = []
+            if self.manifiesto["embeddings"] != self.nombre_funcion:
+                # Vectores de otra función de embeddings no son comparables: se empieza de cero
+                obsoletas.append(self._vaciar())
+            documentos = self.manifiesto["documentos"]
+            vigentes = set()
+            ingeridos = conservados = 0
+            fallidos = []
+            for ruta_documento in archivos_fuente(rutas, self.ruta):
+                clave = clave_documento(ruta_documento, propietario)
+                vigentes.add(clave)
+                estado = os.stat(ruta_documento)
+                anterior = documentos.get(clave)
+                if anterior and anterior["mtime"] == estado.st_mtime and anterior["tamano"] == estado.st_size:
+                    conservados += 1
+                    continue
+                # Las filas de la versión anterior quedan inactivas al sustituir su entrada
+                try:
+                    self.ingerir(ruta_documento, propietario)
+                except Exception as error:
+                    fallidos.append((ruta_documento, error))
+                    continue
+                ingeridos += 1
+            retirados = [clave for clave, documento in documentos.items()
+                         if documento.get("propietario", "") == propietario and clave not in vigentes]
+            for clave in retirados:
+                del documentos[clave]
+            activas = sum(d["fin"] - d["inicio"] for d in documentos.values())
+            if self.manifiesto["filas"] > 2 * activas:
+                obsoletas.append(self._compactar())
+            self._guardar_manifiesto()
+            # Quien aún tenga abierta una generación anterior la sigue leyendo (en POSIX) hasta reabrir
+            for generacion in obsoletas:
+                self._borrar_generacion(generacion)
+            return ingeridos, conservados, len(retirados), fallidos
+
+    def _compactar(self):
+        """Escribe una generación nueva solo con las filas activas; devuelve la anterior.
+
+        Los archivos de la generación actual no se tocan, así que un fallo a
+        medias solo deja archivos huérfanos de la nueva, que se descartan."""
+        import numpy as np
+        anterior = self.manifiesto.get("generacion", 0)
+        nueva = anterior + 1
+        matriz, finales = self._mapear()
+        partes = sorted(self.manifiesto["documentos"].values(), key=lambda documento: documento["inicio"])
+        rangos = []
+        try:
+            with open(self._datos("vectores.f32", nueva), "wb") as vectores, \
+                    open(self._datos("textos.bin", nueva), "wb") as textos, \
+                    open(self._datos("textos.bin", anterior), "rb") as textos_anteriores, \
+                    open(self._datos("finales.u64", nueva), "wb") as nuevos_finales:
+                filas = fin_texto = 0
+                for documento in partes:
+                    inicio, fin = documento["inicio"], documento["fin"]
+                    vectores.write(np.ascontiguousarray(matriz[inicio:fin]).tobytes())
+                    desde = int(finales[inicio - 1]) if inicio else 0
+                    textos_anteriores.seek(desde)
+                    textos.write(textos_anteriores.read(int(finales[fin - 1]) - desde if fin > inicio else 0))
+                    nuevos_finales.write((finales[inicio:fin].astype(np.int64) - desde + fin_texto).astype(np.uint64).tobytes())
+                    fin_texto += (int(finales[fin - 1]) - desde) if fin > inicio else 0
+                    rangos.append((filas, filas + fin - inicio))
+                    filas += fin - inicio
+        except BaseException:
+            self._borrar_generacion(nueva)
+            raise
+        del matriz, finales
+        for documento, (inicio, fin) in zip(partes, rangos):
+            documento["inicio"], documento["fin"] = inicio, fin
+        self.manifiesto["filas"] = filas
+        self.manifiesto["generacion"] = nueva
+        self._abierto = None
+        return anterior
+
+    def _mapear(self):
+        import numpy as np
+        filas, dimension = self.manifiesto["filas"], self.manifiesto["dimension"]
+        if not filas:
+            return np.zeros((0, dimension or 1), dtype=np.float32), np.zeros(0, dtype=np.uint64)
+        return (np.memmap(self._datos("vectores.f32"), dtype=np.float32, mode="r", shape=(filas, dimension)),
+                np.memmap(self._datos("finales.u64"), dtype=np.uint64, mode="r", shape=(filas,)))
+
+    def _version(self):
+        try:
+            return os.stat(self._archivo("manifiesto.json")).st_mtime_ns
+        except OSError:
+            return None
+
+    def _abrir(self):
+        """Matriz mapeada, filas activas, textos abiertos y documentos del manifiesto leído con ellos.
+
+        Se vuelven a abrir si otro proceso reindexó.
+
+        Los textos se leen siempre del archivo abierto junto con la matriz,
+        nunca por su nombre, para no mezclar dos generaciones."""
+        import numpy as np
+        version = self._version()
+        with self._lock:
+            if self._abierto is None or self._abierto[0] != version:
+                for intento in range(3):
+                    self.manifiesto = self._leer_manifiesto()
+                    try:
+                        matriz, finales = self._mapear()
+                        textos = open(self._datos("textos.bin"), "rb") if len(finales) else None
+                        break
+                    except FileNotFoundError:
+                        # Otra compactación borró esta generación entre leer el manifiesto y abrirla
+                        if intento == 2:
+                            raise
+                        version = self._version()
+                documentos = [dict(documento) for documento in self.manifiesto["documentos"].values()]
+                activas = np.zeros(len(matriz), dtype=bool)
+                for documento in documentos:
+                    activas[documento["inicio"]:documento["fin"]] = True
+                self._abierto = (version, matriz, finales, activas, textos, documentos)
+            return self._abierto[1:]
+
+    def fragmento(self, fila, finales, textos):
+        """Documento y texto de una fila de la matriz (``textos`` es el archivo abierto por ``_abrir``)"""
+        desde = int(finales[fila - 1]) if fila else 0
+        with self._lock_textos:
+            textos.seek(desde)
+            datos = json.loads(textos.read(int(finales[fila]) - desde))
+        return datos["documento"], datos["texto"]
+
+    def buscar(self, consultas, k=FRAGMENTOS_POR_CONSULTA, minimo=SIMILITUD_MINIMA, propietarios=None):
+        """Para cada consulta, los ``k`` fragmentos más parecidos como (similitud, documento, texto).
+
+        Con ``propietarios`` (conjunto de conversaciones; ``""`` = corpus
+        compartido) solo se consideran los documentos de esos propietarios."""
+        import numpy as np
+        matriz, finales, activas, textos, documentos = self._abrir()
+        if propietarios is not None:
+            activas = np.zeros(len(matriz), dtype=bool)
+            for documento in documentos:
+                if documento.get("propietario", "") in propietarios:
+                    activas[documento["inicio"]:documento["fin"]] = True
+        if not len(matriz) or not activas.any():
+            return [[] for _ in consultas]
+        if self.manifiesto["embeddings"] != self.nombre_funcion:
+            raise ValueError("El índice se creó con otra función de embeddings; reindexe los documentos")
+        preguntas = vectorizar(list(consultas), self.funcion)
+        mejores = [[] for _ in consultas]
+        # Todas las consultas se comparan a la vez contra cada bloque de filas de la matriz
+        for inicio in range(0, len(matriz), FILAS_POR_BLOQUE):
+            bloque = np.asarray(matriz[inicio:inicio + FILAS_POR_BLOQUE])
+            similitudes = preguntas @ bloque.T
+            similitudes[:, ~activas[inicio:inicio + FILAS_POR_BLOQUE]] = -1.0
+            n = min(k, similitudes.shape[1])
+            candidatos = np.argpartition(-similitudes, n - 1, axis=1)[:, :n]
+            for i, filas in enumerate(candidatos):
+                mejores[i].extend((float(similitudes[i, fila]), inicio + int(fila)) for fila in filas)
+        resultados = []
+        for lista in mejores:
+            lista.sort(reverse=True)
+            resultados.append([
+                (similitud, *self.fragmento(fila, finales, textos))
+                for similitud, fila in lista[:k] if similitud >= minimo
+            ])
+        return resultados
+
+
+def clave_documento(ruta_documento, propietario=""):
+    """Clave del manifiesto: el mismo archivo ingerido por dos conversaciones son dos documentos"""
+    ruta = os.path.abspath(ruta_documento)
+    return f"{propietario}:{ruta}" if propietario else ruta
+
+
+def archivos_fuente(rutas, ruta_indice=RUTA_INDICE):
+    """Documentos admitidos en las rutas indicadas (archivos o directorios)"""
+    excluido = os.path.abspath(ruta_indice)
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for raiz, directorios, nombres in os.walk(ruta):
+                directorios[:] = [d for d in directorios if os.path.abspath(os.path.join(raiz, d)) != excluido]
+                for nombre in sorted(nombres):
+                    if nombre.lower().endswith(EXTENSIONES):
+                        yield os.path.join(raiz, nombre)
+        elif os.path.exists(ruta):
+            yield ruta
+
+
+_indice = None
+_lock_indice = threading.Lock()
+
+
+def obtener_indice_documentos():
+    """Índice compartido por todo el proceso; detecta las reindexaciones hechas desde la línea de comandos"""
+    global _indice
+    if _indice is None:
+        with _lock_indice:
+            if _indice is None:
+                _indice = IndiceDocumentos()
+    return _indice
+
+
+def hay_documentos():
+    """Si existe algún documento ingerido (sin importar NumPy ni abrir la matriz)"""
+    return os.path.exists(os.path.join(RUTA_INDICE, "manifiesto.json"))
+
+
+# Encabezado con el que los fragmentos se añaden al contexto de la IA
+ENCABEZADO_FRAGMENTOS = "Fragmentos relevantes de los documentos del usuario:"
+
+
+def contexto_con_documentos(consulta, contexto="", k=FRAGMENTOS_POR_CONSULTA, conversacion=""):
+    """Añade al contexto de la IA los fragmentos de los documentos más relevantes para la consulta.
+
+    Solo se buscan los documentos de ``conversacion`` y, con
+    ``DOCUMENTOS_COMPARTIDOS=1``, los del corpus compartido. Devuelve
+    ``(contexto, fragmentos)``; sin documentos que consultar, el contexto no cambia."""
+    propietarios = ({conversacion} if conversacion else set()) | ({""} if COMPARTIDOS else set())
+    if not propietarios or not hay_documentos():
+        return contexto, []
+    fragmentos = obtener_indice_documentos().buscar([consulta], k, propietarios=propietarios)[0]
+    if not fragmentos:
+        return contexto, []
+    extractos = "\n\n".join(f"[{documento}] {texto}" for _, documento, texto in fragmentos)
+    prefijo = f"{contexto}\n\n" if contexto else ""
+    return f"{prefijo}{ENCABEZADO_FRAGMENTOS}\n{extractos}", fragmentos
+
+
+def separar_fragmentos(contexto):
+    """Inversa de ``contexto_con_documentos``: ``(contexto original, extractos en orden de relevancia)``"""
+    base, separador, extractos = contexto.partition(ENCABEZADO_FRAGMENTOS + "\n")
+    if not separador:
+        return contexto, []
+    return base.rstrip("\n"), extractos.split("\n\n")
+
+
+def main(argumentos=None):
+    argumentos = sys.argv[1:] if argumentos is None else argumentos
+    # ``--conversacion <id>`` justo tras la orden: documentos de esa conversación en vez del corpus compartido
+    conversacion = None
+    if argumentos[1:2] == ["--conversacion"] and len(argumentos) > 2:
+        conversacion = argumentos[2]
+        argumentos = argumentos[:1] + argumentos[3:]
+    if argumentos[:1] == ["indexar"]:
+        indice = obtener_indice_documentos()
+        ingeridos, conservados, retirados, fallidos = indice.indexar(argumentos[1:] or [RUTA_FUENTES],
+                                                                     conversacion or "")
+        manifiesto = indice.manifiesto
+        for ruta, error in fallidos:
+            print(f"No se pudo ingerir {ruta}: {error}", file=sys.stderr)
+        print(f"Documentos: {ingeridos} ingeridos, {conservados} sin cambios, {retirados} retirados")
+        print(f"Fragmentos en la matriz: {manifiesto['filas']} (dimensión {manifiesto['dimension']})")
+        return 0
+    if argumentos[:1] == ["buscar"] and len(argumentos) > 1:
+        propietarios = None if conversacion is None else {conversacion}
+        consulta = " ".join(argumentos[1:])
+        for similitud, documento, texto in obtener_indice_documentos().buscar([consulta], propietarios=propietarios)[0]:
+            print(f"{similitud:5.2f}  [{documento}] {texto[:160]}")
+        return 0
+    print("Uso: python documentos.py indexar [--conversacion <id>] [rutas...]"
+          " | buscar [--conversacion <id>] <consulta>", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
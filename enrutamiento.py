@@ -0,0 +1,63 @@
+"""Enrutamiento de las consultas a la IA según la intención y la longitud.
+
+Cada ruta fija el modelo, el máximo de tokens de respuesta y la temperatura.
+Las reglas se evalúan en orden y gana la primera que coincide con el tipo de
+solicitud detectado y con la longitud estimada (en tokens) de la consulta; la
+última regla sin condiciones hace de ruta por defecto. Las reglas se leen de
+``rutas_ia.json`` (o del archivo indicado en ``IA_RUTAS_ARCHIVO``)::
+
+    [
+      {"nombre": "variables_corta", "tipos": ["variables"], "max_tokens_entrada": 200,
+       "modelo": "gpt-4o-mini", "max_tokens": 700, "temperatura": 0.3},
+      {"nombre": "general", "modelo": "gpt-4", "max_tokens": 1500, "temperatura": 0.7}
+    ]
+
+Cada llamada registra su latencia y su coste con la etiqueta de la ruta, para
+poder ajustar la tabla con datos reales.
+"""
+import json
+import os
+from collections import namedtuple
+
+from contexto_conversacion import estimar_tokens
+from intenciones import analizar_consulta
+
+Ruta = namedtuple("Ruta", ["nombre", "modelo", "max_tokens", "temperatura"])
+
+# Ruta usada si no hay archivo de configuración o ninguna regla coincide
+RUTA_POR_DEFECTO = Ruta("general", "gpt-4", 1500, 0.7)
+
+RUTA_ARCHIVO_RUTAS = os.environ.get(
+    "IA_RUTAS_ARCHIVO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rutas_ia.json")
+)
+
+
+def leer_reglas(ruta_archivo=RUTA_ARCHIVO_RUTAS):
+    """Lee la tabla de rutas; sin archivo, todas las consultas usan ``RUTA_POR_DEFECTO``"""
+    if not os.path.exists(ruta_archivo):
+        return []
+    with open(ruta_archivo, encoding="utf-8") as archivo:
+        reglas = json.load(archivo)
+    for regla in reglas:
+        faltan = {"nombre", "modelo", "max_tokens", "temperatura"} - set(regla)
+        if faltan:
+            raise ValueError(f"Regla de enrutamiento incompleta en {ruta_archivo}: faltan {sorted(faltan)}")
+    return reglas
+
+
+def elegir_ruta(mensaje_usuario, contexto="", tipo=None, reglas=None):
+    """Ruta para una consulta; ``tipo`` evita repetir la detección de intención si ya se conoce"""
+    if tipo is None:
+        tipo = analizar_consulta(mensaje_usuario).tipo
+    tokens_entrada = estimar_tokens(mensaje_usuario) + (estimar_tokens(contexto) if contexto else 0)
+    for regla in REGLAS if reglas is None else reglas:
+        if "tipos" in regla and tipo not in regla["tipos"]:
+            continue
+        if tokens_entrada > regla.get("max_tokens_entrada", float("inf")):
+            continue
+        return Ruta(regla["nombre"], regla["modelo"], regla["max_tokens"], regla["temperatura"])
+    return RUTA_POR_DEFECTO
+
+
+# Tabla cargada una sola vez por proceso
+REGLAS = leer_reglas()
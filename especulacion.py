@@ -0,0 +1,193 @@
+"""Pregeneración especulativa de las secciones de la Búsqueda Rápida en modo IA.
+
+Con la opción activada, cuando el tema y el contexto de la pestaña dejan de
+cambiar durante ``ESPECULACION_ESPERA`` segundos, las secciones que más se
+piden se generan en segundo plano y quedan en la caché de respuestas. Al pulsar
+el botón de una sección ya generada, la respuesta sale de la caché al momento;
+si aún se está generando, la consulta se une a la llamada en curso (ver
+``coalescencia.py``) en lugar de empezar otra.
+
+El trabajo especulativo está acotado:
+
+- cada sesión tiene un presupuesto de ``ESPECULACION_PRESUPUESTO_TOKENS``
+  tokens (estimados como en el limitador: prompt más el máximo de respuesta);
+- se ejecuta en un pool de ``ESPECULACION_HILOS`` hilos común al proceso;
+- una sección no se empieza si hay consultas reales esperando turno en el
+  limitador de la IA;
+- al cambiar el tema o el contexto, lo que no había empezado se cancela. Las
+  llamadas ya enviadas no se pueden retirar (otras sesiones pueden estar
+  unidas a ellas); terminan y su respuesta queda en la caché.
+
+Las métricas ``especulacion_total`` (por resultado) y
+``especulacion_tokens_total`` (aprovechados / desperdiciados) muestran cuánto
+trabajo especulativo se usó de verdad.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_respuestas import obtener_cache
+from cliente_ia import CLAVE_SIN_CONFIGURAR, clave_por_defecto
+from enrutamiento import elegir_ruta
+from generadores import instruccion_ia_seccion
+from limitador import limitador_ia
+from metricas import metricas
+from plantillas import secciones as secciones_registradas
+from respuestas_ia import clave_respuesta_ia, construir_mensajes_ia, solicitar_respuesta_ia, tokens_reservados
+
+ESPERA_SEGUNDOS = float(os.environ.get("ESPECULACION_ESPERA", "1.5"))
+PRESUPUESTO_TOKENS = int(os.environ.get("ESPECULACION_PRESUPUESTO_TOKENS", "12000"))
+HILOS_ESPECULACION = int(os.environ.get("ESPECULACION_HILOS", "2"))
+# Secciones que se pregeneran como mucho cada vez que cambia el tema
+MAX_SECCIONES = int(os.environ.get("ESPECULACION_SECCIONES", "4"))
+
+
+def secciones_probables(limite=MAX_SECCIONES):
+    """Secciones ordenadas por las veces que se han pedido en este proceso (empates en el orden del registro)"""
+    registradas = secciones_registradas()
+    return sorted(
+        registradas, key=lambda seccion: (-metricas.valor("seccion_rapida_total", seccion=seccion),
+                                          registradas.index(seccion))
+    )[:limite]
+
+
+_pool = None
+_lock_pool = threading.Lock()
+
+
+def obtener_pool():
+    """Pool de hilos de la especulación, común a todas las sesiones del proceso"""
+    global _pool
+    if _pool is None:
+        with _lock_pool:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HILOS_ESPECULACION, thread_name_prefix="especulacion")
+    return _pool
+
+
+class Especulador:
+    """Trabajo especulativo de una sesión; se guarda en su ``session_state``"""
+
+    def __init__(self, presupuesto=PRESUPUESTO_TOKENS, espera=ESPERA_SEGUNDOS):
+        self.presupuesto = presupuesto
+        self.espera = espera
+        self.gastado = 0
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self._objetivo = None  # (tema, contexto) de la generación actual
+        self._temporizador = None
+        self._tareas = []
+        self._listas = {}  # sección -> tokens estimados, generadas y aún sin pedir
+        self._pedidas = set()
+
+    @property
+    def listas(self):
+        """Secciones del objetivo actual ya pregeneradas"""
+        with self._lock:
+            return list(self._listas)
+
+    @property
+    def agotado(self):
+        return self.gastado >= self.presupuesto
+
+    def programar(self, tema, contexto="", api_key=None):
+        """Pide pregenerar las secciones de ``(tema, contexto)`` cuando dejen de cambiar.
+
+        Se puede llamar en cada rerun: si el objetivo no cambió no hace nada."""
+        if not (api_key or clave_por_defecto() != CLAVE_SIN_CONFIGURAR) or not tema.strip():
+            return
+        with self._lock:
+            if self._objetivo == (tema, contexto):
+                return
+            self._descartar()
+            self._objetivo = (tema, contexto)
+            generacion = self._generacion
+            self._temporizador = threading.Timer(self.espera, self._lanzar, (generacion, tema, contexto, api_key))
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def detener(self):
+        """Cancela todo el trabajo pendiente (p. ej. al desactivar la opción)"""
+        with self._lock:
+            self._descartar()
+            self._objetivo = None
+
+    def usar(self, seccion, tema, contexto=""):
+        """Registra que se pidió ``seccion``; cuenta si estaba pregenerada o en curso"""
+        metricas.incrementar("seccion_rapida_total", seccion=seccion)
+        with self._lock:
+            if self._objetivo != (tema, contexto):
+                return
+            if seccion in self._listas:
+                metricas.incrementar("especulacion_total", resultado="aprovechada")
+                metricas.incrementar("especulacion_tokens_total", self._listas.pop(seccion), uso="aprovechados")
+            else:
+                # Si está en curso, se contará como aprovechada al terminar
+                self._pedidas.add(seccion)
+
+    def _descartar(self):
+        # Con el lock tomado: invalida la generación actual y cuenta lo que se pierde
+        self._generacion += 1
+        if self._temporizador:
+            self._temporizador.cancel()
+            self._temporizador = None
+        for tarea in self._tareas:
+            if tarea.cancel():
+                metricas.incrementar("especulacion_total", resultado="cancelada")
+        self._tareas = []
+        for tokens in self._listas.values():
+            metricas.incrementar("especulacion_total", resultado="desperdiciada")
+            metricas.incrementar("especulacion_tokens_total", tokens, uso="desperdiciados")
+        self._listas = {}
+        self._pedidas = set()
+
+    def _lanzar(self, generacion, tema, contexto, api_key):
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            pool = obtener_pool()
+            self._tareas = [
+                pool.submit(self._generar, generacion, seccion, tema, contexto, api_key)
+                for seccion in secciones_probables()
+            ]
+
+    def _generar(self, generacion, seccion, tema, contexto, api_key):
+        if generacion != self._generacion:
+            metricas.incrementar("especulacion_total", resultado="cancelada")
+            return
+        mensaje = instruccion_ia_seccion(seccion, tema)
+        ruta = elegir_ruta(mensaje, contexto)
+        if obtener_cache().contiene(clave_respuesta_ia(mensaje, contexto, ruta=ruta)):
+            # Ya estaba en la caché: el botón responderá al momento sin gastar nada
+            return
+        tokens = tokens_reservados(construir_mensajes_ia(mensaje, contexto, ruta=ruta), ruta)
+        with self._lock:
+            if generacion != self._generacion:
+                metricas.incrementar("especulacion_total", resultado="cancelada")
+                return
+            if self.gastado + tokens > self.presupuesto:
+                metricas.incrementar("especulacion_total", resultado="sin_presupuesto")
+                return
+            if limitador_ia.en_espera():
+                # Las consultas reales que esperan turno tienen prioridad
+                metricas.incrementar("especulacion_total", resultado="cola_ocupada")
+                return
+            self.gastado += tokens
+        try:
+            with metricas.cronometrar("especulacion"):
+                solicitar_respuesta_ia(mensaje, contexto, api_key)
+        except Exception as e:
+            metricas.incrementar("especulacion_total", resultado="error")
+            metricas.incrementar("errores_total", origen="especulacion", tipo=type(e).__name__)
+            return
+        metricas.incrementar("especulacion_total", resultado="generada")
+        with self._lock:
+            if generacion != self._generacion:
+                # El tema cambió mientras se generaba: la respuesta queda en la caché, sin usar
+                metricas.incrementar("especulacion_total", resultado="desperdiciada")
+                metricas.incrementar("especulacion_tokens_total", tokens, uso="desperdiciados")
+            elif seccion in self._pedidas:
+                metricas.incrementar("especulacion_total", resultado="aprovechada")
+                metricas.incrementar("especulacion_tokens_total", tokens, uso="aprovechados")
+            else:
+                self._listas[seccion] = tokens
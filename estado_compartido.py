@@ -0,0 +1,227 @@
+"""Backend del estado compartido: historial, caché, trabajos, cubos del limitador y métricas.
+
+Para repartir la app entre varios procesos de Streamlit detrás de un balanceador,
+todo lo que debe ser común a las sesiones se guarda a través de un backend
+intercambiable, elegido con ``ESTADO_BACKEND``:
+
+- ``archivo`` (por defecto): archivos SQLite en modo WAL en ``.cache/``. Lo
+  comparten todos los procesos de la máquina (o de un volumen compartido): el
+  historial, la caché de respuestas y los trabajos en segundo plano usan sus
+  propias bases de datos, y los cubos del limitador y las instantáneas de
+  métricas usan ``ESTADO_RUTA``.
+- ``proceso``: todo en memoria del proceso; para un único worker, pruebas o
+  entornos sin disco escribible.
+- ``modulo:Clase``: cualquier otra implementación con la misma interfaz.
+
+Para que el rendimiento crezca con el número de workers, las rutas calientes no
+escriben en el backend: los contadores se acumulan en memoria y cada proceso
+publica una instantánea cada ``ESTADO_INTERVALO_METRICAS`` segundos; solo las
+llamadas reales a la IA consultan los cubos compartidos.
+
+El estado de la interfaz (``st.session_state``, incluida la API key de cada
+sesión) no se comparte: la conversación se recupera de cualquier worker por el
+identificador de la URL, y la clave no se escribe nunca en disco.
+"""
+import importlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+BACKEND = os.environ.get("ESTADO_BACKEND", "archivo")
+RUTA_ESTADO = os.environ.get("ESTADO_RUTA", os.path.join(".cache", "estado.sqlite3"))
+INTERVALO_METRICAS = float(os.environ.get("ESTADO_INTERVALO_METRICAS", "5"))
+# Las instantáneas de procesos que ya no publican se descartan pasado este tiempo (unas pocas
+# publicaciones perdidas), para que un worker parado no siga pesando en los percentiles combinados
+RETENCION_INSTANTANEAS = float(os.environ.get("ESTADO_RETENCION", str(6 * INTERVALO_METRICAS)))
+
+# Cubo de tokens: se rellena de forma continua hasta ``capacidad`` a ``por_segundo`` unidades por segundo
+Cubo = namedtuple("Cubo", ["clave", "capacidad", "por_segundo"])
+
+
+def reponer(cubo, disponible, actualizado, ahora):
+    """Saldo de ``cubo`` en ``ahora`` partiendo de ``disponible`` en ``actualizado``"""
+    if disponible is None:
+        return cubo.capacidad
+    return min(cubo.capacidad, disponible + max(0.0, ahora - actualizado) * cubo.por_segundo)
+
+
+def segundos_para(cubo, disponible, cantidad):
+    """Tiempo hasta que ``cubo`` tenga ``cantidad`` unidades partiendo de ``disponible`` (0 si ya las tiene)"""
+    return max(0.0, (cantidad - disponible) / cubo.por_segundo)
+
+
+class EstadoEnProceso:
+    """Estado en la memoria del proceso; no se comparte con otros workers"""
+
+    multiproceso = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cubos = {}  # clave -> (disponible, actualizado)
+        self._instantaneas = {}  # clave -> (datos, publicada)
+
+    def almacen_historial(self):
+        from historial import AlmacenHistorialMemoria
+        return AlmacenHistorialMemoria()
+
+    def cache_respuestas(self):
+        from cache_respuestas import CacheMemoria
+        return CacheMemoria()
+
+    def almacen_trabajos(self):
+        from trabajos import AlmacenTrabajosMemoria
+        return AlmacenTrabajosMemoria()
+
+    def saldos(self, cubos):
+        """Saldo actual de cada cubo, sin consumir nada"""
+        ahora = time.time()
+        with self._lock:
+            return [reponer(cubo, *self._cubos.get(cubo.clave, (None, ahora)), ahora) for cubo in cubos]
+
+    def consumir(self, pedidos):
+        """Consume ``cantidad`` de cada ``(cubo, cantidad)`` solo si todos tienen saldo.
+
+        Devuelve 0 si se consumió, o los segundos que faltan para que haya saldo
+        en todos (sin consumir nada)."""
+        ahora = time.time()
+        with self._lock:
+            saldos = [reponer(cubo, *self._cubos.get(cubo.clave, (None, ahora)), ahora) for cubo, _ in pedidos]
+            espera = max(segundos_para(cubo, saldo, cantidad) for (cubo, cantidad), saldo in zip(pedidos, saldos))
+            if espera == 0:
+                for (cubo, cantidad), saldo in zip(pedidos, saldos):
+                    self._cubos[cubo.clave] = (saldo - cantidad, ahora)
+            return espera
+
+    def publicar(self, clave, datos):
+        with self._lock:
+            self._instantaneas[clave] = (datos, time.time())
+
+    def instantaneas(self, prefijo):
+        desde = time.time() - RETENCION_INSTANTANEAS
+        with self._lock:
+            return [datos for clave, (datos, publicada) in self._instantaneas.items()
+                    if clave.startswith(prefijo) and publicada >= desde]
+
+
+class EstadoArchivo:
+    """Estado en archivos SQLite (WAL) compartidos por todos los procesos que usan la misma ruta"""
+
+    multiproceso = True
+
+    def __init__(self, ruta=RUTA_ESTADO):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS cubos (
+                clave TEXT PRIMARY KEY,
+                disponible REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )
+        """)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS instantaneas (
+                clave TEXT PRIMARY KEY,
+                datos TEXT NOT NULL,
+                actualizada REAL NOT NULL
+            )
+        """)
+
+    def almacen_historial(self):
+        from historial import AlmacenHistorial
+        return AlmacenHistorial()
+
+    def cache_respuestas(self):
+        from cache_respuestas import CacheRespuestas
+        return CacheRespuestas()
+
+    def almacen_trabajos(self):
+        from trabajos import AlmacenTrabajos
+        return AlmacenTrabajos()
+
+    def _leer_cubos(self, cubos):
+        marcadores = ",".join("?" * len(cubos))
+        filas = dict((clave, (disponible, actualizado)) for clave, disponible, actualizado in self._conexion.execute(
+            f"SELECT clave, disponible, actualizado FROM cubos WHERE clave IN ({marcadores})",
+            [cubo.clave for cubo in cubos]
+        ))
+        ahora = time.time()
+        return [reponer(cubo, *filas.get(cubo.clave, (None, ahora)), ahora) for cubo in cubos], ahora
+
+    def saldos(self, cubos):
+        with self._lock:
+            return self._leer_cubos(cubos)[0]
+
+    def consumir(self, pedidos):
+        with self._lock:
+            # BEGIN IMMEDIATE: leer y descontar es atómico frente a los demás procesos
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                saldos, ahora = self._leer_cubos([cubo for cubo, _ in pedidos])
+                espera = max(segundos_para(cubo, saldo, cantidad) for (cubo, cantidad), saldo in zip(pedidos, saldos))
+                if espera == 0:
+                    self._conexion.executemany(
+                        "INSERT OR REPLACE INTO cubos (clave, disponible, actualizado) VALUES (?, ?, ?)",
+                        [(cubo.clave, saldo - cantidad, ahora) for (cubo, cantidad), saldo in zip(pedidos, saldos)]
+                    )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+        return espera
+
+    def publicar(self, clave, datos):
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO instantaneas (clave, datos, actualizada) VALUES (?, ?, ?)",
+                (clave, json.dumps(datos, ensure_ascii=False), ahora)
+            )
+            self._conexion.execute("DELETE FROM instantaneas WHERE actualizada < ?", (ahora - RETENCION_INSTANTANEAS,))
+
+    def instantaneas(self, prefijo):
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT datos FROM instantaneas WHERE substr(clave, 1, ?) = ? AND actualizada >= ?",
+                (len(prefijo), prefijo, time.time() - RETENCION_INSTANTANEAS)
+            ).fetchall()
+        return [json.loads(datos) for datos, in filas]
+
+
+BACKENDS = {"proceso": EstadoEnProceso, "archivo": EstadoArchivo}
+
+
+def crear_estado(nombre=BACKEND):
+    """Instancia el backend ``nombre`` (``proceso``, ``archivo`` o ``modulo:Clase``)"""
+    if nombre in BACKENDS:
+        return BACKENDS[nombre]()
+    modulo, _, clase = nombre.partition(":")
+    if not clase:
+        raise ValueError(f"Backend de estado desconocido: {nombre!r} (use proceso, archivo o modulo:Clase)")
+    return getattr(importlib.import_module(modulo), clase)()
+
+
+_estado = None
+_lock_estado = threading.Lock()
+
+
+def obtener_estado():
+    """Backend de estado del proceso; con un backend multiproceso empieza a publicar las métricas"""
+    global _estado
+    if _estado is None:
+        with _lock_estado:
+            if _estado is None:
+                estado = crear_estado()
+                if estado.multiproceso:
+                    from metricas import metricas
+                    metricas.publicar_periodicamente(estado, INTERVALO_METRICAS)
+                _estado = estado
+    return _estado
@@ -0,0 +1,120 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bibliografia import bloque_referencias
+from documentos import contexto_con_documentos
+from intenciones import analizar_consulta
+from metricas import metricas
+from plantillas import PLANTILLAS, renderizar_plantilla, secciones as secciones_registradas
+from respuestas_ia import generar_respuesta_ia
+
+# Funciones de procesamiento de lenguaje (el análisis real lo hace el motor compilado de intenciones)
+def extraer_tema_principal(user_input):
+    """Extrae el tema real de investigación del input del usuario"""
+    return analizar_consulta(user_input).tema
+
+def detectar_tipo_solicitud(user_input):
+    """Detecta el tipo de solicitud del usuario"""
+    return analizar_consulta(user_input).tipo
+
+# Funciones de generación de contenido MEJORADAS (las plantillas viven en el registro compartido)
+def generar_planteamiento_estructurado(tema, contexto=""):
+    """Genera un planteamiento del problema bien estructurado con excelente redacción"""
+    return renderizar_plantilla("planteamiento", tema, contexto)
+
+def generar_objetivos_estructurados(tema, contexto=""):
+    """Genera objetivos de investigación estructurados con redacción académica"""
+    return renderizar_plantilla("objetivos", tema, contexto)
+
+def generar_metodologia_sugerida(tema, contexto=""):
+    """Genera sugerencias metodológicas para el tema de investigación"""
+    return renderizar_plantilla("metodologia", tema, contexto)
+
+def generar_variables_investigacion(tema, contexto=""):
+    """Genera las variables de investigación asociadas al tema"""
+    return renderizar_plantilla("variables", tema, contexto)
+
+def generar_asesoria_general(tema, contexto=""):
+    """Genera una orientación general cuando no se detecta un tipo de solicitud concreto"""
+    return renderizar_plantilla("general", tema, contexto)
+
+def generar_seccion(tipo, tema, contexto=""):
+    """Genera cualquier tipo registrado; los tipos desconocidos reciben la asesoría general.
+    
+    Al final se añaden las referencias reales del catálogo local sobre el tema, si las hay."""
+    with metricas.cronometrar("plantilla"):
+        texto = renderizar_plantilla(tipo if tipo in PLANTILLAS else "general", tema, contexto)
+    with metricas.cronometrar("bibliografia"):
+        return texto + bloque_referencias(tema)
+
+# Instrucciones enviadas a la IA para generar cada sección de un borrador
+INSTRUCCIONES_IA = {
+    "planteamiento": "Formule el planteamiento del problema sobre {tema}",
+    "objetivos": "Genere objetivos de investigación (general y específicos) sobre {tema}",
+    "metodologia": "Sugiera una metodología para investigar {tema}",
+    "variables": "Identifique y operacionalice las variables de investigación para {tema}"
+}
+INSTRUCCION_IA_GENERICA = "Desarrolle la sección de {seccion} para una investigación sobre {tema}"
+
+def instruccion_ia_seccion(seccion, tema):
+    """Texto de la consulta a la IA para una sección del borrador"""
+    plantilla = INSTRUCCIONES_IA.get(seccion, INSTRUCCION_IA_GENERICA)
+    return plantilla.format(tema=tema, seccion=PLANTILLAS[seccion]["titulo"].lower())
+
+def generar_seccion_borrador(seccion, tema, contexto="", usar_ia=False, api_key=None):
+    """Genera una sección con la IA (con respuesta de respaldo si falla) o con su plantilla"""
+    if usar_ia:
+        return generar_respuesta_ia(instruccion_ia_seccion(seccion, tema), contexto, api_key)
+    return generar_seccion(seccion, tema, contexto)
+
+def generar_borrador(tema, contexto="", secciones=None, usar_ia=False, api_key=None):
+    """Genera todas las secciones a la vez y las devuelve a medida que terminan.
+    
+    Produce tuplas ``(seccion, texto, segundos)``; el tiempo total es el de la
+    sección más lenta y no la suma de todas."""
+    secciones = secciones or secciones_registradas()
+    
+    def generar(seccion):
+        inicio = time.perf_counter()
+        texto = generar_seccion_borrador(seccion, tema, contexto, usar_ia, api_key)
+        return seccion, texto, time.perf_counter() - inicio
+    
+    with ThreadPoolExecutor(max_workers=len(secciones)) as pool:
+        for tarea in as_completed([pool.submit(generar, seccion) for seccion in secciones]):
+            yield tarea.result()
+
+# Consulta lista para responder: intención detectada y contexto que se enviará a la IA
+ConsultaPreparada = namedtuple("ConsultaPreparada", ["analisis", "contexto", "fragmentos"])
+
+def preparar_consulta(user_input, contexto="", usar_ia=False, conversacion=""):
+    """Detecta la intención y, para la IA, añade al contexto los fragmentos de los documentos.
+    
+    Es la parte común del chat y de la API HTTP, sin llamadas a Streamlit;
+    solo se buscan los documentos de ``conversacion`` (y el corpus compartido,
+    si está habilitado). ``fragmentos`` son las tuplas de
+    ``documentos.contexto_con_documentos``."""
+    with metricas.cronometrar("deteccion_intencion"):
+        analisis = analizar_consulta(user_input)
+    fragmentos = []
+    if usar_ia:
+        # Solo los fragmentos más relevantes de los documentos ingeridos, no los documentos enteros
+        with metricas.cronometrar("recuperacion_documentos"):
+            contexto, fragmentos = contexto_con_documentos(user_input, contexto, conversacion=conversacion)
+    return ConsultaPreparada(analisis, contexto, fragmentos)
+
+# Despacho principal sin interfaz: lo usan el chat, los benchmarks y cualquier otro cliente
+def responder_consulta(user_input, contexto="", usar_ia=False, api_key=None, previos=None, analisis=None,
+                       al_esperar=None):
+    """Genera la respuesta a una consulta del chat sin llamar a Streamlit.
+    
+    ``analisis`` permite reutilizar el resultado de ``analizar_consulta`` si
+    quien llama ya lo calculó; ``al_esperar`` recibe los avisos de la cola de
+    la IA (ver ``limitador.py``)."""
+    if usar_ia:
+        return generar_respuesta_ia(user_input, contexto, api_key, previos, al_esperar)
+    if analisis is None:
+        with metricas.cronometrar("deteccion_intencion"):
+            analisis = analizar_consulta(user_input)
+    tipo_solicitud, tema_real = analisis
+    return generar_seccion(tipo_solicitud, tema_real, contexto)
@@ -0,0 +1,251 @@
+"""Historial de chat persistente y de solo anexado, con memoria acotada por sesión.
+
+Cada mensaje se guarda en SQLite (modo WAL) en cuanto se produce, asociado al
+identificador de la conversación. La sesión solo conserva en memoria una
+ventana con los mensajes más recientes; los anteriores se leen del disco cuando
+se piden (paginación hacia atrás, resumen del contexto). Así la memoria por
+sesión es constante aunque la conversación sea muy larga, y la conversación
+sobrevive a reinicios y redespliegues del worker.
+
+Exportación de una conversación sin cargarla entera en memoria::
+
+    python historial.py <conversacion> > conversacion.md
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Sequence
+
+from estado_compartido import obtener_estado
+
+RUTA_HISTORIAL = os.environ.get("HISTORIAL_RUTA", os.path.join(".cache", "historial.sqlite3"))
+# Mensajes más recientes que cada sesión mantiene en memoria
+VENTANA_MEMORIA = int(os.environ.get("HISTORIAL_VENTANA", "40"))
+# Filas que se leen del disco de cada vez al exportar
+FILAS_POR_LECTURA = 200
+
+_NOMBRES_ROL = {"user": "👤 Usted", "assistant": "🔬 Asistente"}
+
+
+class AlmacenHistorial:
+    """Mensajes de todas las conversaciones en SQLite, compartidos entre sesiones y procesos"""
+
+    def __init__(self, ruta=RUTA_HISTORIAL):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = self._conectar()
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS mensajes (
+                conversacion TEXT NOT NULL,
+                posicion INTEGER NOT NULL,
+                rol TEXT NOT NULL,
+                contenido TEXT NOT NULL,
+                creado REAL NOT NULL,
+                PRIMARY KEY (conversacion, posicion)
+            )
+        """)
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30, check_same_thread=False, isolation_level=None)
+
+    def anadir(self, conversacion, rol, contenido):
+        """Añade un mensaje al final de la conversación y devuelve su posición"""
+        with self._lock:
+            self._conexion.execute("BEGIN IMMEDIATE")
+            try:
+                posicion = self._conexion.execute(
+                    "SELECT COALESCE(MAX(posicion) + 1, 0) FROM mensajes WHERE conversacion = ?", (conversacion,)
+                ).fetchone()[0]
+                self._conexion.execute(
+                    "INSERT INTO mensajes (conversacion, posicion, rol, contenido, creado) VALUES (?, ?, ?, ?, ?)",
+                    (conversacion, posicion, rol, contenido, time.time())
+                )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+        return posicion
+
+    def contar(self, conversacion):
+        with self._lock:
+            return self._conexion.execute(
+                "SELECT COUNT(*) FROM mensajes WHERE conversacion = ?", (conversacion,)
+            ).fetchone()[0]
+
+    def leer(self, conversacion, inicio, fin):
+        """Mensajes con posición en ``[inicio, fin)``, en orden"""
+        with self._lock:
+            filas = self._conexion.execute(
+                "SELECT rol, contenido FROM mensajes WHERE conversacion = ? AND posicion >= ? AND posicion < ? "
+                "ORDER BY posicion",
+                (conversacion, inicio, fin)
+            ).fetchall()
+        return [{"role": rol, "content": contenido} for rol, contenido in filas]
+
+    def recorrer(self, conversacion, filas_por_lectura=FILAS_POR_LECTURA):
+        """Todos los mensajes de la conversación, leídos del disco por bloques.
+
+        Usa su propia conexión: en modo WAL la lectura no bloquea a quien
+        sigue escribiendo, y no retiene el lock del almacén mientras dura."""
+        conexion = self._conectar()
+        try:
+            cursor = conexion.execute(
+                "SELECT rol, contenido FROM mensajes WHERE conversacion = ? ORDER BY posicion", (conversacion,)
+            )
+            while True:
+                filas = cursor.fetchmany(filas_por_lectura)
+                if not filas:
+                    return
+                for rol, contenido in filas:
+                    yield {"role": rol, "content": contenido}
+        finally:
+            conexion.close()
+
+
+class AlmacenHistorialMemoria:
+    """Misma interfaz que ``AlmacenHistorial`` en memoria del proceso (backend de estado ``proceso``)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conversaciones = {}
+
+    def anadir(self, conversacion, rol, contenido):
+        with self._lock:
+            mensajes = self._conversaciones.setdefault(conversacion, [])
+            mensajes.append({"role": rol, "content": contenido})
+            return len(mensajes) - 1
+
+    def contar(self, conversacion):
+        with self._lock:
+            return len(self._conversaciones.get(conversacion, []))
+
+    def leer(self, conversacion, inicio, fin):
+        with self._lock:
+            return [dict(mensaje) for mensaje in self._conversaciones.get(conversacion, [])[inicio:fin]]
+
+    def recorrer(self, conversacion, filas_por_lectura=FILAS_POR_LECTURA):
+        inicio = 0
+        while True:
+            bloque = self.leer(conversacion, inicio, inicio + filas_por_lectura)
+            if not bloque:
+                return
+            yield from bloque
+            inicio += len(bloque)
+
+
+def exportar_markdown(almacen, conversacion):
+    """Conversación en Markdown, producida por trozos a medida que se lee del disco"""
+    yield f"# Conversación {conversacion}\n\n"
+    for mensaje in almacen.recorrer(conversacion):
+        yield f"**{_NOMBRES_ROL.get(mensaje['role'], mensaje['role'])}:**\n\n{mensaje['content']}\n\n---\n\n"
+
+
+class HistorialSesion(Sequence):
+    """Historial de una conversación tal como lo usa la sesión.
+
+    Se comporta como la lista de mensajes de siempre (``len``, índices,
+    cortes y ``append``), pero solo guarda en memoria los ``ventana``
+    mensajes más recientes; el resto se lee del almacén al pedirlo."""
+
+    def __init__(self, almacen, conversacion, ventana=VENTANA_MEMORIA):
+        self.almacen = almacen
+        self.conversacion = conversacion
+        self.total = almacen.contar(conversacion)
+        self.recientes = deque(almacen.leer(conversacion, max(0, self.total - ventana), self.total), maxlen=ventana)
+
+    @property
+    def inicio_memoria(self):
+        """Posición del primer mensaje que está en memoria"""
+        return self.total - len(self.recientes)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            inicio, fin, paso = indice.indices(self.total)
+            if paso != 1:
+                return list(self)[indice]
+            if fin <= inicio:
+                return []
+            if inicio >= self.inicio_memoria:
+                return list(self.recientes)[inicio - self.inicio_memoria:fin - self.inicio_memoria]
+            # Lo que falta en memoria se lee del disco; el resto sale de la ventana
+            desde_disco = self.almacen.leer(self.conversacion, inicio, min(fin, self.inicio_memoria))
+            if fin > self.inicio_memoria:
+                desde_disco.extend(list(self.recientes)[:fin - self.inicio_memoria])
+            return desde_disco
+        if indice < 0:
+            indice += self.total
+        if not 0 <= indice < self.total:
+            raise IndexError("mensaje fuera del historial")
+        if indice >= self.inicio_memoria:
+            return self.recientes[indice - self.inicio_memoria]
+        return self.almacen.leer(self.conversacion, indice, indice + 1)[0]
+
+    def __iter__(self):
+        # Recorre desde el disco por bloques sin cargar toda la conversación
+        return self.almacen.recorrer(self.conversacion)
+
+    def append(self, mensaje):
+        """Guarda el mensaje en disco y lo añade a la ventana en memoria"""
+        posicion = self.almacen.anadir(self.conversacion, mensaje["role"], mensaje["content"])
+        if posicion != self.total:
+            # Otros hilos o procesos añadieron mensajes entretanto: se leen junto con este
+            self.sincronizar()
+            return
+        self.recientes.append({"role": mensaje["role"], "content": mensaje["content"]})
+        self.total += 1
+
+    def sincronizar(self):
+        """Incorpora los mensajes que otros hilos o procesos añadieron a la conversación.
+
+        Devuelve cuántos mensajes nuevos había (p. ej. respuestas de trabajos en segundo plano)."""
+        total = self.almacen.contar(self.conversacion)
+        if total <= self.total:
+            return 0
+        self.recientes.extend(self.almacen.leer(self.conversacion, self.total, total))
+        nuevos, self.total = total - self.total, total
+        return nuevos
+
+
+def nueva_conversacion():
+    """Identificador aleatorio de una conversación nueva"""
+    return uuid.uuid4().hex
+
+
+_almacen = None
+_lock_almacen = threading.Lock()
+
+
+def obtener_almacen():
+    """Almacén compartido por todas las sesiones (y procesos, según el backend de ``estado_compartido``)"""
+    global _almacen
+    if _almacen is None:
+        with _lock_almacen:
+            if _almacen is None:
+                _almacen = obtener_estado().almacen_historial()
+    return _almacen
+
+
+def main(argumentos=None):
+    argumentos = sys.argv[1:] if argumentos is None else argumentos
+    if len(argumentos) != 1:
+        print("Uso: python historial.py <conversacion> > conversacion.md", file=sys.stderr)
+        return 2
+    for trozo in exportar_markdown(obtener_almacen(), argumentos[0]):
+        sys.stdout.write(trozo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Motor compilado de detección de intención y extracción del tema.
+
+Todas las tablas y expresiones se compilan una sola vez al importar el módulo.
+``analizar_consulta`` recorre el texto una única vez (tiempo lineal) y devuelve
+a la vez el tipo de solicitud y el tema limpio. Las palabras se comparan
+completas y sin tener en cuenta tildes, así «sobre» ya no se elimina de
+«sobrepeso» ni «metodologia» deja de reconocerse por escribirse sin tilde.
+
+Uso en bloque sobre registros de chat (una consulta por línea)::
+
+    python intenciones.py conversaciones.txt > clasificadas.tsv
+"""
+import re
+import sys
+from collections import namedtuple
+
+AnalisisConsulta = namedtuple("AnalisisConsulta", ["tipo", "tema"])
+
+# Orden de prioridad para resolver empates de puntuación
+TIPOS_SOLICITUD = ["planteamiento", "objetivos", "metodologia", "variables"]
+
+# Palabras clave (sin tildes) -> (tipo de solicitud, peso)
+PESOS_INTENCION = {
+    "planteamiento": ("planteamiento", 3),
+    "planteamientos": ("planteamiento", 3),
+    "problema": ("planteamiento", 2),
+    "problemas": ("planteamiento", 2),
+    "pregunta investigacion": ("planteamiento", 3),
+    "pregunta de investigacion": ("planteamiento", 3),
+    "preguntas de investigacion": ("planteamiento", 3),
+    "objetivo": ("objetivos", 2),
+    "objetivos": ("objetivos", 3),
+    "meta": ("objetivos", 1),
+    "metas": ("objetivos", 2),
+    "proposito": ("objetivos", 1),
+    "propositos": ("objetivos", 2),
+    "metodologia": ("metodologia", 3),
+    "metodologias": ("metodologia", 3),
+    "metodologica": ("metodologia", 2),
+    "metodologico": ("metodologia", 2),
+    "metodo": ("metodologia", 2),
+    "metodos": ("metodologia", 2),
+    "diseno": ("metodologia", 2),
+    "disenos": ("metodologia", 2),
+    "enfoque": ("metodologia", 2),
+    "enfoques": ("metodologia", 2),
+    "variable": ("variables", 2),
+    "variables": ("variables", 3),
+    "operacional": ("variables", 2),
+    "operacionalizacion": ("variables", 3),
+    "operacionalizar": ("variables", 3)
+}
+
+# Palabras y frases de la solicitud que no forman parte del tema (sin tildes)
+PALABRAS_EXCLUIR = frozenset([
+    "formula", "formule", "planteamiento", "problema", "interrogante",
+    "redacta", "redacte", "elabora", "elabore", "desarrolla", "desarrolle",
+    "haz", "haga", "crea", "cree", "genera", "genere",
+    "para la", "sobre", "acerca de", "necesito", "quiero", "dame"
+])
+
+# Interrogativos que introducen una pregunta de investigación (con tilde, como en la
+# pregunta original: sin tilde «que» o «como» son conjunciones y no preguntas)
+INTERROGATIVOS = frozenset(["qué", "cuáles", "cómo", "dónde", "cuándo", "por qué"])
+
+_SIN_TILDES = str.maketrans("áéíóúüàèìòùñ", "aeiouuaeioun")
+
+# Longitud máxima (en palabras) de las frases de las tablas anteriores y palabras
+# con las que terminan; solo en esas se buscan frases de varias palabras
+_MAX_FRASE = 3
+_FINALES_FRASE = set(
+    frase.rsplit(" ", 1)[-1].translate(_SIN_TILDES)
+    for frase in list(PESOS_INTENCION) + list(PALABRAS_EXCLUIR) + list(INTERROGATIVOS)
+    if " " in frase
+)
+
+_PATRON_PALABRA = re.compile(r"\w+")
+
+
+def quitar_tildes(texto):
+    """Elimina tildes y diéresis sin cambiar la longitud del texto"""
+    return texto.translate(_SIN_TILDES)
+
+
+def registrar_intencion(tipo, palabras_clave):
+    """Añade un tipo de solicitud con sus palabras o frases clave {texto: peso}.
+
+    Los tipos nuevos tienen menos prioridad que los existentes en caso de empate.
+    """
+    if tipo not in TIPOS_SOLICITUD:
+        TIPOS_SOLICITUD.append(tipo)
+    for frase, peso in palabras_clave.items():
+        frase = quitar_tildes(" ".join(frase.lower().split()))
+        if len(frase.split()) > _MAX_FRASE:
+            raise ValueError(f"Las frases clave admiten como máximo {_MAX_FRASE} palabras: {frase}")
+        PESOS_INTENCION[frase] = (tipo, peso)
+        if " " in frase:
+            _FINALES_FRASE.add(frase.rsplit(" ", 1)[-1])
+
+
+def analizar_consulta(texto):
+    """Devuelve el tipo de solicitud y el tema limpio del texto en una sola pasada"""
+    minusculas = texto.lower()
+    sin_tildes = quitar_tildes(minusculas)
+    puntuacion = dict.fromkeys(TIPOS_SOLICITUD, 0)
+
+    palabras = []          # (palabra en minúsculas, palabra sin tildes)
+    excluidas = []         # marcas de exclusión paralelas a ``palabras``
+    inicio_pregunta = -1   # posición del texto donde empieza la pregunta, si la hay
+
+    for coincidencia in _PATRON_PALABRA.finditer(minusculas):
+        inicio, fin = coincidencia.span()
+        palabra = coincidencia.group()
+        normalizada = sin_tildes[inicio:fin]
+        palabras.append((palabra, normalizada))
+        excluidas.append(False)
+
+        peso = PESOS_INTENCION.get(normalizada)
+        if peso is not None:
+            puntuacion[peso[0]] += peso[1]
+        if normalizada in PALABRAS_EXCLUIR:
+            excluidas[-1] = True
+        if inicio_pregunta < 0 and palabra in INTERROGATIVOS:
+            inicio_pregunta = fin
+        if normalizada not in _FINALES_FRASE:
+            continue
+
+        # Frases de 2 o 3 palabras que terminan en la palabra actual
+        frase_original = palabra
+        frase = normalizada
+        for longitud in range(2, min(_MAX_FRASE, len(palabras)) + 1):
+            anterior_original, anterior = palabras[-longitud]
+            frase_original = f"{anterior_original} {frase_original}"
+            frase = f"{anterior} {frase}"
+            peso = PESOS_INTENCION.get(frase)
+            if peso is not None:
+                puntuacion[peso[0]] += peso[1]
+            if frase in PALABRAS_EXCLUIR:
+                excluidas[-longitud:] = [True] * longitud
+            if inicio_pregunta < 0 and frase_original in INTERROGATIVOS:
+                inicio_pregunta = fin
+
+    tipo = max(TIPOS_SOLICITUD, key=lambda t: (puntuacion[t], -TIPOS_SOLICITUD.index(t)))
+    if puntuacion[tipo] == 0:
+        tipo = "general"
+
+    # Si hay una pregunta de investigación, el tema es lo que se pregunta
+    if inicio_pregunta >= 0:
+        cierre = minusculas.find("?", inicio_pregunta)
+        if cierre >= 0:
+            pregunta = minusculas[inicio_pregunta:cierre].strip()
+            if pregunta:
+                return AnalisisConsulta(tipo, pregunta)
+
+    tema = " ".join(palabra for (palabra, _), excluida in zip(palabras, excluidas) if not excluida)
+    return AnalisisConsulta(tipo, tema if tema else texto)
+
+
+def clasificar_lineas(lineas):
+    """Analiza un iterable de consultas de forma perezosa (para registros muy grandes)"""
+    for linea in lineas:
+        linea = linea.rstrip("\r\n")
+        if linea:
+            yield linea, analizar_consulta(linea)
+
+
+def main(argumentos=None):
+    argumentos = sys.argv[1:] if argumentos is None else argumentos
+    entrada = open(argumentos[0], encoding="utf-8") if argumentos else sys.stdin
+    with entrada:
+        for linea, analisis in clasificar_lineas(entrada):
+            sys.stdout.write(f"{analisis.tipo}\t{analisis.tema}\t{linea}\n")
+
+
+if __name__ == "__main__":
+    main()
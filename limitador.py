@@ -0,0 +1,204 @@
+"""Limitador de peticiones a la IA compartido por todas las sesiones del proceso.
+
+Cada API key tiene dos cubos de tokens (token bucket): uno de peticiones por
+minuto y otro de tokens por minuto (prompt estimado más el máximo de tokens de
+respuesta, que es lo que cuenta OpenAI). Las llamadas esperan su turno en una
+cola FIFO por key, de modo que una ráfaga se reparte en orden de llegada en vez
+de acabar en una tormenta de errores 429. El saldo de los cubos se guarda en el
+backend de ``estado_compartido``, así que la cuota es la misma para todos los
+procesos que atienden la app.
+
+- Control de admisión: si la espera estimada al llegar supera
+  ``IA_ESPERA_MAXIMA`` segundos, se rechaza al instante con ``ColaSaturada`` y
+  quien llama sirve la respuesta de plantilla.
+- Espera acotada: quien ya está en la cola tampoco espera más de ese plazo.
+- Mientras espera, quien llama puede consultar su posición y el tiempo estimado
+  para mostrarlos en la interfaz.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+from estado_compartido import Cubo, obtener_estado, segundos_para
+from metricas import metricas
+
+PETICIONES_POR_MINUTO = float(os.environ.get("IA_PETICIONES_POR_MINUTO", "60"))
+TOKENS_POR_MINUTO = float(os.environ.get("IA_TOKENS_POR_MINUTO", "150000"))
+ESPERA_MAXIMA = float(os.environ.get("IA_ESPERA_MAXIMA", "20"))
+
+# Aviso de espera en la cola: posición (1 = la siguiente) y segundos estimados
+EnCola = namedtuple("EnCola", ["posicion", "segundos"])
+
+
+class ColaSaturada(Exception):
+    """La espera en la cola de la IA superaría el máximo permitido; no se ha hecho ninguna llamada"""
+
+
+class Turno:
+    """Lugar de una llamada en la cola de su API key"""
+
+    def __init__(self, cola, tokens, plazo):
+        self.cola = cola
+        self.tokens = tokens
+        self.plazo = plazo
+        self.llegada = time.monotonic()
+
+    def posicion(self):
+        """Posición en la cola (1 = la siguiente en pasar, 0 = ya no está en la cola)"""
+        with self.cola.condicion:
+            return self.cola.turnos.index(self) + 1 if self in self.cola.turnos else 0
+
+    def aviso(self):
+        """Posición y espera estimada actuales, para mostrarlas mientras se espera"""
+        with self.cola.condicion:
+            return EnCola(self.posicion(), self.cola.espera_estimada(hasta=self))
+
+    def esperar(self, timeout=None):
+        """Espera como mucho ``timeout`` segundos a que llegue el turno.
+
+        Devuelve True si el turno llegó (y consume la cuota), False si sigue en
+        la cola, o lanza ``ColaSaturada`` si se agotó el plazo máximo."""
+        return self.cola.esperar(self, timeout)
+
+    def cancelar(self):
+        self.cola.retirar(self)
+
+
+class ColaClave:
+    """Cubos y cola de espera de una API key.
+
+    La cola es del proceso, pero el saldo de los cubos vive en el backend de
+    ``estado_compartido``: con varios workers, todos descuentan de la misma
+    cuota por minuto en vez de tener cada uno la suya."""
+
+    def __init__(self, huella, peticiones_por_minuto, tokens_por_minuto, estado):
+        self.condicion = threading.Condition()
+        self.estado = estado
+        self.peticiones = Cubo(f"ia:{huella}:peticiones", peticiones_por_minuto, peticiones_por_minuto / 60.0)
+        self.tokens = Cubo(f"ia:{huella}:tokens", tokens_por_minuto, tokens_por_minuto / 60.0)
+        self.turnos = deque()
+
+    def _ajustar(self, tokens):
+        # Una petición más grande que el cubo entero nunca podría pasar
+        return min(tokens, self.tokens.capacidad)
+
+    def espera_estimada(self, tokens=0, hasta=None):
+        """Segundos hasta poder atender a todos los turnos de la cola (hasta ``hasta``) más uno de ``tokens``"""
+        saldo_peticiones, saldo_tokens = self.estado.saldos([self.peticiones, self.tokens])
+        peticiones, demanda = (0, 0) if hasta is not None else (1, self._ajustar(tokens))
+        for turno in self.turnos:
+            peticiones += 1
+            demanda += turno.tokens
+            if turno is hasta:
+                break
+        return max(segundos_para(self.peticiones, saldo_peticiones, peticiones),
+                   segundos_para(self.tokens, saldo_tokens, demanda))
+
+    def pedir(self, tokens, espera_maxima):
+        with self.condicion:
+            espera = self.espera_estimada(tokens)
+            if espera > espera_maxima:
+                metricas.incrementar("ia_cola_rechazos_total")
+                raise ColaSaturada(f"La espera estimada ({espera:.0f} s) supera el máximo de {espera_maxima:.0f} s")
+            turno = Turno(self, self._ajustar(tokens), time.monotonic() + espera_maxima)
+            self.turnos.append(turno)
+            return turno
+
+    def esperar(self, turno, timeout=None):
+        limite = turno.plazo if timeout is None else min(turno.plazo, time.monotonic() + timeout)
+        with self.condicion:
+            while True:
+                pausa = None
+                if self.turnos and self.turnos[0] is turno:
+                    pausa = self.estado.consumir([(self.peticiones, 1), (self.tokens, turno.tokens)])
+                    if pausa == 0:
+                        self.turnos.popleft()
+                        self.condicion.notify_all()
+                        metricas.observar("cola_ia", time.monotonic() - turno.llegada)
+                        return True
+                ahora = time.monotonic()
+                if ahora >= turno.plazo:
+                    self.turnos.remove(turno)
+                    self.condicion.notify_all()
+                    metricas.incrementar("ia_cola_plazos_agotados_total")
+                    raise ColaSaturada("Se agotó el tiempo de espera en la cola de la IA")
+                if ahora >= limite:
+                    return False
+                self.condicion.wait(limite - ahora if pausa is None else min(pausa, limite - ahora))
+
+    def tomar(self, tokens):
+        """Consume la cuota de una petición solo si puede pasar ya, sin colarse delante de la cola"""
+        with self.condicion:
+            if self.turnos:
+                return False
+            return self.estado.consumir([(self.peticiones, 1), (self.tokens, self._ajustar(tokens))]) == 0
+
+    def retirar(self, turno):
+        with self.condicion:
+            if turno in self.turnos:
+                self.turnos.remove(turno)
+                self.condicion.notify_all()
+
+
+def huella_api_key(api_key):
+    """Hash corto de la API key: identifica a su titular sin guardar la clave"""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+
+
+class LimitadorIA:
+    """Una cola con sus cubos por API key; la key solo se guarda como hash"""
+
+    def __init__(self, peticiones_por_minuto=PETICIONES_POR_MINUTO, tokens_por_minuto=TOKENS_POR_MINUTO,
+                 espera_maxima=ESPERA_MAXIMA, estado=None):
+        self.estado = estado
+        self.peticiones_por_minuto = peticiones_por_minuto
+        self.tokens_por_minuto = tokens_por_minuto
+        self.espera_maxima = espera_maxima
+        self._lock = threading.Lock()
+        self._colas = {}
+
+    def cola(self, api_key):
+        huella = huella_api_key(api_key)
+        with self._lock:
+            cola = self._colas.get(huella)
+            if cola is None:
+                cola = self._colas[huella] = ColaClave(
+                    huella, self.peticiones_por_minuto, self.tokens_por_minuto, self.estado or obtener_estado()
+                )
+            return cola
+
+    def esperar_turno(self, api_key, tokens, intervalo=0.5):
+        """Entra en la cola y produce un ``EnCola`` cada ``intervalo`` segundos hasta que haya cuota.
+
+        Lanza ``ColaSaturada`` al entrar si la espera estimada es excesiva o
+        si después se agota el plazo máximo."""
+        turno = self.cola(api_key).pedir(tokens, self.espera_maxima)
+        try:
+            while not turno.esperar(intervalo):
+                yield turno.aviso()
+        except BaseException:
+            # Incluye el cierre del generador si quien espera abandona
+            turno.cancelar()
+            raise
+
+    def adquirir(self, api_key, tokens, al_esperar=None):
+        """Bloquea hasta que haya cuota; ``al_esperar(EnCola)`` se llama periódicamente mientras se espera"""
+        for aviso in self.esperar_turno(api_key, tokens):
+            if al_esperar:
+                al_esperar(aviso)
+
+    def intentar(self, api_key, tokens):
+        """Toma cuota sin esperar; devuelve False si no la hay ahora mismo (p. ej. para una copia de cobertura)"""
+        return self.cola(api_key).tomar(tokens)
+
+    def en_espera(self):
+        """Número total de llamadas esperando turno"""
+        with self._lock:
+            colas = list(self._colas.values())
+        return sum(len(cola.turnos) for cola in colas)
+
+
+# Limitador de las llamadas a OpenAI, compartido por todo el proceso
+limitador_ia = LimitadorIA()
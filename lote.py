@@ -0,0 +1,160 @@
+"""Generación por lotes de borradores de investigación sin la interfaz de Streamlit.
+
+Uso desde la línea de comandos::
+
+    python lote.py temas.jsonl borradores.jsonl --concurrencia 8
+    python lote.py temas.csv borradores.jsonl --ia --secciones planteamiento,objetivos
+
+Cada fila de entrada necesita ``tema`` y, opcionalmente, ``contexto`` e ``id``.
+Las filas repetidas (mismo ``id`` o, sin él, mismo tema y contexto) se generan
+una sola vez.
+Los resultados se escriben en JSONL (una línea por tema y sección) a medida que
+terminan. Si el proceso se interrumpe, al volver a lanzarlo con el mismo archivo
+de salida se omiten las secciones ya generadas, así no se vuelven a gastar tokens.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from generadores import generar_seccion, instruccion_ia_seccion
+from plantillas import PLANTILLAS, secciones as secciones_registradas
+from respuestas_ia import solicitar_respuesta_ia
+
+
+def identificador_fila(fila):
+    """Identificador estable de una fila: su columna ``id`` o un hash del tema y el contexto"""
+    if fila.get("id"):
+        return str(fila["id"])
+    base = f"{fila['tema'].strip()}\x1f{fila.get('contexto', '').strip()}"
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()[:16]
+
+
+def leer_filas(ruta):
+    """Lee las filas ``(tema, contexto)`` de un archivo JSONL o CSV"""
+    with open(ruta, encoding="utf-8", newline="") as archivo:
+        if ruta.lower().endswith(".csv"):
+            filas = csv.DictReader(archivo)
+        else:
+            filas = (json.loads(linea) for linea in archivo if linea.strip())
+        for fila in filas:
+            if not (fila.get("tema") or "").strip():
+                continue
+            fila["contexto"] = fila.get("contexto") or ""
+            fila["id"] = identificador_fila(fila)
+            yield fila
+
+
+def leer_completadas(ruta_salida):
+    """Pares ``(id, seccion)`` que ya están en el archivo de salida"""
+    completadas = set()
+    if not os.path.exists(ruta_salida):
+        return completadas
+    with open(ruta_salida, encoding="utf-8") as archivo:
+        for linea in archivo:
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                # Última línea truncada por una interrupción: se regenerará
+                continue
+            completadas.add((registro["id"], registro["seccion"]))
+    return completadas
+
+
+def generar_registro(fila, seccion, usar_ia=False, api_key=None):
+    """Genera una sección para una fila y devuelve el registro de salida"""
+    inicio = time.perf_counter()
+    if usar_ia:
+        instruccion = instruccion_ia_seccion(seccion, fila["tema"])
+        respuesta = solicitar_respuesta_ia(instruccion, fila["contexto"], api_key)
+    else:
+        respuesta = generar_seccion(seccion, fila["tema"], fila["contexto"])
+    return {
+        "id": fila["id"],
+        "tema": fila["tema"],
+        "contexto": fila["contexto"],
+        "seccion": seccion,
+        "modo": "ia" if usar_ia else "plantilla",
+        "respuesta": respuesta,
+        "segundos": round(time.perf_counter() - inicio, 4)
+    }
+
+
+def generar_lote(filas, ruta_salida, secciones=None, usar_ia=False, concurrencia=4, api_key=None):
+    """Genera las secciones pedidas para todas las filas con un pool de ``concurrencia`` hilos.
+
+    Los registros se añaden a ``ruta_salida`` conforme terminan; las secciones
+    que ya figuran en ese archivo se omiten, y también las filas cuyo ``id`` ya
+    apareció antes en ``filas`` (se pagarían dos veces y la reanudación no
+    podría distinguirlas). Devuelve un resumen de la ejecución.
+    """
+    secciones = secciones or secciones_registradas()
+    completadas = leer_completadas(ruta_salida)
+    resumen = {"generadas": 0, "omitidas": 0, "duplicadas": 0, "errores": 0}
+    vistas = set()
+    inicio = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool, \
+            open(ruta_salida, "a", encoding="utf-8") as salida:
+        tareas = {}
+        for fila in filas:
+            if fila["id"] in vistas:
+                resumen["duplicadas"] += 1
+                print(f"⚠️ Fila repetida {fila['id']} ({fila['tema']}): se omite", file=sys.stderr)
+                continue
+            vistas.add(fila["id"])
+            for seccion in secciones:
+                if (fila["id"], seccion) in completadas:
+                    resumen["omitidas"] += 1
+                    continue
+                tarea = pool.submit(generar_registro, fila, seccion, usar_ia, api_key)
+                tareas[tarea] = (fila["id"], seccion)
+
+        for tarea in as_completed(tareas):
+            try:
+                registro = tarea.result()
+            except Exception as e:
+                # No se escribe nada: la sección se reintentará en la próxima ejecución
+                resumen["errores"] += 1
+                print(f"❌ {tareas[tarea][0]} / {tareas[tarea][1]}: {e}", file=sys.stderr)
+                continue
+            salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            salida.flush()
+            resumen["generadas"] += 1
+
+    resumen["segundos"] = round(time.perf_counter() - inicio, 2)
+    return resumen
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Genera borradores de investigación para muchos temas a la vez")
+    parser.add_argument("entrada", help="Archivo JSONL o CSV con las columnas tema, contexto (opcional) e id (opcional)")
+    parser.add_argument("salida", help="Archivo JSONL de resultados (se reanuda si ya existe)")
+    parser.add_argument("--secciones", default=",".join(secciones_registradas()),
+                        help=f"Secciones separadas por comas (por defecto: {','.join(secciones_registradas())})")
+    parser.add_argument("--ia", action="store_true", help="Generar con la API de OpenAI en lugar de las plantillas")
+    parser.add_argument("--concurrencia", type=int, default=4, help="Número máximo de generaciones simultáneas")
+    parser.add_argument("--api-key", default=None, help="API key de OpenAI (por defecto OPENAI_API_KEY)")
+    args = parser.parse_args(argumentos)
+
+    secciones = [seccion.strip() for seccion in args.secciones.split(",") if seccion.strip()]
+    desconocidas = [seccion for seccion in secciones if seccion not in PLANTILLAS]
+    if desconocidas:
+        parser.error(f"secciones desconocidas: {', '.join(desconocidas)}")
+    if args.concurrencia < 1:
+        parser.error("--concurrencia debe ser al menos 1")
+
+    resumen = generar_lote(
+        leer_filas(args.entrada), args.salida, secciones,
+        usar_ia=args.ia, concurrencia=args.concurrencia, api_key=args.api_key
+    )
+    print(json.dumps(resumen, ensure_ascii=False))
+    return 1 if resumen["errores"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
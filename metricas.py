@@ -0,0 +1,286 @@
+"""Instrumentación de las rutas críticas: tiempos por etapa, tokens, coste y contadores.
+
+Las métricas se acumulan en un registro único por proceso (compartido por todas
+las sesiones de Streamlit) y se pueden exportar en formato de texto de
+Prometheus o en JSON. Con varios workers, cada uno publica periódicamente una
+instantánea en el backend de ``estado_compartido`` y ``combinadas()`` las suma.
+Si la variable de entorno ``METRICAS_LOG_JSON`` apunta a un archivo, cada
+llamada a la IA se añade además como una línea JSON.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Precio aproximado en USD por cada 1000 tokens: (prompt, respuesta)
+PRECIOS_MODELOS = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015)
+}
+
+# Muestras recientes que se conservan por etapa para calcular percentiles
+MUESTRAS_POR_ETAPA = 2048
+
+RUTA_LOG_JSON = os.environ.get("METRICAS_LOG_JSON")
+
+
+def _percentil(ordenadas, fraccion):
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(round(fraccion * (len(ordenadas) - 1))))]
+
+
+def _valor_etiqueta(valor):
+    """Valor de etiqueta escapado como exige el formato de texto de Prometheus"""
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ""
+    return "{" + ",".join(f'{nombre}="{_valor_etiqueta(valor)}"' for nombre, valor in etiquetas) + "}"
+
+
+class RegistroMetricas:
+    """Contadores y tiempos por etapa, seguros para usar desde varios hilos"""
+
+    def __init__(self, muestras=MUESTRAS_POR_ETAPA, ruta_log_json=RUTA_LOG_JSON):
+        self._lock = threading.Lock()
+        self._muestras = muestras
+        self._identificador = uuid.uuid4().hex[:8]
+        self.ruta_log_json = ruta_log_json
+        self.reiniciar()
+
+    def reiniciar(self):
+        """Borra todas las métricas acumuladas"""
+        with self._lock:
+            self._contadores = defaultdict(float)
+            self._indicadores = {}
+            self._tiempos = defaultdict(lambda: deque(maxlen=self._muestras))
+            self._totales = defaultdict(lambda: [0, 0.0])  # [número de mediciones, suma de segundos]
+            self.inicio = time.time()
+
+    def incrementar(self, nombre, cantidad=1, **etiquetas):
+        """Suma ``cantidad`` al contador ``nombre`` con las etiquetas indicadas"""
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] += cantidad
+
+    def fijar(self, nombre, valor, **etiquetas):
+        """Fija el valor actual de un indicador (por ejemplo, el estado de un cortacircuitos)"""
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._indicadores[clave] = valor
+
+    def observar(self, etapa, segundos):
+        """Registra la duración de una etapa"""
+        with self._lock:
+            self._tiempos[etapa].append(segundos)
+            total = self._totales[etapa]
+            total[0] += 1
+            total[1] += segundos
+
+    @contextmanager
+    def cronometrar(self, etapa):
+        """Mide el bloque ``with`` como una ejecución de ``etapa`` (también si lanza una excepción)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio)
+
+    def registrar_uso_ia(self, modelo, tokens_prompt, tokens_respuesta, segundos=None, ruta=None, **extra):
+        """Acumula tokens y coste estimado de una llamada a la IA (y su latencia por ruta, si se indica)"""
+        precio_prompt, precio_respuesta = PRECIOS_MODELOS.get(modelo, (0.0, 0.0))
+        coste = (tokens_prompt * precio_prompt + tokens_respuesta * precio_respuesta) / 1000
+        etiquetas = {"modelo": modelo} if ruta is None else {"modelo": modelo, "ruta": ruta}
+        self.incrementar("ia_llamadas_total", **etiquetas)
+        self.incrementar("ia_tokens_total", tokens_prompt, tipo="prompt", **etiquetas)
+        self.incrementar("ia_tokens_total", tokens_respuesta, tipo="respuesta", **etiquetas)
+        self.incrementar("ia_coste_usd_total", coste, **etiquetas)
+        if ruta is not None and segundos is not None:
+            self.observar(f"ia_ruta_{ruta}", segundos)
+        if self.ruta_log_json:
+            evento = {
+                "momento": time.time(),
+                "modelo": modelo,
+                "ruta": ruta,
+                "tokens_prompt": tokens_prompt,
+                "tokens_respuesta": tokens_respuesta,
+                "coste_usd": coste,
+                "segundos": segundos,
+                **extra
+            }
+            with self._lock, open(self.ruta_log_json, "a", encoding="utf-8") as archivo:
+                archivo.write(json.dumps(evento, ensure_ascii=False) + "\n")
+        return coste
+
+    def resumen(self):
+        """Instantánea de las métricas: percentiles por etapa (ms) y contadores"""
+        with self._lock:
+            tiempos = {etapa: sorted(muestras) for etapa, muestras in self._tiempos.items()}
+            totales = {etapa: list(total) for etapa, total in self._totales.items()}
+            contadores = dict(self._contadores)
+            indicadores = dict(self._indicadores)
+        etapas = {}
+        for etapa, ordenadas in tiempos.items():
+            etapas[etapa] = {
+                "mediciones": totales[etapa][0],
+                "segundos_total": totales[etapa][1],
+                "p50_ms": _percentil(ordenadas, 0.50) * 1000,
+                "p95_ms": _percentil(ordenadas, 0.95) * 1000,
+                "p99_ms": _percentil(ordenadas, 0.99) * 1000
+            }
+        return {
+            "desde": self.inicio,
+            "etapas": etapas,
+            "contadores": [
+                {"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                for (nombre, etiquetas), valor in sorted(contadores.items())
+            ],
+            "indicadores": [
+                {"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                for (nombre, etiquetas), valor in sorted(indicadores.items())
+            ]
+        }
+
+    def instantanea(self):
+        """Estado serializable del registro para publicarlo en el backend compartido.
+
+        De cada etapa se guardan el total y 101 cuantiles de las muestras
+        recientes, no las muestras en sí, para que la instantánea sea pequeña."""
+        with self._lock:
+            tiempos = {etapa: sorted(muestras) for etapa, muestras in self._tiempos.items()}
+            totales = {etapa: list(total) for etapa, total in self._totales.items()}
+            contadores = [[nombre, [list(par) for par in etiquetas], valor]
+                          for (nombre, etiquetas), valor in self._contadores.items()]
+            indicadores = [[nombre, [list(par) for par in etiquetas], valor]
+                           for (nombre, etiquetas), valor in self._indicadores.items()]
+        return {
+            "desde": self.inicio,
+            "contadores": contadores,
+            "indicadores": indicadores,
+            "etapas": {
+                etapa: [totales[etapa][0], totales[etapa][1], [_percentil(ordenadas, i / 100) for i in range(101)]]
+                for etapa, ordenadas in tiempos.items()
+            }
+        }
+
+    @classmethod
+    def combinar(cls, instantaneas):
+        """Registro con la suma de varias instantáneas (una por proceso).
+
+        Los contadores y los totales se suman; de los indicadores se toma el
+        valor máximo (p. ej., basta un worker con el circuito abierto). Los
+        percentiles salen de los cuantiles de cada proceso, ponderados por
+        su número de mediciones, así que son aproximados."""
+        registro = cls(ruta_log_json=None)
+        mediciones = defaultdict(int)
+        for datos in instantaneas:
+            registro.inicio = min(registro.inicio, datos["desde"])
+            for nombre, etiquetas, valor in datos["contadores"]:
+                registro._contadores[(nombre, tuple(tuple(par) for par in etiquetas))] += valor
+            for nombre, etiquetas, valor in datos["indicadores"]:
+                clave = (nombre, tuple(tuple(par) for par in etiquetas))
+                registro._indicadores[clave] = max(valor, registro._indicadores.get(clave, valor))
+            for etapa, (numero, _, _) in datos["etapas"].items():
+                mediciones[etapa] += numero
+        for datos in instantaneas:
+            for etapa, (numero, segundos, cuantiles) in datos["etapas"].items():
+                total = registro._totales[etapa]
+                total[0] += numero
+                total[1] += segundos
+                puntos = max(1, round(registro._muestras * numero / mediciones[etapa])) if mediciones[etapa] else 1
+                registro._tiempos[etapa].extend(
+                    cuantiles[round(i * 100 / (puntos - 1)) if puntos > 1 else 50] for i in range(puntos)
+                )
+        return registro
+
+    def combinadas(self):
+        """Métricas de todos los procesos que comparten el backend de estado.
+
+        Con el backend en memoria (un solo proceso) es el propio registro. Antes
+        de leer se publica la instantánea de este proceso para que esté al día."""
+        from estado_compartido import obtener_estado
+        estado = obtener_estado()
+        if not estado.multiproceso:
+            return self
+        estado.publicar(self.clave_publicacion(), self.instantanea())
+        return RegistroMetricas.combinar(estado.instantaneas("metricas:"))
+
+    def clave_publicacion(self):
+        return f"metricas:{socket.gethostname()}:{os.getpid()}:{self._identificador}"
+
+    def publicar_periodicamente(self, estado, intervalo):
+        """Publica la instantánea de este proceso cada ``intervalo`` segundos en un hilo de fondo"""
+        def publicar():
+            while True:
+                time.sleep(intervalo)
+                try:
+                    estado.publicar(self.clave_publicacion(), self.instantanea())
+                except Exception as e:
+                    self.incrementar("errores_total", origen="publicar_metricas", tipo=type(e).__name__)
+
+        threading.Thread(target=publicar, name="publicar-metricas", daemon=True).start()
+
+    def valor(self, nombre, **etiquetas):
+        """Suma de un contador para todas las series que incluyen las etiquetas dadas"""
+        with self._lock:
+            return sum(
+                valor for (clave, serie), valor in self._contadores.items()
+                if clave == nombre and set(etiquetas.items()) <= set(serie)
+            )
+
+    def exportar_json(self):
+        return json.dumps(self.resumen(), ensure_ascii=False, indent=2)
+
+    def exportar_prometheus(self, prefijo="asistente"):
+        """Métricas en el formato de texto de Prometheus"""
+        datos = self.resumen()
+        lineas = []
+        vistos = set()
+        for contador in datos["contadores"]:
+            nombre = f"{prefijo}_{contador['nombre']}"
+            if nombre not in vistos:
+                lineas.append(f"# TYPE {nombre} counter")
+                vistos.add(nombre)
+            etiquetas = _etiquetas_prometheus(sorted(contador["etiquetas"].items()))
+            lineas.append(f"{nombre}{etiquetas} {contador['valor']:g}")
+        for indicador in datos["indicadores"]:
+            nombre = f"{prefijo}_{indicador['nombre']}"
+            if nombre not in vistos:
+                lineas.append(f"# TYPE {nombre} gauge")
+                vistos.add(nombre)
+            etiquetas = _etiquetas_prometheus(sorted(indicador["etiquetas"].items()))
+            lineas.append(f"{nombre}{etiquetas} {indicador['valor']:g}")
+        nombre = f"{prefijo}_etapa_segundos"
+        lineas.append(f"# TYPE {nombre} summary")
+        for etapa, medidas in sorted(datos["etapas"].items()):
+            for cuantil, clave in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                etiquetas = _etiquetas_prometheus([("etapa", etapa), ("quantile", cuantil)])
+                lineas.append(f"{nombre}{etiquetas} {medidas[clave] / 1000:.6f}")
+            lineas.append(f'{nombre}_sum{{etapa="{etapa}"}} {medidas["segundos_total"]:.6f}')
+            lineas.append(f'{nombre}_count{{etapa="{etapa}"}} {medidas["mediciones"]}')
+        return "\n".join(lineas) + "\n"
+
+    def exportar_a_archivo(self, ruta):
+        """Escribe las métricas en ``ruta`` (JSON si termina en .json, Prometheus en otro caso)"""
+        contenido = self.exportar_json() if ruta.endswith(".json") else self.exportar_prometheus()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(contenido)
+        os.replace(temporal, ruta)
+
+
+# Registro compartido por todo el proceso
+metricas = RegistroMetricas()
@@ -0,0 +1,193 @@
+"""Registro de plantillas de respuesta compartido por el chat, la Búsqueda Rápida y los lotes.
+
+Cada plantilla se analiza una sola vez al registrarla y se guarda como una lista
+de fragmentos literales y campos. Los campos disponibles son ``{tema}``,
+``{tema_titulo}`` y ``{contexto}``; este último admite un valor por defecto para
+cuando el contexto está vacío con la sintaxis ``{contexto:texto por defecto}``.
+
+Para añadir un nuevo tipo de sección (por ejemplo, marco teórico o hipótesis)
+basta con llamar a ``registrar_plantilla``; si se indican palabras clave, el
+motor de intenciones lo detectará también en el chat sin tocar el despacho.
+"""
+import functools
+import string
+
+from intenciones import registrar_intencion
+
+_FORMATEADOR = string.Formatter()
+_CAMPOS_VALIDOS = frozenset(["tema", "tema_titulo", "contexto"])
+
+# Plantillas registradas por tipo: {"titulo", "fragmentos", "seccion"}
+PLANTILLAS = {}
+
+
+def compilar_plantilla(texto):
+    """Convierte el texto de la plantilla en una tupla de (literal, campo, valor por defecto)"""
+    fragmentos = []
+    for literal, campo, por_defecto, _ in _FORMATEADOR.parse(texto):
+        if campo is not None and campo not in _CAMPOS_VALIDOS:
+            raise ValueError(f"Campo desconocido en la plantilla: {{{campo}}}")
+        fragmentos.append((literal, campo, por_defecto or ""))
+    return tuple(fragmentos)
+
+
+def registrar_plantilla(tipo, texto, titulo=None, seccion=True, palabras_clave=None):
+    """Registra (o reemplaza) la plantilla de un tipo de solicitud.
+
+    ``seccion`` indica si forma parte de un borrador completo (botones de la
+    Búsqueda Rápida y generación por lotes). ``palabras_clave`` es un diccionario
+    opcional {palabra o frase: peso} para que el chat detecte el nuevo tipo.
+    """
+    PLANTILLAS[tipo] = {
+        "titulo": titulo or tipo.capitalize(),
+        "fragmentos": compilar_plantilla(texto),
+        "seccion": seccion
+    }
+    if palabras_clave:
+        registrar_intencion(tipo, palabras_clave)
+    renderizar_plantilla.cache_clear()
+
+
+def secciones():
+    """Tipos registrados que forman parte de un borrador completo, en orden de registro"""
+    return [tipo for tipo, plantilla in PLANTILLAS.items() if plantilla["seccion"]]
+
+
+@functools.lru_cache(maxsize=2048)
+def renderizar_plantilla(tipo, tema, contexto=""):
+    """Rellena la plantilla del tipo indicado; el resultado se memoriza por (tipo, tema, contexto)"""
+    plantilla = PLANTILLAS.get(tipo) or PLANTILLAS["general"]
+    valores = {"tema": tema, "tema_titulo": tema.title(), "contexto": contexto}
+    partes = []
+    for literal, campo, por_defecto in plantilla["fragmentos"]:
+        partes.append(literal)
+        if campo is not None:
+            partes.append(valores[campo] or por_defecto)
+    return "".join(partes)
+
+
+# Plantillas incluidas
+PLANTILLA_PLANTEAMIENTO = """
+# 🎯 PLANTEAMIENTO DEL PROBLEMA: {tema_titulo}
+
+## 📝 DESCRIPCIÓN DEL PROBLEMA
+
+En el contexto actual caracterizado por la rápida evolución tecnológica y las transformaciones sociales, se ha identificado una problemática significativa en el ámbito de **{tema}**. La disyunción existente entre las demandas emergentes y las capacidades actuales genera consecuencias relevantes que merecen atención investigativa.
+
+## 🔍 JUSTIFICACIÓN DE LA INVESTIGACIÓN
+
+El estudio de {tema} se justifica por las siguientes consideraciones fundamentales:
+
+1. **Relevancia contemporánea**: Constituye un tema de actualidad en el marco de los procesos de transformación digital y social.
+2. **Impacto multidimensional**: Sus efectos repercuten en diversos ámbitos: social, económico, educativo y organizacional.
+3. **Vacío en la literatura**: Existe una necesidad evidente de investigaciones actualizadas que aborden esta temática desde perspectivas innovadoras.
+4. **Aplicabilidad práctica**: Los hallazgos pueden traducirse en estrategias concretas y soluciones aplicables.
+
+## 📌 DELIMITACIÓN DEL ESTUDIO
+
+Esta investigación se circunscribirá a:
+- **Ámbito temático**: Aspectos específicos relacionados con {tema}
+- **Contexto de aplicación**: {contexto:entornos diversos y representativos}
+- **Enfoque metodológico**: Análisis integral seguido de propuestas de mejora
+
+## ❓ PREGUNTAS DE INVESTIGACIÓN
+
+1. ¿Cuáles son los factores determinantes que influyen significativamente en {tema}?
+2. ¿Qué impacto observable genera {tema} en los diferentes contextos de aplicación?
+3. ¿Qué estrategias y metodologías demostrarían mayor efectividad para optimizar los resultados asociados a {tema}?
+4. ¿Qué brechas de conocimiento y oportunidades de desarrollo futuro pueden identificarse en este campo de estudio?
+
+*Contexto específico considerado: {contexto:ámbito general de aplicación}*
+"""
+
+PLANTILLA_OBJETIVOS = """
+# 🎯 OBJETIVOS DE INVESTIGACIÓN: {tema_titulo}
+
+## 🎯 OBJETIVO GENERAL
+
+Analizar sistemáticamente los aspectos fundamentales de **{tema}** en el contexto de **{contexto:diversos escenarios y contextos de aplicación}**, con el propósito de formular estrategias de mejora, innovación y optimización que contribuyan al avance del conocimiento y la práctica en este campo de estudio.
+
+## 📋 OBJETIVOS ESPECÍFICOS
+
+1. **Identificar y caracterizar** los componentes, dimensiones y variables clave asociados con {tema}, estableciendo un marco conceptual robusto que facilite su comprensión integral.
+
+2. **Diagnosticar el estado actual** de {tema} mediante el análisis exhaustivo de tendencias, prácticas predominantes y desafíos identificados tanto en la literatura especializada como en contextos reales de aplicación.
+
+3. **Evaluar el impacto** de {tema} en diferentes ámbitos (social, económico, educativo, organizacional), considerando variables contextuales y características poblacionales específicas.
+
+4. **Diseñar y proponer** estrategias, metodologías o herramientas innovadoras para la optimización de {tema}, fundamentadas en evidencia empírica y mejores prácticas identificadas.
+
+5. **Validar la aplicabilidad** de las propuestas formuladas mediante criterios de factibilidad, sostenibilidad y alineamiento con necesidades identificadas en el contexto de {contexto:diversos escenarios y contextos de aplicación}.
+"""
+
+PLANTILLA_METODOLOGIA = """
+## 🎓 SUGERENCIAS METODOLÓGICAS PARA: {tema_titulo}
+
+### **ENFOQUE METODOLÓGICO RECOMENDADO**
+**Investigación Mixta de Diseño Secuencial Explicativo** - Combina métodos cuantitativos y cualitativos para un análisis comprehensivo.
+
+### **DISEÑO DE INVESTIGACIÓN**
+- **Tipo**: Secuencial explicativo
+- **Fase 1**: Análisis cuantitativo (encuestas, datos secundarios)
+- **Fase 2**: Profundización cualitativa (entrevistas, estudios de caso)
+
+### **TÉCNICAS DE RECOLECCIÓN**
+- 📊 Encuestas con escalas Likert validadas
+- 🎤 Entrevistas semiestructuradas
+- 📑 Análisis documental sistemático
+- 👥 Grupos focales para triangulación
+
+*Contexto: {contexto:diversos escenarios de aplicación}*
+"""
+
+PLANTILLA_VARIABLES = """
+## 🔬 VARIABLES DE INVESTIGACIÓN PARA: {tema_titulo}
+
+### **VARIABLES INDEPENDIENTES**
+- Factores influyentes en {tema}
+- Estrategias implementadas
+- Características contextuales
+
+### **VARIABLES DEPENDIENTES**
+- Resultados observables
+- Impacto medible
+- Efectividad de intervenciones
+
+### **VARIABLES DE CONTROL**
+- Contexto específico
+- Características poblacionales
+- Recursos disponibles
+
+*Contexto: {contexto}*
+"""
+
+PLANTILLA_ASESORIA_GENERAL = """
+## 💡 ASESORÍA ESPECIALIZADA EN INVESTIGACIÓN: {tema_titulo}
+
+He analizado su consulta sobre **"{tema}"** y puedo ofrecerle orientación en:
+
+### 🎯 **ENFOQUES RECOMENDADOS:**
+- **Investigación exploratoria**: Para caracterizar el fenómeno
+- **Investigación explicativa**: Para identificar relaciones causales
+- **Investigación aplicada**: Para desarrollar soluciones prácticas
+
+### 📊 **ASPECTOS CLAVE:**
+- Definición clara del problema de investigación
+- Establecimiento de preguntas guía
+- Selección de metodología apropiada
+- Operacionalización de variables
+
+### 🔍 **PRÓXIMOS PASOS:**
+1. Búsqueda bibliográfica especializada
+2. Delimitación del marco teórico-conceptual
+3. Formulación de hipótesis o preguntas
+4. Diseño metodológico detallado
+
+**¿Le gustaría que profundice en algún aspecto específico?**
+"""
+
+registrar_plantilla("planteamiento", PLANTILLA_PLANTEAMIENTO, "Planteamiento del problema")
+registrar_plantilla("objetivos", PLANTILLA_OBJETIVOS, "Objetivos de investigación")
+registrar_plantilla("metodologia", PLANTILLA_METODOLOGIA, "Metodología")
+registrar_plantilla("variables", PLANTILLA_VARIABLES, "Variables")
+registrar_plantilla("general", PLANTILLA_ASESORIA_GENERAL, "Asesoría general", seccion=False)
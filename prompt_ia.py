@@ -0,0 +1,174 @@
+"""Construcción de los mensajes enviados a la IA: prefijo estable y cuentas locales de tokens.
+
+Los mensajes van de lo más estable a lo más variable, para que las llamadas
+compartan el prefijo más largo posible y el proveedor pueda reutilizarlo con
+su caché de prompts:
+
+1. Reglas del asistente (``REGLAS_SISTEMA``): idénticas en todas las llamadas.
+2. Contexto de investigación: fijo durante toda la conversación.
+3. Historial (resumen y turnos recientes): solo crece por el final.
+4. Material recuperado para esta consulta: referencias del catálogo
+   bibliográfico y fragmentos de los documentos del usuario.
+5. El mensaje del usuario.
+
+Antes de enviar se estima localmente cada parte (``estimar_tokens``). Si el
+prompt no cabe en la ventana del modelo menos la respuesta máxima de la ruta
+(o en ``PROMPT_MAX_TOKENS``), se recorta en este orden: turnos más antiguos del
+historial (el resumen de los anteriores se quita el último), fragmentos de
+documentos menos relevantes, referencias y, en último caso, el contexto y el
+mensaje se truncan. Si aun así ocupa más de ``PROMPT_AVISO`` del espacio
+disponible, se cuenta un aviso en las métricas y se registra en el log.
+"""
+import logging
+import os
+from collections import namedtuple
+
+from contexto_conversacion import ENCABEZADO_RESUMEN, SOBRECOSTE_MENSAJE, estimar_tokens
+from documentos import ENCABEZADO_FRAGMENTOS, separar_fragmentos
+from metricas import metricas
+
+# Reglas del asistente: el único mensaje que es igual en todas las llamadas
+REGLAS_SISTEMA = """Eres un agente de IA experto en investigación académica.
+- Asistes a investigadores y estudiantes de posgrado.
+- Tus respuestas son detalladas, fundamentadas y precisas.
+- Puedes sugerir artículos, sintetizar teorías, proponer referencias bibliográficas (en formato APA o UPEL), y explicar conceptos complejos.
+- Especifica fuentes reales cuando sugieras bibliografía, indica si la referencia es simulada o real.
+- Utiliza lenguaje profesional y académico, en español.
+- La consulta o instrucción del usuario es su último mensaje."""
+
+# Referencias del catálogo local que se añaden al prompt cuando las hay
+INSTRUCCION_REFERENCIAS = (
+    "Referencias reales del catálogo de la biblioteca relacionadas con el tema. "
+    "Cuando sugieras bibliografía, usa preferentemente estas referencias tal como aparecen "
+    "e indica como simulada cualquier otra:\n"
+)
+INSTRUCCION_FRAGMENTOS = ENCABEZADO_FRAGMENTOS + "\n"
+
+# Ventana de contexto (tokens de prompt + respuesta) de cada modelo
+VENTANAS_MODELOS = {
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+VENTANA_POR_DEFECTO = 8192
+# Tope propio para el prompt, aunque el modelo admita más (controla el coste por llamada)
+MAX_TOKENS_PROMPT = int(os.environ.get("PROMPT_MAX_TOKENS", "12000"))
+# Fracción del espacio disponible a partir de la cual se avisa
+FRACCION_AVISO = float(os.environ.get("PROMPT_AVISO", "0.85"))
+# Holgura para los errores de la estimación local
+MARGEN_TOKENS = 64
+
+logger = logging.getLogger(__name__)
+
+# ``tokens`` es el total estimado; ``tokens_prefijo`` lo que se repite de una llamada a la
+# siguiente en la misma conversación (reglas, contexto e historial); ``recortes`` lo que se quitó
+Prompt = namedtuple("Prompt", ["mensajes", "tokens", "tokens_prefijo", "limite", "partes", "recortes"])
+
+
+def limite_prompt(ruta):
+    """Tokens disponibles para el prompt con la ruta ``ruta`` (modelo y máximo de respuesta)"""
+    ventana = VENTANAS_MODELOS.get(ruta.modelo, VENTANA_POR_DEFECTO)
+    return max(0, min(ventana - ruta.max_tokens - MARGEN_TOKENS, MAX_TOKENS_PROMPT))
+
+
+def recortar_texto(texto, tokens):
+    """Principio de ``texto`` que cabe en ``tokens`` tokens estimados"""
+    if estimar_tokens(texto) <= tokens:
+        return texto
+    recortado = texto
+    while recortado and estimar_tokens(recortado + " […]") > tokens:
+        recortado = recortado[:int(len(recortado) * 0.9)]
+    return recortado + " […]" if recortado else ""
+
+
+def _tokens_mensaje(contenido):
+    return estimar_tokens(contenido) + SOBRECOSTE_MENSAJE
+
+
+def _tokens_lista(encabezado, elementos):
+    """Tokens de un mensaje formado por ``encabezado`` y los ``elementos`` (ya estimados)"""
+    return _tokens_mensaje(encabezado) + sum(elementos) if elementos else 0
+
+
+TOKENS_REGLAS = _tokens_mensaje(REGLAS_SISTEMA)
+
+
+def construir_prompt(mensaje_usuario, ruta, contexto="", previos=None, referencias=()):
+    """Mensajes de chat en orden estable, recortados para caber en el límite de ``ruta``.
+
+    ``contexto`` puede traer los fragmentos de los documentos añadidos por
+    ``documentos.contexto_con_documentos``; aquí se separan para enviarlos
+    después del historial, junto a las ``referencias`` del catálogo."""
+    contexto, extractos = separar_fragmentos(contexto)
+    previos = list(previos or [])
+    referencias = [f"- {referencia}" for referencia in referencias]
+    limite = limite_prompt(ruta)
+    recortes = {}
+
+    # Cada elemento se estima una sola vez; los recortes solo restan
+    tokens_previos = [_tokens_mensaje(mensaje["content"]) for mensaje in previos]
+    tokens_extractos = [estimar_tokens(extracto) + 1 for extracto in extractos]
+    tokens_referencias = [estimar_tokens(referencia) + 1 for referencia in referencias]
+    tokens_contexto = _tokens_mensaje(f"Contexto de investigación: {contexto}") if contexto else 0
+    tokens_usuario = _tokens_mensaje(mensaje_usuario)
+
+    def total():
+        return (TOKENS_REGLAS + tokens_contexto + sum(tokens_previos) + tokens_usuario + 2
+                + _tokens_lista(INSTRUCCION_REFERENCIAS, tokens_referencias)
+                + _tokens_lista(INSTRUCCION_FRAGMENTOS, tokens_extractos))
+
+    # Primero lo que menos se echa en falta: el historial más antiguo, luego lo recuperado menos relevante.
+    # El resumen va delante de los turnos pero condensa todos los anteriores: se conserva mientras queden turnos
+    resumen = bool(previos) and previos[0]["role"] == "system" and previos[0]["content"].startswith(ENCABEZADO_RESUMEN)
+    for parte, elementos, tokens, posicion in (("historial", previos, tokens_previos, 1 if resumen else 0),
+                                               ("fragmentos", extractos, tokens_extractos, -1),
+                                               ("referencias", referencias, tokens_referencias, -1)):
+        while elementos and total() > limite:
+            indice = posicion if posicion < len(elementos) else 0
+            elementos.pop(indice)
+            tokens.pop(indice)
+            recortes[parte] = recortes.get(parte, 0) + 1
+    if total() > limite and contexto:
+        contexto = recortar_texto(contexto, max(0, estimar_tokens(contexto) - (total() - limite)))
+        tokens_contexto = _tokens_mensaje(f"Contexto de investigación: {contexto}") if contexto else 0
+        recortes["contexto"] = 1
+    if total() > limite:
+        mensaje_usuario = recortar_texto(mensaje_usuario, max(1, estimar_tokens(mensaje_usuario) - (total() - limite)))
+        tokens_usuario = _tokens_mensaje(mensaje_usuario)
+        recortes["mensaje"] = 1
+
+    mensajes = [{"role": "system", "content": REGLAS_SISTEMA}]
+    if contexto:
+        mensajes.append({"role": "system", "content": f"Contexto de investigación: {contexto}"})
+    mensajes.extend(previos)
+    if referencias:
+        mensajes.append({"role": "system", "content": INSTRUCCION_REFERENCIAS + "\n".join(referencias)})
+    if extractos:
+        mensajes.append({"role": "system", "content": INSTRUCCION_FRAGMENTOS + "\n\n".join(extractos)})
+    mensajes.append({"role": "user", "content": mensaje_usuario})
+
+    partes = {
+        "reglas": TOKENS_REGLAS,
+        "contexto": tokens_contexto,
+        "historial": sum(tokens_previos),
+        "recuperado": (_tokens_lista(INSTRUCCION_REFERENCIAS, tokens_referencias)
+                       + _tokens_lista(INSTRUCCION_FRAGMENTOS, tokens_extractos)),
+        "usuario": tokens_usuario,
+    }
+    return Prompt(mensajes, total(), TOKENS_REGLAS + tokens_contexto + partes["historial"], limite, partes, recortes)
+
+
+def registrar_prompt(prompt, ruta):
+    """Cuenta los tokens estimados de cada parte del prompt enviado, sus recortes y avisos"""
+    for parte, tokens in prompt.partes.items():
+        metricas.incrementar("prompt_tokens_total", tokens, parte=parte, ruta=ruta.nombre)
+    metricas.incrementar("prompt_tokens_prefijo_total", prompt.tokens_prefijo, ruta=ruta.nombre)
+    metricas.incrementar("prompts_total", ruta=ruta.nombre)
+    for parte, cantidad in prompt.recortes.items():
+        metricas.incrementar("prompt_recortes_total", cantidad, parte=parte, ruta=ruta.nombre)
+    if prompt.tokens > FRACCION_AVISO * prompt.limite:
+        metricas.incrementar("prompt_avisos_total", ruta=ruta.nombre)
+        logger.warning("Prompt cerca del límite en la ruta %s: %d tokens estimados de %d",
+                       ruta.nombre, prompt.tokens, prompt.limite)
@@ -0,0 +1,178 @@
+"""Capa de resiliencia para las llamadas a la IA.
+
+- Reintentos acotados con espera exponencial y jitter completo para los
+  errores transitorios (429, 5xx, errores de conexión y timeouts).
+- Petición de cobertura opcional: si la primera llamada supera un umbral de
+  latencia se lanza una segunda idéntica y se usa la que termine antes.
+- Cada petición que sale cuenta en la cuota: quien llama pasa funciones para
+  tomar turno en el limitador antes de cada reintento y para la copia de
+  cobertura, que solo se lanza si hay cuota en ese momento.
+- Cortacircuitos: tras varios fallos seguidos se abre y las llamadas fallan al
+  instante con ``CircuitoAbierto`` (quien llama sirve la plantilla) hasta que,
+  pasado un tiempo, una llamada de prueba confirma que el proveedor se recuperó.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metricas import metricas
+
+MAX_REINTENTOS = int(os.environ.get("IA_MAX_REINTENTOS", "3"))
+RETARDO_BASE = float(os.environ.get("IA_RETARDO_BASE", "0.5"))
+RETARDO_MAXIMO = float(os.environ.get("IA_RETARDO_MAXIMO", "8"))
+# Segundos tras los que se lanza la petición de cobertura (0 = desactivada)
+UMBRAL_COBERTURA = float(os.environ.get("IA_UMBRAL_COBERTURA", "0"))
+UMBRAL_FALLOS = int(os.environ.get("IA_UMBRAL_FALLOS", "5"))
+SEGUNDOS_APERTURA = float(os.environ.get("IA_SEGUNDOS_APERTURA", "30"))
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+_pool_cobertura = ThreadPoolExecutor(max_workers=32, thread_name_prefix="cobertura-ia")
+
+
+class CircuitoAbierto(Exception):
+    """La IA está marcada como no disponible; no se ha hecho ninguna llamada"""
+
+
+def es_transitorio(error):
+    """Indica si merece la pena reintentar una llamada que lanzó ``error``"""
+    # openai se importa de forma diferida (ver cliente_ia.py): si no está cargado, el error no es suyo
+    openai = sys.modules.get("openai")
+    if openai is None:
+        return False
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def espera_reintento(intento, base=RETARDO_BASE, maximo=RETARDO_MAXIMO):
+    """Espera con retroceso exponencial y jitter completo para el intento ``intento`` (desde 0)"""
+    return random.uniform(0, min(maximo, base * (2 ** intento)))
+
+
+class Cortacircuitos:
+    """Cortacircuitos de tres estados compartido por todas las sesiones del proceso"""
+
+    def __init__(self, umbral_fallos=UMBRAL_FALLOS, segundos_apertura=SEGUNDOS_APERTURA, nombre="ia"):
+        self.umbral_fallos = umbral_fallos
+        self.segundos_apertura = segundos_apertura
+        self.nombre = nombre
+        self._lock = threading.Lock()
+        self.estado = CERRADO
+        self.fallos_seguidos = 0
+        self.abierto_desde = 0.0
+        self._prueba_en_curso = False
+
+    def _cambiar_estado(self, estado):
+        if estado != self.estado:
+            self.estado = estado
+            metricas.incrementar("circuito_transiciones_total", circuito=self.nombre, estado=estado)
+            metricas.fijar("circuito_abierto", 1 if estado == ABIERTO else 0, circuito=self.nombre)
+
+    def permitir(self):
+        """Indica si se puede llamar ahora; en semiabierto solo deja pasar una llamada de prueba"""
+        with self._lock:
+            if self.estado == ABIERTO:
+                if time.monotonic() - self.abierto_desde < self.segundos_apertura:
+                    return False
+                self._cambiar_estado(SEMIABIERTO)
+            if self.estado == SEMIABIERTO:
+                if self._prueba_en_curso:
+                    return False
+                self._prueba_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            self.fallos_seguidos = 0
+            self._prueba_en_curso = False
+            self._cambiar_estado(CERRADO)
+
+    def registrar_fallo(self):
+        with self._lock:
+            self.fallos_seguidos += 1
+            self._prueba_en_curso = False
+            if self.estado == SEMIABIERTO or self.fallos_seguidos >= self.umbral_fallos:
+                self.abierto_desde = time.monotonic()
+                self._cambiar_estado(ABIERTO)
+
+    def resumen(self):
+        """Estado actual para los paneles de diagnóstico y alertas"""
+        with self._lock:
+            restante = 0.0
+            if self.estado == ABIERTO:
+                restante = max(0.0, self.segundos_apertura - (time.monotonic() - self.abierto_desde))
+            return {"estado": self.estado, "fallos_seguidos": self.fallos_seguidos, "segundos_para_reintentar": restante}
+
+
+def llamar_con_cobertura(funcion, umbral=UMBRAL_COBERTURA, reservar_cobertura=None):
+    """Ejecuta ``funcion``; si tarda más de ``umbral`` segundos lanza una copia y devuelve la primera que acabe bien.
+    
+    La copia solo se lanza si ``reservar_cobertura()`` (cuando se pasa) devuelve True."""
+    if umbral <= 0:
+        return funcion()
+    tareas = [_pool_cobertura.submit(funcion)]
+    hechas, _ = wait(tareas, timeout=umbral)
+    if not hechas:
+        if reservar_cobertura is None or reservar_cobertura():
+            metricas.incrementar("ia_coberturas_total")
+            tareas.append(_pool_cobertura.submit(funcion))
+        else:
+            metricas.incrementar("ia_coberturas_sin_cuota_total")
+    pendientes = set(tareas)
+    error = None
+    while pendientes:
+        hechas, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+        for tarea in hechas:
+            if tarea.exception() is None:
+                if len(tareas) > 1 and tarea is tareas[1]:
+                    metricas.incrementar("ia_coberturas_ganadas_total")
+                return tarea.result()
+            error = tarea.exception()
+    raise error
+
+
+def llamar_resiliente(funcion, circuito, max_reintentos=MAX_REINTENTOS, umbral_cobertura=UMBRAL_COBERTURA,
+                      reservar=None, reservar_cobertura=None):
+    """Llama a ``funcion`` respetando el cortacircuitos, con reintentos y cobertura opcional.
+    
+    El turno de la primera llamada lo toma quien llama; ``reservar()`` se llama
+    antes de cada reintento (puede bloquear o lanzar ``ColaSaturada``) y
+    ``reservar_cobertura()`` antes de cada copia de cobertura."""
+    if not circuito.permitir():
+        metricas.incrementar("circuito_rechazos_total", circuito=circuito.nombre)
+        raise CircuitoAbierto("La IA no está disponible temporalmente")
+    intento = 0
+    while True:
+        try:
+            resultado = llamar_con_cobertura(funcion, umbral_cobertura, reservar_cobertura)
+        except Exception as e:
+            if not es_transitorio(e):
+                # Errores como una API key inválida no indican una caída del proveedor
+                circuito.registrar_exito()
+                raise
+            if intento >= max_reintentos:
+                circuito.registrar_fallo()
+                raise
+            metricas.incrementar("ia_reintentos_total", tipo=type(e).__name__)
+            time.sleep(espera_reintento(intento))
+            intento += 1
+            if reservar is not None:
+                try:
+                    reservar()
+                except Exception:
+                    # El reintento no llega a salir: la llamada falló por el último error transitorio
+                    circuito.registrar_fallo()
+                    raise
+            continue
+        circuito.registrar_exito()
+        return resultado
+
+
+# Cortacircuitos de las llamadas a OpenAI, compartido por todo el proceso
+circuito_ia = Cortacircuitos()
@@ -0,0 +1,247 @@
+import json
+import time
+
+from bibliografia import bloque_referencias, buscar_referencias
+from cache_respuestas import calcular_clave, obtener_cache
+from cliente_ia import completar_chat, texto_de_fragmento, texto_de_respuesta, uso_de_respuesta
+from coalescencia import vuelos_ia
+from contexto_conversacion import estimar_tokens, estimar_tokens_mensajes
+from enrutamiento import elegir_ruta
+from intenciones import analizar_consulta
+from limitador import ColaSaturada, EnCola, huella_api_key, limitador_ia
+from metricas import metricas
+from plantillas import renderizar_plantilla
+from prompt_ia import construir_prompt, registrar_prompt
+from resiliencia import CircuitoAbierto, circuito_ia, es_transitorio, llamar_resiliente
+
+# El modelo, el máximo de tokens y la temperatura de cada llamada los decide
+# la tabla de rutas por intención (ver ``enrutamiento.py`` y ``rutas_ia.json``)
+
+def referencias_para(mensaje_usuario):
+    """Referencias reales del catálogo local para el tema detectado en la consulta"""
+    return buscar_referencias(analizar_consulta(mensaje_usuario).tema)
+
+def clave_respuesta_ia(mensaje_usuario, contexto="", previos=None, ruta=None):
+    """Clave de caché para una consulta a la IA (incluye el historial y las referencias enviadas)"""
+    ruta = ruta or elegir_ruta(mensaje_usuario, contexto)
+    referencias = referencias_para(mensaje_usuario)
+    if previos:
+        mensaje_usuario = mensaje_usuario + "\x1e" + json.dumps(previos, ensure_ascii=False)
+    if referencias:
+        mensaje_usuario = mensaje_usuario + "\x1e" + "\n".join(referencias)
+    return calcular_clave("ia", mensaje_usuario, contexto, ruta.modelo, ruta.temperatura)
+
+# Prompt enviado al modelo: prefijo estable y recortado al límite de la ruta (ver ``prompt_ia.py``)
+def preparar_prompt(mensaje_usuario, contexto="", previos=None, ruta=None):
+    """Construye el prompt de una consulta con sus cuentas de tokens.
+    
+    ``previos`` son los mensajes de historial ya ajustados al presupuesto de
+    tokens (ver ``contexto_conversacion.preparar_historial``). Si el catálogo
+    bibliográfico local tiene referencias sobre el tema, se añaden para que el
+    modelo cite obras reales en lugar de inventarlas (ver ``bibliografia.py``)."""
+    ruta = ruta or elegir_ruta(mensaje_usuario, contexto)
+    return construir_prompt(mensaje_usuario, ruta, contexto, previos, referencias_para(mensaje_usuario))
+
+def construir_mensajes_ia(mensaje_usuario, contexto="", previos=None, ruta=None):
+    """Lista de mensajes para la API de chat"""
+    return preparar_prompt(mensaje_usuario, contexto, previos, ruta).mensajes
+
+# Respuesta de respaldo cuando la API de OpenAI no está disponible
+def generar_respuesta_respaldo(mensaje_usuario, error):
+    """Genera la guía general que se muestra cuando falla la conexión con la IA"""
+    return f"""🤖 **Respuesta del Asistente IA:**
+
+Parece que hay un problema con la conexión a la API de OpenAI. Error: {str(error)}
+
+**Mientras tanto, aquí tienes una guía general:**
+
+Para consultas sobre '{mensaje_usuario}', te recomiendo:
+
+📚 **Fuentes académicas sugeridas:**
+- Google Scholar para búsqueda de artículos científicos
+- Scopus y Web of Science para literatura especializada
+- ScienceDirect y JSTOR para acceso a textos completos
+
+🔍 **Enfoque de investigación recomendado:**
+1. Realiza una revisión sistemática de literatura
+2. Identifica los autores más citados en el área
+3. Analiza las metodologías predominantes
+4. Establece tu marco teórico y conceptual
+
+💡 **Próximos pasos:**
+- Define claramente tu pregunta de investigación
+- Selecciona la metodología apropiada
+- Establece tus criterios de inclusión/exclusión
+- Planifica tu estrategia de búsqueda bibliográfica
+
+*Para usar la funcionalidad completa de IA, necesitarás configurar una API key de OpenAI.*"""
+
+# Motivos por los que se responde con plantillas sin llamar a la IA
+AVISOS_SIN_IA = {
+    "circuito_abierto": "El servicio de IA no está disponible en este momento",
+    "cola_saturada": "Hay demasiadas consultas a la IA en espera"
+}
+
+# Respuesta inmediata con plantillas cuando no se puede llamar a la IA (cortacircuitos abierto o cola llena)
+def generar_respuesta_sin_ia(mensaje_usuario, contexto="", motivo="circuito_abierto"):
+    """Responde con la plantilla del tipo de solicitud detectado, sin esperar a la API"""
+    metricas.incrementar("respuestas_respaldo_total", origen=motivo)
+    tipo, tema = analizar_consulta(mensaje_usuario)
+    return (f"⚡ *{AVISOS_SIN_IA[motivo]}; se muestra la respuesta generada con plantillas.*\n"
+            + renderizar_plantilla(tipo, tema, contexto) + bloque_referencias(tema))
+
+def motivo_sin_ia(error):
+    """Motivo de ``AVISOS_SIN_IA`` que corresponde a una llamada rechazada antes de hacerse"""
+    return "cola_saturada" if isinstance(error, ColaSaturada) else "circuito_abierto"
+
+def tokens_reservados(mensajes, ruta):
+    """Tokens que cuenta el límite por minuto: prompt estimado más el máximo de la respuesta"""
+    return estimar_tokens_mensajes(mensajes) + ruta.max_tokens
+
+def buscar_en_cache(clave):
+    """Busca una respuesta de la IA en la caché y cuenta el acierto o fallo"""
+    respuesta = obtener_cache().obtener(clave)
+    metricas.incrementar("cache_ia_total", resultado="fallo" if respuesta is None else "acierto")
+    return respuesta
+
+def registrar_uso(mensajes, texto, uso, segundos, ruta):
+    """Registra tokens, coste y latencia de una llamada; si la API no informa del uso, se estima localmente"""
+    if uso is None:
+        uso = (estimar_tokens_mensajes(mensajes), estimar_tokens(texto), 0)
+    metricas.registrar_uso_ia(ruta.modelo, uso[0], uso[1], segundos, ruta=ruta.nombre, tokens_prompt_en_cache=uso[2])
+    # Parte del prompt que el proveedor sirvió desde su caché de prompts (prefijo repetido)
+    metricas.incrementar("ia_tokens_prompt_en_cache_total", uso[2], modelo=ruta.modelo, ruta=ruta.nombre)
+
+def registrar_respaldo(error):
+    """Cuenta una respuesta de respaldo servida por un error de la API"""
+    metricas.incrementar("respuestas_respaldo_total", origen="ia")
+    metricas.incrementar("errores_total", origen="ia", tipo=type(error).__name__)
+
+# Consulta a la IA sin respaldo: propaga los errores de la API a quien llama
+def solicitar_respuesta_ia(mensaje_usuario, contexto="", api_key=None, previos=None, al_esperar=None):
+    """Obtiene la respuesta de la IA (desde la caché si existe) o lanza la excepción de la API.
+    
+    ``al_esperar(EnCola)`` se llama periódicamente si la llamada tiene que
+    esperar turno en el limitador de peticiones."""
+    # Las respuestas ya generadas se sirven desde la caché sin gastar tokens
+    ruta = elegir_ruta(mensaje_usuario, contexto)
+    clave = clave_respuesta_ia(mensaje_usuario, contexto, previos, ruta)
+    respuesta_cache = buscar_en_cache(clave)
+    if respuesta_cache is not None:
+        return respuesta_cache
+    
+    # Las consultas idénticas con la misma API key que llegan mientras esta está en curso comparten la llamada
+    return vuelos_ia.ejecutar((clave, huella_api_key(api_key)), lambda: llamar_ia(clave, ruta, mensaje_usuario, contexto, api_key, previos, al_esperar))
+
+# Llamada real a la API (una sola por grupo de consultas idénticas simultáneas)
+def llamar_ia(clave, ruta, mensaje_usuario, contexto="", api_key=None, previos=None, al_esperar=None):
+    """Hace la llamada a la IA, registra su uso y guarda la respuesta en la caché"""
+    # La API key es la de la sesión; si no hay, se usa OPENAI_API_KEY del entorno
+    prompt = preparar_prompt(mensaje_usuario, contexto, previos, ruta)
+    registrar_prompt(prompt, ruta)
+    mensajes = prompt.mensajes
+    tokens = tokens_reservados(mensajes, ruta)
+    limitador_ia.adquirir(api_key, tokens, al_esperar)
+    inicio = time.perf_counter()
+    with metricas.cronometrar("llamada_ia"):
+        # Reintentos, cobertura y cortacircuitos alrededor de la llamada real; cada petición extra toma su turno
+        respuesta = llamar_resiliente(
+            lambda: completar_chat(mensajes, ruta.modelo, ruta.max_tokens, ruta.temperatura, api_key=api_key),
+            circuito_ia,
+            reservar=lambda: limitador_ia.adquirir(api_key, tokens, al_esperar),
+            reservar_cobertura=lambda: limitador_ia.intentar(api_key, tokens)
+        )
+    texto = texto_de_respuesta(respuesta)
+    registrar_uso(mensajes, texto, uso_de_respuesta(respuesta), time.perf_counter() - inicio, ruta)
+    obtener_cache().guardar(clave, texto)
+    return texto
+
+# Función para generar la respuesta del agente IA
+def generar_respuesta_ia(mensaje_usuario, contexto="", api_key=None, previos=None, al_esperar=None):
+    try:
+        return solicitar_respuesta_ia(mensaje_usuario, contexto, api_key, previos, al_esperar)
+    except (CircuitoAbierto, ColaSaturada) as e:
+        return generar_respuesta_sin_ia(mensaje_usuario, contexto, motivo_sin_ia(e))
+    except Exception as e:
+        registrar_respaldo(e)
+        return generar_respuesta_respaldo(mensaje_usuario, e)
+
+# Versión en streaming: devuelve los fragmentos de texto a medida que llegan
+def generar_respuesta_ia_stream(mensaje_usuario, contexto="", api_key=None, previos=None, avisar_cola=False):
+    """Genera la respuesta de la IA fragmento a fragmento.
+    
+    Con ``avisar_cola=True``, mientras la llamada espera turno en el limitador
+    se producen avisos ``EnCola`` antes del primer fragmento de texto."""
+    ruta = elegir_ruta(mensaje_usuario, contexto)
+    clave = clave_respuesta_ia(mensaje_usuario, contexto, previos, ruta)
+    respuesta_cache = buscar_en_cache(clave)
+    if respuesta_cache is not None:
+        yield respuesta_cache
+        return
+    
+    # Todas las sesiones que piden lo mismo a la vez con la misma API key reciben el mismo stream
+    for fragmento in vuelos_ia.transmitir(
+        (clave, huella_api_key(api_key)), lambda: producir_stream_ia(clave, ruta, mensaje_usuario, contexto, api_key, previos)
+    ):
+        if avisar_cola or not isinstance(fragmento, EnCola):
+            yield fragmento
+
+# Stream real de la API, consumido una vez y repartido entre las sesiones que esperan
+def producir_stream_ia(clave, ruta, mensaje_usuario, contexto="", api_key=None, previos=None):
+    """Stream de la llamada a la IA; si falla, termina con la respuesta de respaldo"""
+    prompt = preparar_prompt(mensaje_usuario, contexto, previos, ruta)
+    registrar_prompt(prompt, ruta)
+    mensajes = prompt.mensajes
+    try:
+        # Los avisos de la cola llegan a todas las sesiones que comparten este stream
+        tokens = tokens_reservados(mensajes, ruta)
+        yield from limitador_ia.esperar_turno(api_key, tokens)
+    except ColaSaturada:
+        yield generar_respuesta_sin_ia(mensaje_usuario, contexto, "cola_saturada")
+        return
+    
+    inicio = time.perf_counter()
+    try:
+        # Sin cobertura: dos streams simultáneos no se pueden combinar
+        fragmentos = llamar_resiliente(
+            lambda: completar_chat(mensajes, ruta.modelo, ruta.max_tokens, ruta.temperatura, api_key=api_key, stream=True),
+            circuito_ia,
+            umbral_cobertura=0,
+            reservar=lambda: limitador_ia.adquirir(api_key, tokens)
+        )
+    except CircuitoAbierto:
+        yield generar_respuesta_sin_ia(mensaje_usuario, contexto)
+        return
+    except ColaSaturada:
+        yield generar_respuesta_sin_ia(mensaje_usuario, contexto, "cola_saturada")
+        return
+    except Exception as e:
+        registrar_respaldo(e)
+        yield generar_respuesta_respaldo(mensaje_usuario, e)
+        return
+    
+    partes = []
+    uso = None
+    try:
+        for fragmento in fragmentos:
+            uso = uso_de_respuesta(fragmento) or uso
+            texto = texto_de_fragmento(fragmento)
+            if texto:
+                if not partes:
+                    metricas.observar("ia_primer_token", time.perf_counter() - inicio)
+                partes.append(texto)
+                yield texto
+    except Exception as e:
+        # Un corte a mitad del stream también cuenta como fallo del proveedor
+        if es_transitorio(e):
+            circuito_ia.registrar_fallo()
+        registrar_respaldo(e)
+        yield generar_respuesta_respaldo(mensaje_usuario, e)
+        return
+    
+    # Solo se guarda la respuesta si el stream terminó sin errores
+    texto_completo = "".join(partes)
+    segundos = time.perf_counter() - inicio
+    metricas.observar("ia_stream", segundos)
+    registrar_uso(mensajes, texto_completo, uso, segundos, ruta)
+    obtener_cache().guardar(clave, texto_completo)
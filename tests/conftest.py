@@ -0,0 +1,26 @@
+"""Configuración común de las pruebas.
+
+Los módulos leen sus rutas y su backend de las variables de entorno al
+importarse, así que se fijan aquí, antes de importar nada del proyecto: las
+pruebas nunca escriben en ``.cache`` ni necesitan una API key.
+"""
+import os
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+_TEMPORAL = tempfile.mkdtemp(prefix="asistente-pruebas-")
+os.environ["ESTADO_BACKEND"] = "proceso"
+for variable, nombre in (
+    ("ESTADO_RUTA", "estado.sqlite3"),
+    ("CACHE_RESPUESTAS_RUTA", "respuestas.sqlite3"),
+    ("HISTORIAL_RUTA", "historial.sqlite3"),
+    ("TRABAJOS_RUTA", "trabajos.sqlite3"),
+    ("BIBLIOGRAFIA_INDICE", "bibliografia"),
+    ("DOCUMENTOS_INDICE", "documentos"),
+):
+    os.environ[variable] = os.path.join(_TEMPORAL, nombre)
+os.environ.pop("OPENAI_API_KEY", None)
+os.environ.pop("API_TOKEN", None)
@@ -0,0 +1,170 @@
+import asyncio
+import contextlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import api
+from api import ServidorAPI, iterar_en_hilo
+from metricas import metricas
+
+
+async def con_servidor(prueba, **opciones):
+    """Arranca un ``ServidorAPI`` en un puerto libre y ejecuta ``prueba(puerto)``"""
+    servidor = ServidorAPI(hilos_ia=2, **opciones)
+    puerto = asyncio.get_running_loop().create_future()
+    tarea = asyncio.create_task(servidor.servir("127.0.0.1", 0, al_iniciar=puerto.set_result))
+    try:
+        return await prueba(await puerto)
+    finally:
+        tarea.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await tarea
+        servidor.ejecutor.shutdown(wait=False)
+
+
+def peticion(metodo, ruta, cuerpo=None, cabeceras=None, cerrar=True):
+    """Petición HTTP en bruto; ``cuerpo`` puede ser un dict (JSON) o bytes"""
+    datos = json.dumps(cuerpo).encode("utf-8") if isinstance(cuerpo, dict) else (cuerpo or b"")
+    cabeceras = {"Host": "prueba", "Content-Length": str(len(datos)), **(cabeceras or {})}
+    if cerrar:
+        cabeceras["Connection"] = "close"
+    lineas = "".join(f"{nombre}: {valor}\r\n" for nombre, valor in cabeceras.items())
+    return f"{metodo} {ruta} HTTP/1.1\r\n{lineas}\r\n".encode("latin-1") + datos
+
+
+async def leer_respuesta(lector):
+    """``(estado, cabeceras, cuerpo)`` de una respuesta con Content-Length"""
+    cabecera = (await lector.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+    cabeceras = dict(linea.lower().split(": ", 1) for linea in cabecera[1:] if linea)
+    cuerpo = await lector.readexactly(int(cabeceras.get("content-length", "0")))
+    return int(cabecera[0].split(" ")[1]), cabeceras, cuerpo
+
+
+def enviar(bruto, **opciones):
+    """Envía ``bruto`` a un servidor nuevo y devuelve la respuesta (JSON si lo es)"""
+    async def prueba(puerto):
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        escritor.write(bruto)
+        await escritor.drain()
+        estado, cabeceras, cuerpo = await leer_respuesta(lector)
+        escritor.close()
+        if cabeceras.get("content-type", "").startswith("application/json"):
+            cuerpo = json.loads(cuerpo)
+        return estado, cuerpo
+    return asyncio.run(con_servidor(prueba, **opciones))
+
+
+def test_salud():
+    assert enviar(peticion("GET", "/salud")) == (200, {"estado": "ok"})
+
+
+def test_consulta_con_plantilla():
+    estado, cuerpo = enviar(peticion("POST", "/consulta", {"mensaje": "¿Cómo redacto los objetivos de mi tesis?"}))
+    assert estado == 200
+    assert cuerpo["tipo"] and cuerpo["respuesta"]
+    assert cuerpo["fragmentos"] == []
+
+
+def test_seccion_y_seccion_desconocida():
+    estado, cuerpo = enviar(peticion("POST", "/seccion", {"seccion": "objetivos", "tema": "lectura crítica"}))
+    assert estado == 200 and "lectura crítica" in cuerpo["respuesta"].lower()
+    estado, cuerpo = enviar(peticion("POST", "/seccion", {"seccion": "no-existe", "tema": "x"}))
+    assert estado == 400
+
+
+@pytest.mark.parametrize("bruto, esperado", [
+    (peticion("GET", "/no-existe"), 404),
+    (peticion("GET", "/consulta"), 405),
+    (peticion("POST", "/consulta", b"{no es json"), 400),
+    (peticion("POST", "/consulta", b"[1, 2]"), 400),
+    (peticion("POST", "/consulta", {}), 400),
+    (peticion("POST", "/consulta", cabeceras={"Content-Length": "-5"}), 400),
+    (peticion("POST", "/consulta", cabeceras={"Content-Length": "abc"}), 400),
+    (peticion("POST", "/consulta", cabeceras={"Content-Length": str(api.MAX_CUERPO + 1)}), 413),
+    (peticion("POST", "/consulta", cabeceras={"Transfer-Encoding": "chunked"}), 411),
+])
+def test_errores(bruto, esperado):
+    estado, cuerpo = enviar(bruto)
+    assert estado == esperado
+    assert "error" in cuerpo
+
+
+def test_token_obligatorio_salvo_en_salud():
+    assert enviar(peticion("GET", "/salud"), token="secreto")[0] == 200
+    assert enviar(peticion("GET", "/metricas"), token="secreto")[0] == 401
+    estado, cuerpo = enviar(peticion("GET", "/metricas", cabeceras={"Authorization": "Bearer secreto"}),
+                            token="secreto")
+    assert estado == 200 and isinstance(cuerpo, bytes)
+
+
+def test_lote_conserva_el_orden_y_los_errores():
+    estado, cuerpo = enviar(peticion("POST", "/lote", {"consultas": [
+        {"mensaje": "marco teórico sobre motivación"},
+        {"seccion": "objetivos", "tema": "motivación"},
+        "no es un objeto",
+        {"seccion": "no-existe", "tema": "x"},
+    ]}))
+    assert estado == 200
+    primero, segundo, tercero, cuarto = cuerpo["resultados"]
+    assert "respuesta" in primero and segundo["seccion"] == "objetivos"
+    assert "error" in tercero and "error" in cuarto
+
+
+def test_keep_alive_atiende_varias_peticiones():
+    async def prueba(puerto):
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        estados = []
+        for _ in range(3):
+            escritor.write(peticion("GET", "/salud", cerrar=False))
+            await escritor.drain()
+            estados.append((await leer_respuesta(lector))[0])
+        escritor.close()
+        return estados
+    assert asyncio.run(con_servidor(prueba)) == [200, 200, 200]
+
+
+def test_consulta_en_stream_sse():
+    async def prueba(puerto):
+        lector, escritor = await asyncio.open_connection("127.0.0.1", puerto)
+        escritor.write(peticion("POST", "/consulta", {"mensaje": "metodología cualitativa", "stream": True}))
+        await escritor.drain()
+        datos = await lector.read()
+        escritor.close()
+        return datos.decode("utf-8")
+    respuesta = asyncio.run(con_servidor(prueba))
+    cabecera, _, cuerpo = respuesta.partition("\r\n\r\n")
+    assert "text/event-stream" in cabecera
+    eventos = [bloque.split("\n")[0].removeprefix("event: ") for bloque in cuerpo.strip().split("\n\n")]
+    assert eventos == ["consulta", "fragmento", "fin"]
+
+
+def test_iterar_en_hilo_cierra_el_generador_al_abandonar():
+    cerrado = threading.Event()
+
+    def generador():
+        try:
+            for numero in range(1000):
+                yield numero
+        finally:
+            cerrado.set()
+
+    async def prueba():
+        with ThreadPoolExecutor(max_workers=1) as ejecutor:
+            async with contextlib.aclosing(iterar_en_hilo(generador(), ejecutor)) as elementos:
+                async for elemento in elementos:
+                    if elemento == 2:
+                        break
+            return await asyncio.get_running_loop().run_in_executor(None, cerrado.wait, 5)
+    assert asyncio.run(prueba())
+
+
+def test_las_rutas_desconocidas_comparten_una_serie():
+    antes = metricas.valor("api_peticiones_total", ruta="desconocida", estado="404")
+    for numero in range(5):
+        assert enviar(peticion("GET", f'/sondeo-{numero}"\\'))[0] == 404
+        assert enviar(peticion("GET", f"/sondeo-{numero}"))[0] == 404
+    assert metricas.valor("api_peticiones_total", ruta="desconocida", estado="404") == antes + 10
+    assert "sondeo" not in metricas.exportar_prometheus()
@@ -0,0 +1,145 @@
+import json
+import math
+import os
+import random
+import time
+from collections import Counter
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import bibliografia
+from bibliografia import (BM25_B, BM25_K1, IndiceBibliografico, formatear_apa, indexar, leer_registros,
+                          terminos, terminos_registro)
+
+VOCABULARIO = ("competencias digitales docentes evaluacion formativa aprendizaje colaborativo "
+               "investigacion cualitativa metodologia mixta educacion superior tesis doctoral "
+               "lectura escritura academica motivacion rendimiento").split()
+
+
+def escribir_bib(ruta, registros):
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        for numero, (autor, titulo, anio) in enumerate(registros):
+            archivo.write(f"@article{{r{numero}, author={{{autor}}}, title={{{titulo}}}, "
+                          f"journal={{Revista}}, year={{{anio}}}}}\n\n")
+
+
+def corpus(semilla, cantidad):
+    azar = random.Random(semilla)
+    return [(f"Autor{semilla}_{numero}, Nombre", " ".join(azar.choices(VOCABULARIO, k=azar.randint(3, 9))),
+             2000 + numero % 20) for numero in range(cantidad)]
+
+
+def bm25_referencia(registros, consulta, k):
+    """BM25 calculado registro a registro, para comparar con el índice"""
+    documentos = [Counter(terminos_registro(registro)) for registro in registros]
+    longitud_media = sum(sum(d.values()) for d in documentos) / len(documentos)
+    puntuaciones = []
+    for registro, documento in zip(registros, documentos):
+        puntuacion = 0.0
+        for termino in dict.fromkeys(terminos(consulta)):
+            frecuencia = documento.get(termino, 0)
+            if not frecuencia:
+                continue
+            df = sum(1 for d in documentos if termino in d)
+            idf = math.log(1 + (len(documentos) - df + 0.5) / (df + 0.5))
+            longitud = sum(documento.values())
+            puntuacion += idf * frecuencia * (BM25_K1 + 1) / (
+                frecuencia + BM25_K1 * (1 - BM25_B + BM25_B * longitud / longitud_media))
+        if puntuacion > 0:
+            puntuaciones.append(puntuacion)
+    return sorted(puntuaciones, reverse=True)[:k]
+
+
+def test_lee_bibtex_con_llaves_y_acentos(tmp_path):
+    ruta = tmp_path / "a.bib"
+    ruta.write_text(
+        '@string{rev = "Revista"}\n'
+        '@book{x, author = {P{\\\'e}rez, Juan and Ana G\\"omez}, title = {El {M}arco {Te\\\'orico}},\n'
+        '  publisher = "Editorial", year = 2019, doi = {10.1/abc}}\n'
+        '@misc{sin_titulo, author = {Nadie}}\n', encoding="utf-8")
+    registros = list(leer_registros(str(ruta)))
+    assert len(registros) == 1
+    assert registros[0]["titulo"] == "El Marco Teórico"
+    assert registros[0]["anio"] == "2019"
+    assert len(registros[0]["autores"]) == 2
+    assert formatear_apa(registros[0]).endswith("https://doi.org/10.1/abc")
+
+
+def test_lee_ris_y_csl_json(tmp_path):
+    ris = tmp_path / "a.ris"
+    ris.write_text("TY  - JOUR\nAU  - López, María\nTI  - Evaluación formativa\nPY  - 2021\n"
+                   "JO  - Revista\nKW  - evaluación\nER  - \n", encoding="utf-8")
+    csl = tmp_path / "b.json"
+    csl.write_text(json.dumps([{"title": "Aprendizaje colaborativo", "author": [{"family": "Ruiz", "given": "Eva"}],
+                                "issued": {"date-parts": [[2018]]}, "container-title": ["Educación"]}]),
+                   encoding="utf-8")
+    assert [r["titulo"] for r in leer_registros(str(ris))] == ["Evaluación formativa"]
+    registro = next(leer_registros(str(csl)))
+    assert (registro["anio"], registro["fuente"]) == ("2018", "Educación")
+
+
+def test_reindexacion_incremental(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    indice = str(tmp_path / "indice")
+    escribir_bib(fuentes / "a.bib", corpus(1, 10))
+    escribir_bib(fuentes / "b.bib", corpus(2, 10))
+    assert indexar([str(fuentes)], indice) == (2, 0, 0)
+    assert indexar([str(fuentes)], indice) == (0, 2, 0)
+    time.sleep(0.01)
+    escribir_bib(fuentes / "a.bib", corpus(3, 12))
+    os.remove(fuentes / "b.bib")
+    assert indexar([str(fuentes)], indice) == (1, 0, 1)
+    assert IndiceBibliografico(indice).registros == 12
+
+
+def test_bm25_coincide_con_el_calculo_directo(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir_bib(fuentes / "a.bib", corpus(4, 60))
+    escribir_bib(fuentes / "b.bib", corpus(5, 40))
+    indice_segmentos = str(tmp_path / "segmentos")
+    indexar([str(fuentes)], indice_segmentos)
+    # El mismo catálogo en un único archivo: la puntuación no depende de los segmentos
+    escribir_bib(tmp_path / "todo.bib", corpus(4, 60) + corpus(5, 40))
+    indice_unico = str(tmp_path / "unico")
+    indexar([str(tmp_path / "todo.bib")], indice_unico)
+    registros = list(leer_registros(str(tmp_path / "todo.bib")))
+
+    for consulta in ("evaluación formativa", "competencias digitales docentes", "tesis doctoral metodología"):
+        esperado = bm25_referencia(registros, consulta, 5)
+        for ruta in (indice_segmentos, indice_unico):
+            obtenido = [puntuacion for puntuacion, _ in IndiceBibliografico(ruta).buscar(consulta, 5)]
+            assert obtenido == pytest.approx(esperado, rel=1e-4)
+
+
+def test_consultas_sin_resultados(tmp_path):
+    assert IndiceBibliografico(str(tmp_path / "vacio")).buscar("evaluación") == []
+    escribir_bib(tmp_path / "a.bib", corpus(6, 5))
+    indexar([str(tmp_path / "a.bib")], str(tmp_path / "indice"))
+    indice = IndiceBibliografico(str(tmp_path / "indice"))
+    assert indice.buscar("palabrainexistente") == []
+    assert indice.buscar("de la y") == []
+
+
+def test_la_app_ve_los_registros_tras_reindexar(tmp_path, monkeypatch):
+    monkeypatch.setattr(bibliografia, "_indice", None)
+    bibliografia._referencias_indice.cache_clear()
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir_bib(fuentes / "a.bib", [("Pérez, Juan", "Competencias digitales docentes", 2020)])
+    indexar([str(fuentes)])
+    assert len(bibliografia.buscar_referencias("competencias digitales")) == 1
+    assert bibliografia.buscar_referencias("evaluación formativa") == ()
+
+    time.sleep(0.01)
+    escribir_bib(fuentes / "b.bib", [("Gómez, Ana", "Evaluación formativa en el aula", 2019)])
+    indexar([str(fuentes)])
+    assert "Gómez" in bibliografia.buscar_referencias("evaluación formativa")[0]
+
+    time.sleep(0.01)
+    os.remove(fuentes / "a.bib")
+    indexar([str(fuentes)])
+    assert bibliografia.buscar_referencias("competencias digitales") == ()
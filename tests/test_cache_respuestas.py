@@ -0,0 +1,32 @@
+import pytest
+
+from cache_respuestas import CacheMemoria, CacheRespuestas
+
+
+@pytest.fixture(params=["sqlite", "memoria"])
+def cache(request, tmp_path):
+    if request.param == "sqlite":
+        return CacheRespuestas(str(tmp_path / "cache.sqlite3"), ttl=60)
+    return CacheMemoria(ttl=60)
+
+
+def test_obtener_cuenta_aciertos_y_fallos(cache):
+    cache.guardar("clave", "respuesta")
+    assert cache.obtener("clave") == "respuesta"
+    assert cache.obtener("otra") is None
+    estadisticas = cache.estadisticas()
+    assert (estadisticas["aciertos"], estadisticas["fallos"]) == (1, 1)
+
+
+def test_contiene_no_altera_los_contadores(cache):
+    cache.guardar("clave", "respuesta")
+    assert cache.contiene("clave")
+    assert not cache.contiene("otra")
+    estadisticas = cache.estadisticas()
+    assert (estadisticas["aciertos"], estadisticas["fallos"]) == (0, 0)
+
+
+def test_contiene_respeta_la_caducidad(cache):
+    cache.guardar("clave", "respuesta")
+    cache.ttl = -1
+    assert not cache.contiene("clave")
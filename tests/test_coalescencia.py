@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import respuestas_ia
+from coalescencia import VueloUnico
+
+
+def test_llamadas_identicas_comparten_una_sola_ejecucion():
+    vuelos = VueloUnico("prueba")
+    llamadas = []
+    liberar = threading.Event()
+
+    def funcion():
+        llamadas.append(1)
+        liberar.wait(5)
+        return "respuesta"
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futuros = [pool.submit(vuelos.ejecutar, "clave", funcion) for _ in range(8)]
+        time.sleep(0.1)
+        liberar.set()
+        resultados = [futuro.result(5) for futuro in futuros]
+    assert resultados == ["respuesta"] * 8
+    assert len(llamadas) == 1
+    assert vuelos.en_curso() == 0
+
+
+def test_claves_distintas_no_se_agrupan():
+    vuelos = VueloUnico("prueba")
+    llamadas = []
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futuros = [pool.submit(vuelos.ejecutar, clave, lambda clave=clave: llamadas.append(clave) or clave)
+                   for clave in ("a", "b", "c")]
+        assert sorted(futuro.result(5) for futuro in futuros) == ["a", "b", "c"]
+    assert sorted(llamadas) == ["a", "b", "c"]
+
+
+def test_el_error_llega_a_todos_los_que_esperan():
+    vuelos = VueloUnico("prueba")
+    liberar = threading.Event()
+
+    def funcion():
+        liberar.wait(5)
+        raise RuntimeError("fallo del proveedor")
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futuros = [pool.submit(vuelos.ejecutar, "clave", funcion) for _ in range(4)]
+        time.sleep(0.1)
+        liberar.set()
+        for futuro in futuros:
+            with pytest.raises(RuntimeError):
+                futuro.result(5)
+    # Tras el error, la siguiente llamada vuelve a ejecutarse
+    assert vuelos.ejecutar("clave", lambda: "de nuevo") == "de nuevo"
+
+
+def test_stream_compartido_incluye_a_quien_llega_tarde():
+    vuelos = VueloUnico("prueba")
+    generados = []
+    siguiente = threading.Event()
+
+    def generar():
+        for parte in ("uno ", "dos ", "tres"):
+            generados.append(parte)
+            yield parte
+            siguiente.wait(5)
+    primero = vuelos.transmitir("clave", generar)
+    assert next(primero) == "uno "
+    # Se une cuando ya hay un fragmento producido: lo recibe igualmente
+    tarde = vuelos.transmitir("clave", lambda: pytest.fail("no debe generar un segundo stream"))
+    siguiente.set()
+    assert "uno " + "".join(primero) == "uno dos tres"
+    assert "".join(tarde) == "uno dos tres"
+    assert len(generados) == 3
+
+
+def test_abandonar_el_stream_no_corta_a_los_demas():
+    vuelos = VueloUnico("prueba")
+
+    def generar():
+        for numero in range(5):
+            time.sleep(0.01)
+            yield str(numero)
+    primero = vuelos.transmitir("clave", generar)
+    segundo = vuelos.transmitir("clave", generar)
+    assert next(primero) == "0"
+    primero.close()
+    assert "".join(segundo) == "01234"
+
+
+def test_error_en_el_stream_llega_a_los_consumidores():
+    vuelos = VueloUnico("prueba")
+
+    def generar():
+        yield "parcial"
+        raise RuntimeError("corte")
+    transmision = vuelos.transmitir("clave", generar)
+    assert next(transmision) == "parcial"
+    with pytest.raises(RuntimeError):
+        next(transmision)
+
+
+def test_cada_api_key_hace_su_propia_llamada(monkeypatch):
+    monkeypatch.setattr(respuestas_ia, "vuelos_ia", VueloUnico("prueba"))
+    monkeypatch.setattr(respuestas_ia, "buscar_en_cache", lambda clave: None)
+    claves = []
+    liberar = threading.Event()
+
+    def llamar_ia(clave, ruta, mensaje, contexto="", api_key=None, *argumentos):
+        claves.append(api_key)
+        liberar.wait(5)
+        return f"respuesta para {api_key}"
+    monkeypatch.setattr(respuestas_ia, "llamar_ia", llamar_ia)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futuros = [pool.submit(respuestas_ia.solicitar_respuesta_ia, "¿Qué es un marco teórico?", "", api_key)
+                   for api_key in ("sk-una", "sk-una", "sk-otra", "sk-otra")]
+        time.sleep(0.1)
+        liberar.set()
+        resultados = [futuro.result(5) for futuro in futuros]
+    assert sorted(claves) == ["sk-otra", "sk-una"]
+    assert resultados == ["respuesta para sk-una"] * 2 + ["respuesta para sk-otra"] * 2
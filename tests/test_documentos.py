@@ -0,0 +1,170 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import documentos
+from documentos import (ENCABEZADO_FRAGMENTOS, IndiceDocumentos, embeddings_hashing, fragmentar,
+                        separar_fragmentos)
+
+
+def escribir(ruta, tema, palabras=400):
+    """Documento de texto cuyo vocabulario depende de ``tema``"""
+    ruta.write_text(" ".join(f"{tema} termino{numero % 37} {tema}{numero % 11}" for numero in range(palabras // 3)),
+                    encoding="utf-8")
+
+
+def crear_indice(tmp_path, **opciones):
+    return IndiceDocumentos(str(tmp_path / "indice"), **opciones)
+
+
+def test_fragmentar_con_solape():
+    palabras = [f"p{numero}" for numero in range(25)]
+    fragmentos = list(fragmentar([" ".join(palabras[:7]), " ".join(palabras[7:])], palabras=10, solape=3))
+    assert fragmentos[0].split() == palabras[0:10]
+    assert fragmentos[1].split() == palabras[7:17]
+    assert fragmentos[2].split() == palabras[14:24]
+    # El resto (p21..p24) aporta una palabra nueva además del solape
+    assert fragmentos[3].split() == palabras[21:25]
+    assert list(fragmentar(["a b c"], palabras=10, solape=3)) == ["a b c"]
+    assert list(fragmentar(["a b c d e f g h i j"], palabras=10, solape=3)) == ["a b c d e f g h i j"]
+
+
+def test_busca_los_fragmentos_del_documento_relevante(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir(fuentes / "vygotsky.txt", "vygotsky")
+    escribir(fuentes / "piaget.md", "piaget")
+    indice = crear_indice(tmp_path)
+    ingeridos, conservados, retirados, fallidos = indice.indexar([str(fuentes)])
+    assert (ingeridos, conservados, retirados, fallidos) == (2, 0, 0, [])
+    resultados = indice.buscar(["vygotsky termino3", "piaget"], k=2)
+    assert [documento for _, documento, _ in resultados[0]] == ["vygotsky.txt"] * 2
+    assert [documento for _, documento, _ in resultados[1]] == ["piaget.md"] * 2
+    similitudes = [similitud for similitud, _, _ in resultados[0]]
+    assert similitudes == sorted(similitudes, reverse=True)
+
+
+def test_reindexacion_incremental_y_compactacion(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir(fuentes / "a.txt", "alfa")
+    escribir(fuentes / "b.txt", "beta")
+    indice = crear_indice(tmp_path)
+    indice.indexar([str(fuentes)])
+    assert indice.indexar([str(fuentes)])[:3] == (0, 2, 0)
+
+    time.sleep(0.01)
+    escribir(fuentes / "a.txt", "gamma")
+    assert indice.indexar([str(fuentes)])[:3] == (1, 1, 0)
+    # La versión anterior de a.txt ya no aparece en los resultados
+    assert all(documento == "b.txt" for _, documento, _ in indice.buscar(["alfa"])[0])
+
+    os.remove(fuentes / "b.txt")
+    assert indice.indexar([str(fuentes)])[:3] == (0, 1, 1)
+    # Las filas inactivas superan a las activas: se compacta en una generación nueva
+    assert indice.manifiesto["generacion"] == 1
+    assert indice.manifiesto["filas"] == sum(d["fin"] - d["inicio"] for d in indice.manifiesto["documentos"].values())
+    assert sorted(os.listdir(indice.ruta)) == ["finales.1.u64", "manifiesto.json", "textos.1.bin", "vectores.1.f32"]
+    resultados = IndiceDocumentos(indice.ruta).buscar(["gamma termino5"])[0]
+    assert resultados and all(documento == "a.txt" for _, documento, _ in resultados)
+    assert all("gamma" in texto for _, _, texto in resultados)
+
+
+def test_un_lector_abierto_sobrevive_a_la_compactacion(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    for nombre in ("a", "b", "c"):
+        escribir(fuentes / f"{nombre}.txt", f"antes{nombre}")
+    escritor = crear_indice(tmp_path)
+    escritor.indexar([str(fuentes)])
+    lector = IndiceDocumentos(escritor.ruta)
+    antes = lector.buscar(["antesb"])[0]
+
+    # Otro proceso reindexa y compacta, pero el lector aún no ha visto el manifiesto nuevo
+    version = lector._abierto[0]
+    lector._version = lambda: version
+    time.sleep(0.01)
+    for nombre in ("a", "b"):
+        escribir(fuentes / f"{nombre}.txt", f"despues{nombre}")
+    os.remove(fuentes / "c.txt")
+    escritor.indexar([str(fuentes)])
+    assert escritor.manifiesto["generacion"] == 1
+    assert lector.buscar(["antesb"])[0] == antes
+
+    del lector._version
+    assert all("despuesb" in texto for _, _, texto in lector.buscar(["despuesb"])[0])
+
+
+def test_un_fallo_a_medias_deja_el_indice_como_estaba(tmp_path, monkeypatch):
+    monkeypatch.setattr(documentos, "LOTE_EMBEDDINGS", 2)
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir(fuentes / "bueno.txt", "bueno")
+    llamadas = []
+
+    def embeddings(textos):
+        llamadas.append(1)
+        if len(llamadas) > 3 and any("malo" in texto for texto in textos):
+            raise RuntimeError("modelo caído")
+        return embeddings_hashing(textos)
+    indice = crear_indice(tmp_path, funcion=embeddings, nombre_funcion="prueba")
+    indice.indexar([str(fuentes)])
+    tamanos = indice._tamanos()
+    manifiesto = dict(indice.manifiesto)
+
+    escribir(fuentes / "malo.txt", "malo", palabras=3000)
+    ingeridos, _, _, fallidos = indice.indexar([str(fuentes)])
+    assert ingeridos == 0
+    assert [os.path.basename(ruta) for ruta, _ in fallidos] == ["malo.txt"]
+    assert indice._tamanos() == tamanos
+    assert indice.manifiesto["filas"] == manifiesto["filas"]
+    assert all(documento == "bueno.txt" for _, documento, _ in IndiceDocumentos(
+        indice.ruta, funcion=embeddings_hashing, nombre_funcion="prueba").buscar(["bueno"])[0])
+
+
+def test_otra_funcion_de_embeddings_empieza_de_cero(tmp_path):
+    fuentes = tmp_path / "fuentes"
+    fuentes.mkdir()
+    escribir(fuentes / "a.txt", "alfa")
+    crear_indice(tmp_path).indexar([str(fuentes)])
+    otra = crear_indice(tmp_path, funcion=lambda textos: embeddings_hashing(textos, 64), nombre_funcion="otra")
+    with pytest.raises(ValueError):
+        otra.buscar(["alfa"])
+    assert otra.indexar([str(fuentes)])[:2] == (1, 0)
+    assert otra.manifiesto["dimension"] == 64
+    assert otra.buscar(["alfa"])[0]
+
+
+def test_cada_conversacion_solo_recupera_sus_documentos(tmp_path, monkeypatch):
+    for nombre in ("ana", "luis", "comun"):
+        (tmp_path / nombre).mkdir()
+        escribir(tmp_path / nombre / f"{nombre}.txt", "metodologia")
+    indice = crear_indice(tmp_path)
+    indice.indexar([str(tmp_path / "ana")], "ana")
+    indice.indexar([str(tmp_path / "luis")], "luis")
+    indice.indexar([str(tmp_path / "comun")])
+    # Reindexar la conversación de Ana no retira los documentos de las demás
+    assert indice.indexar([str(tmp_path / "ana")], "ana")[:3] == (0, 1, 0)
+    assert {documento for _, documento, _ in indice.buscar(["metodologia"], k=20)[0]} == {
+        "ana.txt", "luis.txt", "comun.txt"}
+    assert {documento for _, documento, _ in indice.buscar(["metodologia"], k=20, propietarios={"ana"})[0]} == {
+        "ana.txt"}
+
+    monkeypatch.setattr(documentos, "RUTA_INDICE", indice.ruta)
+    monkeypatch.setattr(documentos, "_indice", indice)
+    monkeypatch.setattr(documentos, "COMPARTIDOS", False)
+    _, fragmentos = documentos.contexto_con_documentos("metodologia", conversacion="luis")
+    assert fragmentos and {documento for _, documento, _ in fragmentos} == {"luis.txt"}
+    assert documentos.contexto_con_documentos("metodologia", "Tesis") == ("Tesis", [])
+    monkeypatch.setattr(documentos, "COMPARTIDOS", True)
+    _, fragmentos = documentos.contexto_con_documentos("metodologia", k=20, conversacion="luis")
+    assert {documento for _, documento, _ in fragmentos} == {"luis.txt", "comun.txt"}
+
+
+def test_separar_fragmentos():
+    contexto = f"Tesis sobre TIC\n\n{ENCABEZADO_FRAGMENTOS}\n[a.txt] uno\n\n[b.txt] dos"
+    assert separar_fragmentos(contexto) == ("Tesis sobre TIC", ["[a.txt] uno", "[b.txt] dos"])
+    assert separar_fragmentos("solo contexto") == ("solo contexto", [])
@@ -0,0 +1,22 @@
+import time
+
+import pytest
+
+import estado_compartido
+from estado_compartido import EstadoArchivo, EstadoEnProceso
+
+
+@pytest.fixture(params=["archivo", "proceso"])
+def estado(request, tmp_path):
+    if request.param == "archivo":
+        return EstadoArchivo(str(tmp_path / "estado.sqlite3"))
+    return EstadoEnProceso()
+
+
+def test_las_instantaneas_de_procesos_parados_se_descartan(estado, monkeypatch):
+    monkeypatch.setattr(estado_compartido, "RETENCION_INSTANTANEAS", 0.2)
+    estado.publicar("metricas:parado", {"proceso": "parado"})
+    time.sleep(0.3)
+    estado.publicar("metricas:vivo", {"proceso": "vivo"})
+    estado.publicar("otras:vivo", {"proceso": "otro"})
+    assert estado.instantaneas("metricas:") == [{"proceso": "vivo"}]
@@ -0,0 +1,94 @@
+import pytest
+
+from historial import AlmacenHistorial, AlmacenHistorialMemoria, HistorialSesion, exportar_markdown
+
+
+@pytest.fixture(params=["sqlite", "memoria"])
+def almacen(request, tmp_path):
+    if request.param == "sqlite":
+        return AlmacenHistorial(str(tmp_path / "historial.sqlite3"))
+    return AlmacenHistorialMemoria()
+
+
+def mensaje(numero):
+    return {"role": "user" if numero % 2 == 0 else "assistant", "content": f"mensaje {numero}"}
+
+
+def llenar(almacen, conversacion, cantidad):
+    for numero in range(cantidad):
+        almacen.anadir(conversacion, mensaje(numero)["role"], mensaje(numero)["content"])
+
+
+def test_anadir_devuelve_posiciones_consecutivas(almacen):
+    assert [almacen.anadir("c", "user", f"m{i}") for i in range(3)] == [0, 1, 2]
+    assert almacen.anadir("otra", "user", "m") == 0
+    assert almacen.contar("c") == 3
+
+
+def test_leer_y_recorrer_por_bloques(almacen):
+    llenar(almacen, "c", 25)
+    assert almacen.leer("c", 10, 13) == [mensaje(10), mensaje(11), mensaje(12)]
+    assert list(almacen.recorrer("c", filas_por_lectura=4)) == [mensaje(i) for i in range(25)]
+    assert almacen.leer("vacia", 0, 10) == []
+
+
+def test_sesion_guarda_en_memoria_solo_la_ventana(almacen):
+    llenar(almacen, "c", 30)
+    historial = HistorialSesion(almacen, "c", ventana=10)
+    assert len(historial) == 30
+    assert len(historial.recientes) == 10
+    assert historial.inicio_memoria == 20
+
+
+def test_sesion_se_comporta_como_una_lista(almacen):
+    llenar(almacen, "c", 30)
+    historial = HistorialSesion(almacen, "c", ventana=10)
+    esperado = [mensaje(i) for i in range(30)]
+    assert historial[0] == esperado[0]
+    assert historial[25] == esperado[25]
+    assert historial[-1] == esperado[-1]
+    # Cortes que caen en el disco, en la ventana o en ambos
+    assert historial[5:8] == esperado[5:8]
+    assert historial[22:28] == esperado[22:28]
+    assert historial[15:25] == esperado[15:25]
+    assert historial[-4:] == esperado[-4:]
+    assert historial[::7] == esperado[::7]
+    assert historial[10:5] == []
+    assert list(historial) == esperado
+    with pytest.raises(IndexError):
+        historial[30]
+
+
+def test_append_guarda_en_el_almacen(almacen):
+    historial = HistorialSesion(almacen, "c", ventana=3)
+    for numero in range(5):
+        historial.append(mensaje(numero))
+    assert len(historial) == 5
+    assert len(historial.recientes) == 3
+    assert HistorialSesion(almacen, "c")[:] == [mensaje(i) for i in range(5)]
+
+
+def test_sincroniza_los_mensajes_de_otras_sesiones(almacen):
+    primera = HistorialSesion(almacen, "c")
+    segunda = HistorialSesion(almacen, "c")
+    primera.append(mensaje(0))
+    assert segunda.sincronizar() == 1
+    assert segunda.sincronizar() == 0
+    # Si otra sesión escribió entretanto, append lee también lo que faltaba
+    primera.append(mensaje(1))
+    segunda.append(mensaje(2))
+    assert segunda[:] == [mensaje(0), mensaje(1), mensaje(2)]
+    assert len(segunda) == 3
+
+
+def test_exportar_markdown(almacen):
+    llenar(almacen, "c", 2)
+    texto = "".join(exportar_markdown(almacen, "c"))
+    assert texto.startswith("# Conversación c")
+    assert "mensaje 0" in texto and "mensaje 1" in texto
+
+
+def test_el_historial_sobrevive_a_reabrir_el_archivo(tmp_path):
+    ruta = str(tmp_path / "historial.sqlite3")
+    HistorialSesion(AlmacenHistorial(ruta), "c").append(mensaje(0))
+    assert HistorialSesion(AlmacenHistorial(ruta), "c")[:] == [mensaje(0)]
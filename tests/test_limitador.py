@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+import resiliencia
+import respuestas_ia
+from enrutamiento import elegir_ruta
+from estado_compartido import EstadoEnProceso
+from limitador import ColaSaturada, EnCola, LimitadorIA
+from resiliencia import Cortacircuitos, llamar_resiliente
+
+
+def crear_limitador(peticiones_por_minuto=600, tokens_por_minuto=1_000_000, espera_maxima=5):
+    return LimitadorIA(peticiones_por_minuto, tokens_por_minuto, espera_maxima, estado=EstadoEnProceso())
+
+
+def agotar(limitador, api_key="clave"):
+    """Consume todo el saldo de peticiones disponible ahora mismo"""
+    while limitador.intentar(api_key, 1):
+        pass
+
+
+def test_el_cubo_deja_pasar_hasta_su_capacidad():
+    limitador = crear_limitador(peticiones_por_minuto=5, espera_maxima=0)
+    for _ in range(5):
+        limitador.adquirir("clave", 10)
+    with pytest.raises(ColaSaturada):
+        limitador.adquirir("clave", 10)
+
+
+def test_cada_api_key_tiene_su_cuota():
+    limitador = crear_limitador(peticiones_por_minuto=1, espera_maxima=0)
+    limitador.adquirir("una", 10)
+    limitador.adquirir("otra", 10)
+    with pytest.raises(ColaSaturada):
+        limitador.adquirir("una", 10)
+
+
+def test_cuota_de_tokens():
+    limitador = crear_limitador(tokens_por_minuto=1000, espera_maxima=0)
+    limitador.adquirir("clave", 600)
+    with pytest.raises(ColaSaturada):
+        limitador.adquirir("clave", 600)
+
+
+def test_la_cola_atiende_en_orden_de_llegada():
+    limitador = crear_limitador(peticiones_por_minuto=600)
+    agotar(limitador)
+    orden = []
+    hilos = []
+    for numero in range(4):
+        hilo = threading.Thread(target=lambda numero=numero: (limitador.adquirir("clave", 1), orden.append(numero)))
+        hilo.start()
+        hilos.append(hilo)
+        # Cada hilo entra en la cola antes de lanzar el siguiente
+        while limitador.en_espera() < numero + 1 and not orden:
+            time.sleep(0.001)
+    for hilo in hilos:
+        hilo.join(5)
+    assert orden == [0, 1, 2, 3]
+    assert limitador.en_espera() == 0
+
+
+def test_avisa_de_la_posicion_mientras_espera():
+    limitador = crear_limitador(peticiones_por_minuto=120)
+    agotar(limitador)
+    avisos = list(limitador.esperar_turno("clave", 1, intervalo=0.1))
+    assert avisos and all(isinstance(aviso, EnCola) for aviso in avisos)
+    assert avisos[0].posicion == 1
+    assert avisos[0].segundos > 0
+
+
+def test_rechaza_si_la_espera_estimada_es_excesiva():
+    limitador = crear_limitador(peticiones_por_minuto=60, espera_maxima=0.5)
+    agotar(limitador)
+    with pytest.raises(ColaSaturada):
+        limitador.adquirir("clave", 1)
+    assert limitador.en_espera() == 0
+
+
+def test_abandonar_la_espera_libera_el_turno():
+    limitador = crear_limitador(peticiones_por_minuto=60)
+    agotar(limitador)
+    espera = limitador.esperar_turno("clave", 1, intervalo=0.01)
+    next(espera)
+    assert limitador.en_espera() == 1
+    espera.close()
+    assert limitador.en_espera() == 0
+
+
+def test_intentar_no_se_cuela_delante_de_la_cola():
+    limitador = crear_limitador(peticiones_por_minuto=600)
+    agotar(limitador)
+    espera = limitador.esperar_turno("clave", 1, intervalo=0.01)
+    next(espera)
+    time.sleep(0.2)  # ya hay saldo para una petición, pero le corresponde a la que espera
+    assert not limitador.intentar("clave", 1)
+    espera.close()
+
+
+def test_cada_reintento_toma_su_turno(monkeypatch):
+    monkeypatch.setattr(resiliencia, "es_transitorio", lambda error: isinstance(error, TimeoutError))
+    monkeypatch.setattr(resiliencia, "espera_reintento", lambda intento: 0)
+    limitador = crear_limitador(peticiones_por_minuto=2, espera_maxima=0.2)
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        raise TimeoutError()
+    limitador.adquirir("clave", 10)
+    circuito = Cortacircuitos(nombre="prueba")
+    with pytest.raises(ColaSaturada):
+        llamar_resiliente(funcion, circuito, max_reintentos=3, reservar=lambda: limitador.adquirir("clave", 10))
+    # La primera llamada y un reintento caben en la cuota; el segundo reintento ya no sale
+    assert len(llamadas) == 2
+    assert circuito.fallos_seguidos == 1
+
+
+def test_llamar_ia_no_reintenta_fuera_de_la_cuota(monkeypatch):
+    monkeypatch.setattr(resiliencia, "es_transitorio", lambda error: isinstance(error, TimeoutError))
+    monkeypatch.setattr(resiliencia, "espera_reintento", lambda intento: 0)
+    monkeypatch.setattr(respuestas_ia, "limitador_ia", crear_limitador(peticiones_por_minuto=3, espera_maxima=0.2))
+    monkeypatch.setattr(respuestas_ia, "circuito_ia", Cortacircuitos(nombre="prueba"))
+    llamadas = []
+
+    def completar_chat(*argumentos, **opciones):
+        llamadas.append(1)
+        raise TimeoutError()
+    monkeypatch.setattr(respuestas_ia, "completar_chat", completar_chat)
+    mensaje = "¿Qué es la investigación cualitativa?"
+    ruta = elegir_ruta(mensaje, "")
+    with pytest.raises(ColaSaturada):
+        respuestas_ia.llamar_ia("clave-prueba", ruta, mensaje, api_key="sk-prueba")
+    assert len(llamadas) == 3
@@ -0,0 +1,23 @@
+import json
+
+from lote import generar_lote, leer_filas
+
+
+def test_las_filas_repetidas_se_generan_una_vez(tmp_path):
+    entrada = tmp_path / "temas.jsonl"
+    entrada.write_text("\n".join(json.dumps(fila, ensure_ascii=False) for fila in [
+        {"tema": "Uso de TIC en el aula"},
+        {"tema": "Uso de TIC en el aula "},
+        {"tema": "Evaluación formativa", "contexto": "primaria"},
+        {"tema": "Otro tema", "id": "1"},
+        {"tema": "Otro tema más", "id": "1"},
+    ]), encoding="utf-8")
+    salida = tmp_path / "borradores.jsonl"
+    resumen = generar_lote(leer_filas(str(entrada)), str(salida), ["objetivos"], concurrencia=2)
+    assert (resumen["generadas"], resumen["duplicadas"], resumen["errores"]) == (3, 2, 0)
+    identificadores = [json.loads(linea)["id"] for linea in salida.read_text(encoding="utf-8").splitlines()]
+    assert len(identificadores) == len(set(identificadores)) == 3
+
+    # Al reanudar no se vuelve a generar nada
+    resumen = generar_lote(leer_filas(str(entrada)), str(salida), ["objetivos"])
+    assert (resumen["generadas"], resumen["omitidas"], resumen["duplicadas"]) == (0, 3, 2)
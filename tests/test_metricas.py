@@ -0,0 +1,7 @@
+from metricas import RegistroMetricas
+
+
+def test_escapa_los_valores_de_las_etiquetas():
+    registro = RegistroMetricas(ruta_log_json=None)
+    registro.incrementar("errores_total", tipo='dice "hola"\\ y\nsigue')
+    assert 'errores_total{tipo="dice \\"hola\\"\\\\ y\\nsigue"} 1' in registro.exportar_prometheus()
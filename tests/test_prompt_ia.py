@@ -0,0 +1,45 @@
+import logging
+
+import prompt_ia
+from contexto_conversacion import ENCABEZADO_RESUMEN
+from enrutamiento import elegir_ruta
+from prompt_ia import construir_prompt, registrar_prompt
+
+MENSAJE = "¿Qué es la investigación cualitativa?"
+
+
+def turnos(cantidad, palabras=60):
+    return [{"role": "user" if numero % 2 == 0 else "assistant",
+             "content": f"turno{numero} " + "palabra " * palabras} for numero in range(cantidad)]
+
+
+def test_recorta_los_turnos_antiguos_y_conserva_el_resumen(monkeypatch):
+    resumen = {"role": "system", "content": f"{ENCABEZADO_RESUMEN}\nSe habló del marco teórico."}
+    previos = [resumen] + turnos(10)
+    ruta = elegir_ruta(MENSAJE, "")
+    monkeypatch.setattr(prompt_ia, "MAX_TOKENS_PROMPT", construir_prompt(MENSAJE, ruta, previos=previos).tokens - 200)
+    prompt = construir_prompt(MENSAJE, ruta, previos=previos)
+    historial = prompt.mensajes[1:-1]
+    assert prompt.recortes["historial"] >= 1
+    assert historial[0] == resumen
+    assert historial[1:] == previos[-len(historial) + 1:]
+
+
+def test_el_resumen_se_quita_cuando_no_queda_nada_mas(monkeypatch):
+    resumen = {"role": "system", "content": f"{ENCABEZADO_RESUMEN}\n" + "detalle " * 400}
+    ruta = elegir_ruta(MENSAJE, "")
+    monkeypatch.setattr(prompt_ia, "MAX_TOKENS_PROMPT", 300)
+    prompt = construir_prompt(MENSAJE, ruta, previos=[resumen] + turnos(2))
+    assert prompt.recortes["historial"] == 3
+    assert [mensaje["role"] for mensaje in prompt.mensajes] == ["system", "user"]
+
+
+def test_avisa_en_el_log_cerca_del_limite(monkeypatch, caplog):
+    ruta = elegir_ruta(MENSAJE, "")
+    monkeypatch.setattr(prompt_ia, "MAX_TOKENS_PROMPT", 400)
+    # El mensaje se trunca hasta llenar el espacio disponible
+    prompt = construir_prompt(MENSAJE + " palabra" * 1000, ruta)
+    with caplog.at_level(logging.WARNING, logger="prompt_ia"):
+        registrar_prompt(prompt, ruta)
+    assert any(ruta.nombre in registro.getMessage() and str(prompt.tokens) in registro.getMessage()
+               and "400" in registro.getMessage() for registro in caplog.records)
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+import resiliencia
+from metricas import metricas
+from resiliencia import (ABIERTO, CERRADO, SEMIABIERTO, CircuitoAbierto, Cortacircuitos, espera_reintento,
+                         llamar_con_cobertura, llamar_resiliente)
+
+
+class ErrorTransitorio(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def sin_openai(monkeypatch):
+    # Sin depender de openai: ErrorTransitorio hace de 429/5xx y los reintentos no esperan
+    monkeypatch.setattr(resiliencia, "es_transitorio", lambda error: isinstance(error, ErrorTransitorio))
+    monkeypatch.setattr(resiliencia, "espera_reintento", lambda intento: 0)
+
+
+def fallar_veces(veces, resultado="ok"):
+    """Función que lanza ``ErrorTransitorio`` las primeras ``veces`` llamadas"""
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        if len(llamadas) <= veces:
+            raise ErrorTransitorio()
+        return resultado
+    return funcion, llamadas
+
+
+def test_espera_reintento_crece_y_se_acota():
+    for intento in range(12):
+        espera = espera_reintento(intento, base=0.5, maximo=8)
+        assert 0 <= espera <= min(8, 0.5 * 2 ** intento)
+
+
+def test_cortacircuitos_abre_tras_el_umbral():
+    circuito = Cortacircuitos(umbral_fallos=3, segundos_apertura=60, nombre="prueba")
+    for _ in range(2):
+        assert circuito.permitir()
+        circuito.registrar_fallo()
+    assert circuito.estado == CERRADO
+    circuito.registrar_fallo()
+    assert circuito.estado == ABIERTO
+    assert not circuito.permitir()
+
+
+def test_cortacircuitos_exito_reinicia_los_fallos():
+    circuito = Cortacircuitos(umbral_fallos=2, segundos_apertura=60, nombre="prueba")
+    circuito.registrar_fallo()
+    circuito.registrar_exito()
+    circuito.registrar_fallo()
+    assert circuito.estado == CERRADO
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba():
+    circuito = Cortacircuitos(umbral_fallos=1, segundos_apertura=0.05, nombre="prueba")
+    circuito.registrar_fallo()
+    assert not circuito.permitir()
+    time.sleep(0.06)
+    assert circuito.permitir()
+    assert circuito.estado == SEMIABIERTO
+    assert not circuito.permitir()
+    circuito.registrar_exito()
+    assert circuito.estado == CERRADO
+    assert circuito.permitir()
+
+
+def test_fallo_en_semiabierto_vuelve_a_abrir():
+    circuito = Cortacircuitos(umbral_fallos=5, segundos_apertura=0.05, nombre="prueba")
+    for _ in range(5):
+        circuito.registrar_fallo()
+    time.sleep(0.06)
+    assert circuito.permitir()
+    circuito.registrar_fallo()
+    assert circuito.estado == ABIERTO
+    assert circuito.resumen()["segundos_para_reintentar"] > 0
+
+
+def test_reintenta_los_errores_transitorios():
+    funcion, llamadas = fallar_veces(2)
+    circuito = Cortacircuitos(nombre="prueba")
+    assert llamar_resiliente(funcion, circuito, max_reintentos=3) == "ok"
+    assert len(llamadas) == 3
+    assert circuito.fallos_seguidos == 0
+
+
+def test_agota_los_reintentos_y_cuenta_un_fallo():
+    funcion, llamadas = fallar_veces(10)
+    circuito = Cortacircuitos(nombre="prueba")
+    with pytest.raises(ErrorTransitorio):
+        llamar_resiliente(funcion, circuito, max_reintentos=2)
+    assert len(llamadas) == 3
+    assert circuito.fallos_seguidos == 1
+
+
+def test_no_reintenta_los_errores_permanentes():
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        raise ValueError("API key inválida")
+    circuito = Cortacircuitos(umbral_fallos=1, nombre="prueba")
+    with pytest.raises(ValueError):
+        llamar_resiliente(funcion, circuito)
+    assert len(llamadas) == 1
+    assert circuito.estado == CERRADO
+
+
+def test_circuito_abierto_no_llama():
+    funcion, llamadas = fallar_veces(0)
+    circuito = Cortacircuitos(umbral_fallos=1, segundos_apertura=60, nombre="prueba")
+    circuito.registrar_fallo()
+    with pytest.raises(CircuitoAbierto):
+        llamar_resiliente(funcion, circuito)
+    assert llamadas == []
+
+
+def test_cobertura_devuelve_la_copia_mas_rapida():
+    llamadas = []
+    lock = threading.Lock()
+
+    def funcion():
+        with lock:
+            llamadas.append(1)
+            primera = len(llamadas) == 1
+        time.sleep(1.0 if primera else 0.01)
+        return "lenta" if primera else "rapida"
+    ganadas = metricas.valor("ia_coberturas_ganadas_total")
+    assert llamar_con_cobertura(funcion, umbral=0.05) == "rapida"
+    assert len(llamadas) == 2
+    assert metricas.valor("ia_coberturas_ganadas_total") == ganadas + 1
+
+
+def test_cobertura_sin_cuota_no_lanza_la_copia():
+    llamadas = []
+
+    def funcion():
+        llamadas.append(1)
+        time.sleep(0.1)
+        return "ok"
+    assert llamar_con_cobertura(funcion, umbral=0.02, reservar_cobertura=lambda: False) == "ok"
+    assert len(llamadas) == 1
@@ -0,0 +1,295 @@
+"""Cola de trabajos en segundo plano para las generaciones largas de la IA.
+
+Una consulta a la IA o un borrador completo pueden tardar decenas de segundos.
+En lugar de ejecutarlos en el hilo del script de Streamlit (que deja bloqueada
+la interfaz de esa sesión y pierde el trabajo si el usuario cambia de página),
+se envían a un pool de hilos del proceso y reciben un identificador. El texto
+parcial y el resultado se guardan en el almacén de trabajos a medida que
+avanzan; la interfaz solo sondea el almacén.
+
+Los trabajos se asocian a la conversación de la URL: al recargar la página se
+ven los que siguen en curso y los ya terminados, sin volver a generarlos. La
+respuesta de una consulta del chat se añade además al historial de la
+conversación en cuanto termina.
+
+Un trabajo pertenece al proceso que lo ejecuta. Mientras sigue vivo, el
+proceso renueva su marca de tiempo; si el proceso muere, pasados
+``TRABAJOS_ABANDONO`` segundos sin señales el trabajo aparece como
+interrumpido.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from estado_compartido import obtener_estado
+from generadores import generar_borrador
+from historial import obtener_almacen
+from limitador import EnCola
+from metricas import metricas
+from plantillas import secciones as secciones_registradas
+from respuestas_ia import generar_respuesta_ia_stream
+
+RUTA_TRABAJOS = os.environ.get("TRABAJOS_RUTA", os.path.join(".cache", "trabajos.sqlite3"))
+# Generaciones simultáneas en segundo plano por proceso
+HILOS_TRABAJOS = int(os.environ.get("TRABAJOS_HILOS", "4"))
+# Trabajos sin terminar que admite cada conversación
+MAX_POR_CONVERSACION = int(os.environ.get("TRABAJOS_MAX_CONVERSACION", "5"))
+# Cada cuánto se refresca el panel de trabajos mientras alguno sigue en curso
+INTERVALO_SONDEO = float(os.environ.get("TRABAJOS_INTERVALO_SONDEO", "1.5"))
+# Intervalo mínimo entre escrituras del texto parcial de un mismo trabajo
+INTERVALO_PARCIAL = 0.5
+ABANDONO_SEGUNDOS = float(os.environ.get("TRABAJOS_ABANDONO", "60"))
+# Los trabajos terminados se borran pasado este tiempo
+RETENCION_SEGUNDOS = float(os.environ.get("TRABAJOS_RETENCION", str(30 * 24 * 3600)))
+
+PENDIENTE, EN_CURSO, TERMINADO, FALLIDO, INTERRUMPIDO = "pendiente", "en_curso", "terminado", "fallido", "interrumpido"
+ACTIVOS = (PENDIENTE, EN_CURSO)
+
+Trabajo = namedtuple("Trabajo", [
+    "id", "conversacion", "tipo", "titulo", "estado", "parcial", "resultado", "error", "creado", "actualizado"
+])
+
+
+class TrabajosSaturados(Exception):
+    """La conversación ya tiene el máximo de trabajos sin terminar"""
+
+
+class AlmacenTrabajos:
+    """Trabajos de todas las conversaciones en SQLite, visibles desde cualquier proceso"""
+
+    def __init__(self, ruta=RUTA_TRABAJOS):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                conversacion TEXT NOT NULL,
+                tipo TEXT NOT NULL,
+                titulo TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                parcial TEXT NOT NULL DEFAULT '',
+                resultado TEXT,
+                error TEXT,
+                creado REAL NOT NULL,
+                actualizado REAL NOT NULL
+            )
+        """)
+        self._conexion.execute(
+            "CREATE INDEX IF NOT EXISTS trabajos_conversacion ON trabajos (conversacion, creado)"
+        )
+
+    def crear(self, trabajo):
+        with self._lock:
+            self._conexion.execute(
+                f"INSERT INTO trabajos ({', '.join(Trabajo._fields)}) VALUES ({', '.join('?' * len(Trabajo._fields))})",
+                trabajo
+            )
+            self._conexion.execute(
+                "DELETE FROM trabajos WHERE estado NOT IN (?, ?) AND actualizado < ?",
+                (*ACTIVOS, time.time() - RETENCION_SEGUNDOS)
+            )
+
+    def actualizar(self, identificador, **campos):
+        campos["actualizado"] = time.time()
+        with self._lock:
+            self._conexion.execute(
+                f"UPDATE trabajos SET {', '.join(f'{campo} = ?' for campo in campos)} WHERE id = ?",
+                (*campos.values(), identificador)
+            )
+
+    def latido(self, identificadores):
+        """Renueva la marca de tiempo de los trabajos que este proceso sigue ejecutando"""
+        if not identificadores:
+            return
+        with self._lock:
+            self._conexion.execute(
+                f"UPDATE trabajos SET actualizado = ? WHERE id IN ({','.join('?' * len(identificadores))})",
+                (time.time(), *identificadores)
+            )
+
+    def listar(self, conversacion, limite=20):
+        """Trabajos más recientes de la conversación; los abandonados se marcan como interrumpidos"""
+        ahora = time.time()
+        with self._lock:
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = ? WHERE conversacion = ? AND estado IN (?, ?) AND actualizado < ?",
+                (INTERRUMPIDO, conversacion, *ACTIVOS, ahora - ABANDONO_SEGUNDOS)
+            )
+            filas = self._conexion.execute(
+                f"SELECT {', '.join(Trabajo._fields)} FROM trabajos WHERE conversacion = ? "
+                "ORDER BY creado DESC LIMIT ?",
+                (conversacion, limite)
+            ).fetchall()
+        return [Trabajo(*fila) for fila in filas]
+
+
+class AlmacenTrabajosMemoria:
+    """Misma interfaz que ``AlmacenTrabajos`` en memoria del proceso (backend de estado ``proceso``)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trabajos = {}
+
+    def crear(self, trabajo):
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+            limite = time.time() - RETENCION_SEGUNDOS
+            for antiguo in [t.id for t in self._trabajos.values() if t.estado not in ACTIVOS and t.actualizado < limite]:
+                del self._trabajos[antiguo]
+
+    def actualizar(self, identificador, **campos):
+        with self._lock:
+            if identificador in self._trabajos:
+                self._trabajos[identificador] = self._trabajos[identificador]._replace(actualizado=time.time(), **campos)
+
+    def latido(self, identificadores):
+        ahora = time.time()
+        with self._lock:
+            for identificador in identificadores:
+                if identificador in self._trabajos:
+                    self._trabajos[identificador] = self._trabajos[identificador]._replace(actualizado=ahora)
+
+    def listar(self, conversacion, limite=20):
+        with self._lock:
+            trabajos = sorted(
+                (t for t in self._trabajos.values() if t.conversacion == conversacion),
+                key=lambda t: t.creado, reverse=True
+            )
+        return trabajos[:limite]
+
+
+class GestorTrabajos:
+    """Pool de hilos que ejecuta los trabajos y publica su avance en el almacén"""
+
+    def __init__(self, almacen, hilos=HILOS_TRABAJOS, max_por_conversacion=MAX_POR_CONVERSACION):
+        self.almacen = almacen
+        self.max_por_conversacion = max_por_conversacion
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="trabajo")
+        self._lock = threading.Lock()
+        self._activos = {}  # id -> conversación
+        threading.Thread(target=self._latir, name="trabajos-latido", daemon=True).start()
+
+    def _latir(self):
+        while True:
+            time.sleep(ABANDONO_SEGUNDOS / 4)
+            with self._lock:
+                identificadores = list(self._activos)
+            try:
+                self.almacen.latido(identificadores)
+            except Exception as e:
+                metricas.incrementar("errores_total", origen="trabajos_latido", tipo=type(e).__name__)
+
+    def enviar(self, conversacion, tipo, titulo, ejecutar):
+        """Encola ``ejecutar(avance)`` y devuelve el identificador del trabajo.
+
+        ``ejecutar`` publica el texto parcial llamando a ``avance(texto)`` y
+        devuelve el texto final. Lanza ``TrabajosSaturados`` si la conversación
+        ya tiene ``max_por_conversacion`` trabajos sin terminar."""
+        identificador = uuid.uuid4().hex[:12]
+        with self._lock:
+            if sum(1 for activa in self._activos.values() if activa == conversacion) >= self.max_por_conversacion:
+                metricas.incrementar("trabajos_rechazados_total", tipo=tipo)
+                raise TrabajosSaturados(
+                    f"Ya hay {self.max_por_conversacion} trabajos en curso en esta conversación"
+                )
+            self._activos[identificador] = conversacion
+            metricas.fijar("trabajos_activos", len(self._activos))
+        ahora = time.time()
+        self.almacen.crear(Trabajo(identificador, conversacion, tipo, titulo, PENDIENTE, "", None, None, ahora, ahora))
+        metricas.incrementar("trabajos_total", tipo=tipo)
+        self._pool.submit(self._ejecutar, identificador, tipo, ejecutar)
+        return identificador
+
+    def _ejecutar(self, identificador, tipo, ejecutar):
+        self.almacen.actualizar(identificador, estado=EN_CURSO)
+        ultima_escritura = 0.0
+
+        def avance(texto):
+            nonlocal ultima_escritura
+            # El texto parcial se escribe como mucho cada INTERVALO_PARCIAL segundos
+            if time.monotonic() - ultima_escritura >= INTERVALO_PARCIAL:
+                ultima_escritura = time.monotonic()
+                self.almacen.actualizar(identificador, parcial=texto)
+
+        try:
+            with metricas.cronometrar(f"trabajo_{tipo}"):
+                resultado = ejecutar(avance)
+            self.almacen.actualizar(identificador, estado=TERMINADO, resultado=resultado, parcial="")
+        except Exception as e:
+            metricas.incrementar("errores_total", origen="trabajo", tipo=type(e).__name__)
+            self.almacen.actualizar(identificador, estado=FALLIDO, error=f"{type(e).__name__}: {e}")
+        finally:
+            with self._lock:
+                self._activos.pop(identificador, None)
+                metricas.fijar("trabajos_activos", len(self._activos))
+
+    def listar(self, conversacion, limite=20):
+        return self.almacen.listar(conversacion, limite)
+
+    def en_curso(self):
+        """Trabajos de este proceso que aún no han terminado"""
+        with self._lock:
+            return len(self._activos)
+
+
+# Trabajos predefinidos: devuelven la función ``ejecutar(avance)`` que espera ``GestorTrabajos.enviar``
+def consulta_ia(conversacion, mensaje_usuario, contexto="", api_key=None, previos=None):
+    """Respuesta de la IA en streaming; al terminar se añade al historial de la conversación"""
+    almacen = obtener_almacen()
+    # Posición que tendrá la respuesta si no llegan otros mensajes mientras se genera
+    posicion = almacen.contar(conversacion)
+
+    def ejecutar(avance):
+        texto = ""
+        for fragmento in generar_respuesta_ia_stream(mensaje_usuario, contexto, api_key, previos, avisar_cola=True):
+            if isinstance(fragmento, EnCola):
+                avance(f"⏳ En la cola de la IA: posición {fragmento.posicion} (≈ {fragmento.segundos:.0f} s)")
+                continue
+            texto += fragmento
+            avance(texto)
+        respuesta = texto
+        if almacen.contar(conversacion) != posicion:
+            # Si entretanto se enviaron otras consultas, se indica a cuál responde
+            respuesta = f"> **Respuesta a:** {mensaje_usuario[:120]}\n\n{texto}"
+        almacen.anadir(conversacion, "assistant", respuesta)
+        return texto
+
+    return ejecutar
+
+
+def borrador(tema, contexto="", usar_ia=True, api_key=None, secciones=None):
+    """Borrador con todas las secciones; el texto parcial crece a medida que termina cada una"""
+    secciones = secciones or secciones_registradas()
+
+    def ejecutar(avance):
+        textos = {}
+        for seccion, texto, _ in generar_borrador(tema, contexto, secciones, usar_ia, api_key):
+            textos[seccion] = texto
+            avance("\n\n---\n\n".join(textos[s] for s in secciones if s in textos))
+        return "\n\n---\n\n".join(textos[s] for s in secciones)
+
+    return ejecutar
+
+
+_gestor = None
+_lock_gestor = threading.Lock()
+
+
+def obtener_gestor():
+    """Gestor de trabajos del proceso, con el almacén del backend de ``estado_compartido``"""
+    global _gestor
+    if _gestor is None:
+        with _lock_gestor:
+            if _gestor is None:
+                _gestor = GestorTrabajos(obtener_estado().almacen_trabajos())
+    return _gestor